@@ -177,7 +177,8 @@ async def start_services():
 
     print("   ▶ Starting Web Server initialization...")
     try:
-        app_runner = web.AppRunner(await web_server(), access_log=None)
+        # Cliente HTTP desconectou: o handler é cancelado na hora e leva junto o download do Telegram
+        app_runner = web.AppRunner(await web_server(), access_log=None, handler_cancellation=True)
         await app_runner.setup()
         bind_address = Var.BIND_ADDRESS
         site = web.TCPSite(app_runner, bind_address, Var.PORT)
@@ -8,9 +8,14 @@ from pyrogram.errors import FloodWait
 
 from Thunder.bot import StreamBot, multi_clients, work_loads
 from Thunder.utils.config_parser import TokenParser
+from Thunder.utils.database import db
 from Thunder.utils.logger import logger
+from Thunder.utils.media_session import warm_media_sessions
 from Thunder.vars import Var
 
+# Referência aos tasks de fundo (pré-aquecimento, manutenção): o loop só guarda referência fraca
+_tasks = set()
+
 async def cleanup_clients():
     for client in multi_clients.values():
         try:
@@ -22,9 +27,37 @@ async def cleanup_clients():
         except Exception as e:
             logger.error(f"Error stopping client: {e}", exc_info=True)
 
+async def get_warmup_dcs() -> list:
+    setting = Var.WARMUP_DCS
+    if not setting:
+        return []
+    if setting == "auto":
+        # DCs onde os arquivos já indexados realmente estão
+        return await db.get_indexed_dcs()
+    return sorted({int(dc) for dc in setting.split(",") if dc.strip().isdigit()})
+
+async def warm_up_client(client_id, client):
+    try:
+        dc_ids = await get_warmup_dcs()
+        if not dc_ids:
+            return
+        warmed = await warm_media_sessions(client, dc_ids)
+        logger.info(f"   🔥 Cliente {client_id}: sessões de mídia prontas nos DCs {warmed}")
+    except Exception as e:
+        logger.error(f"   ✖ Erro no pré-aquecimento do Cliente {client_id}: {e}")
+
+def schedule_warm_up(client_id, client):
+    # Em segundo plano: não atrasa o startup. Um espectador que chegar antes
+    # espera a mesma sessão (media_sessions_lock) em vez de criar outra.
+    if Var.WARMUP_DCS:
+        task = asyncio.create_task(warm_up_client(client_id, client), name=f"warmup_client_{client_id}")
+        _tasks.add(task)
+        task.add_done_callback(_tasks.discard)
+
 async def initialize_clients():
     multi_clients[0] = StreamBot
     work_loads[0] = 0
+    schedule_warm_up(0, StreamBot)
     try:
         all_tokens = TokenParser().parse_from_env()
         if not all_tokens:
@@ -88,6 +121,7 @@ async def initialize_clients():
         if res:
             cid, client = res
             multi_clients[cid] = client
+            schedule_warm_up(cid, client)
             if cid == 99:
                 logger.info("   💎 [MASTER] Conta de Usuário (Session) vinculada como Cliente 99!")
 
@@ -113,6 +147,7 @@ async def initialize_clients():
                         if res:
                             multi_clients[res[0]] = res[1]
                             logger.info(f"✅ Cliente {cid} está online agora!")
+                            schedule_warm_up(res[0], res[1])
                 
                 # 2. Health Check: Verifica se os bots ativos respondem
                 for cid, client in list(multi_clients.items()):
@@ -144,4 +179,6 @@ async def initialize_clients():
             
             await asyncio.sleep(60) # Verifica a cada 1 minuto
 
-    asyncio.create_task(maintenance_loop(), name="client_maintenance_task")
+    task = asyncio.create_task(maintenance_loop(), name="client_maintenance_task")
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
@@ -2,9 +2,15 @@
 
 from aiohttp import web
 from .stream_routes import routes
+from Thunder.utils.chunk_cache import chunk_cache
+
+
+async def load_caches(app: web.Application):
+    await chunk_cache.load()
 
 
 async def web_server():
     web_app = web.Application(client_max_size=50 * 1024 * 1024)
     web_app.add_routes(routes)
+    web_app.on_startup.append(load_caches)
     return web_app
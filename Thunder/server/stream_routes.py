@@ -1,10 +1,14 @@
 # Thunder/server/stream_routes.py
 
 import asyncio
+import ipaddress
 import re
 import secrets
 import time
-from urllib.parse import quote, unquote
+from contextlib import aclosing
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Optional
+from urllib.parse import quote, unquote, urljoin
 
 from aiohttp import web
 
@@ -12,26 +16,53 @@ from Thunder import __version__, StartTime
 from pyrogram.errors import FloodWait
 from Thunder.bot import StreamBot, multi_clients, work_loads
 from Thunder.server.exceptions import FileNotFound, InvalidHash
-from Thunder.utils.custom_dl import ByteStreamer
+from Thunder.utils.balancer import balancer
+from Thunder.utils.buffer_budget import buffer_budget
+from Thunder.utils.chunk_cache import chunk_cache
+from Thunder.utils.client_marks import (BLACKLISTED_CLIENTS, BLIND_CLIENT_SECONDS, BLIND_CLIENTS_CACHE,
+                                        client_eligible)
+from Thunder.utils.client_slots import ClientBusy, Flow, client_slots, current_flow
+from Thunder.utils.database import db
+from Thunder.utils.hls import build_playlist
+from Thunder.utils.custom_dl import (CHUNK_FETCHERS, FILE_ID_CACHE, ByteStreamer,
+                                     chunk_fetch_stats, exact_range_stats, file_id_stats,
+                                     hedge_stats, plan_exact_range)
 from Thunder.utils.logger import logger
+from Thunder.utils.media_session import media_session_stats
+from Thunder.utils.pinning import get_pin_stats, schedule_pin
+from Thunder.utils.read_ahead import (STRIPE_MIN_BYTES, ReadAhead, StreamLoad, StripedReader,
+                                      StripeFailed, get_read_ahead_stats, read_ahead)
+from Thunder.utils.read_cursor import ReadCursor, read_cursors
 from Thunder.utils.render_template import render_page
+from Thunder.utils.seek_index import (get_seek_index, get_seek_index_stats, keyframe_at,
+                                      schedule_seek_prefetch)
 from Thunder.utils.time_format import get_readable_time
+from Thunder.utils.ttl_cache import TTLCache
+from Thunder.vars import Var
 
 routes = web.RouteTableDef()
 
 SECURE_HASH_LENGTH = 6
 CHUNK_SIZE = 1024 * 1024
-MAX_CONCURRENT_PER_CLIENT = 100
-RANGE_REGEX = re.compile(r"bytes=(?P<start>\d*)-(?P<end>\d*)")
+RANGE_SPEC_REGEX = re.compile(r"^\s*(?P<start>\d*)\s*-\s*(?P<end>\d*)\s*$")
+# Mais partes que isso num único Range é ignorado (resposta 200 inteira)
+MAX_RANGE_PARTS = 32
 
 # Cache global de metadados para evitar FloodWait do Telegram no F5
-FILE_INFO_CACHE = {}
+FILE_INFO_CACHE = TTLCache(maxsize=50000, ttl=24 * 3600)
+# Futuros para evitar que múltiplas requests busquem o mesmo metadado ao mesmo tempo.
+# Depois de resolvido, o futuro fica 5s (resultado ou erro) antes de permitir nova busca.
+METADATA_FETCHERS = TTLCache(maxsize=10000, ttl=60)
 
-# Controle de bots que estão dando erro (ex: Message Not Found)
-BLACKLISTED_CLIENTS = {} # {client_id: expiration_timestamp}
-# Bots que estão "cegos" para IDs específicos (delay de propagação do Telegram)
-# Formato: {message_id: {client_id: expiration_timestamp}}
-BLIND_CLIENTS_CACHE = {} 
+
+# Escolhas em que o bot já alcançava o DC do arquivo x escolhas que exigiram sessão nova
+dc_routing_stats = {"affinity": 0, "cold": 0}
+
+hls_stats = {"playlists": 0, "unsupported": 0}
+
+# Entregas completas x clientes que saíram no meio (seek do player, aba fechada) e os bytes
+# baixados que nunca chegaram a eles: recortes de chunk, filas de read-ahead e o write interrompido
+delivery_stats = {"completed": 0, "disconnects": 0, "bytes_delivered": 0, "bytes_wasted": 0}
 
 PATTERN_HASH_FIRST = re.compile(
     rf"^([a-zA-Z0-9_-]{{{SECURE_HASH_LENGTH}}})(\d+)(?:/.*)?$")
@@ -42,7 +73,7 @@ CORS_HEADERS = {
     "Access-Control-Allow-Origin": "*",
     "Access-Control-Allow-Methods": "GET, HEAD, OPTIONS",
     "Access-Control-Allow-Headers": "Range, Content-Type, *",
-    "Access-Control-Expose-Headers": "Content-Length, Content-Range, Content-Disposition",
+    "Access-Control-Expose-Headers": "Content-Length, Content-Range, Content-Disposition, ETag, Last-Modified",
 }
 
 def get_streamer(client_id: int) -> ByteStreamer:
@@ -86,79 +117,362 @@ def parse_media_request(path: str, query: dict) -> tuple[int, str]:
     raise InvalidHash("Invalid URL structure or missing hash")
 
 
-def select_optimal_client(message_id: int = None) -> tuple[int, ByteStreamer]:
+def client_reaches_dc(cid: int, dc_id: int) -> bool:
+    """O cliente já fala com o DC do arquivo: é o DC da conta ou já há sessão de mídia autorizada lá."""
+    client = multi_clients.get(cid)
+    if client is None:
+        return False
+    if dc_id in getattr(client, 'media_sessions', {}):
+        return True
+    session = getattr(client, 'session', None)
+    return getattr(session, 'dc_id', None) == dc_id
+
+
+def client_name(cid: int) -> str:
+    client = multi_clients.get(cid)
+    return client.name if client is not None else str(cid)
+
+
+def client_score(cid: int) -> float:
+    client = multi_clients.get(cid)
+    if client is None:
+        return 0.0
+    return balancer.score(cid, client.name, work_loads.get(cid, 0))
+
+
+def select_optimal_client(message_id: int = None, dc_id: Optional[int] = None) -> tuple[int, ByteStreamer]:
     if not work_loads:
         raise web.HTTPInternalServerError(text="No clients.")
 
     current_time = time.time()
-    
-    # Dicionário de cegueira para este arquivo
-    blind_db = BLIND_CLIENTS_CACHE.get(message_id, {})
-
-    # Lista de todos os bots que não estão banidos e enxergam o arquivo
-    available_indices = []
-    for cid in sorted(work_loads.keys()):
-        # Pula se o bot estiver banido (FloodWait ou Erro Grave)
-        if cid in BLACKLISTED_CLIENTS and current_time < BLACKLISTED_CLIENTS[cid]:
-            continue
-        
-        # Pula se este bot estiver marcado como "cego" para este arquivo e ainda não expirou
-        if message_id and cid in blind_db and current_time < blind_db[cid]:
-            continue
-            
-        available_indices.append(cid)
+
+    # Lista de todos os bots que não estão banidos (erro grave ou FloodWait) e enxergam o arquivo
+    available_indices = [
+        cid for cid in sorted(work_loads.keys()) if client_eligible(cid, message_id, current_time)]
 
     if not available_indices:
-        # Se TUDO estiver banido ou cego, tentamos o que tiver menor carga (mesmo cego) 
+        # Se TUDO estiver banido ou cego, tentamos o de maior capacidade (mesmo cego)
         # para não travar totalmente e dar chance do propagation ter finalizado.
-        candidates = sorted(work_loads.keys(), key=lambda x: work_loads.get(x, 0))
+        candidates = sorted(work_loads.keys(), key=client_score, reverse=True)
         for cid in candidates:
             if cid in BLACKLISTED_CLIENTS and current_time < BLACKLISTED_CLIENTS[cid]:
                 continue
             return cid, get_streamer(cid)
         return 0, get_streamer(0)
 
-    # PRIORIDADE: Conta de Usuário (Session ID 99) é infinitamente mais estável.
-    if 99 in available_indices:
-        # Se for o Master, ele aguenta muito mais carga.
-        # Só passamos para os bots comuns se o Master estiver realmente sobrecarregado (ex: > 400 conexões)
-        if work_loads.get(99, 0) < 400:
-            return 99, get_streamer(99)
+    # Capacidade estimada: vazão/latência/erros medidos (EWMA) x peso configurado,
+    # dividida pelas conexões que o bot já atende.
+    scores = {cid: client_score(cid) for cid in available_indices}
+    best_id = max(available_indices, key=lambda x: scores[x])
+
+    # Vagas de download: primeiro quem tem vaga livre, depois quem ainda tem espaço na fila.
+    candidates = [cid for cid in available_indices if client_slots.free(client_name(cid)) > 0]
+    if not candidates:
+        candidates = [cid for cid in available_indices if not client_slots.saturated(client_name(cid))]
+    if not candidates:
+        client_slots.rejected += 1
+        logger.warning(f"🚦 Todos os bots saturados. Recusando ID {message_id} com 503.")
+        raise web.HTTPServiceUnavailable(
+            text="All clients are busy. Please retry shortly.",
+            headers={"Retry-After": str(client_slots.retry_after), **CORS_HEADERS})
+
+    client_id = max(candidates, key=lambda x: scores[x])
+    if client_id != best_id:
+        client_slots.spills += 1
+
+    # Afinidade de DC: um bot que já alcança o DC do arquivo evita Auth + exportAuthorization,
+    # desde que não esteja muito mais carregado que o escolhido.
+    if dc_id is not None and not client_reaches_dc(client_id, dc_id):
+        max_load = work_loads.get(client_id, 0) + Var.DC_AFFINITY_SLACK
+        warm = [cid for cid in candidates
+                if work_loads.get(cid, 0) <= max_load and client_reaches_dc(cid, dc_id)]
+        if warm:
+            client_id = max(warm, key=lambda x: scores[x])
+            dc_routing_stats["affinity"] += 1
+        else:
+            dc_routing_stats["cold"] += 1
+    elif dc_id is not None:
+        dc_routing_stats["affinity"] += 1
 
-    # RODÍZIO REAL: Escolhe o bot que tiver a MENOR carga no momento entre os disponíveis.
-    client_id = min(available_indices, key=lambda x: work_loads.get(x, 0))
     return client_id, get_streamer(client_id)
 
 
-def parse_range_header(range_header: str, file_size: int) -> tuple[int, int]:
-    if not range_header:
-        return 0, file_size - 1
+def select_stripe_clients(message_id: int, primary_cid: int, primary_streamer: ByteStreamer,
+                          dc_id: Optional[int] = None) -> list[tuple[int, ByteStreamer]]:
+    """Cliente da request + outros saudáveis (menor carga primeiro) para download em faixas."""
+    current_time = time.time()
+    others = [
+        cid for cid in work_loads
+        if cid != primary_cid and client_eligible(cid, message_id, current_time)
+        and not client_slots.saturated(client_name(cid))
+    ]
+    # Bots que já alcançam o DC do arquivo primeiro, depois maior capacidade estimada
+    others.sort(key=lambda x: (dc_id is not None and not client_reaches_dc(x, dc_id), -client_score(x)))
+    clients = [(primary_cid, primary_streamer)]
+    clients += [(cid, get_streamer(cid)) for cid in others[:max(0, Var.STRIPE_MAX_CLIENTS - 1)]]
+    return clients
+
+
+def select_hedge_client(message_id: int, primary_cid: int,
+                        dc_id: Optional[int] = None) -> Optional[ByteStreamer]:
+    """Segundo cliente para um chunk atrasado: saudável, enxerga o arquivo e tem vaga livre agora."""
+    current_time = time.time()
+    candidates = [
+        cid for cid in work_loads
+        if cid != primary_cid and client_eligible(cid, message_id, current_time)
+        and client_slots.free(client_name(cid)) > 0
+    ]
+    if not candidates:
+        return None
+    cid = max(candidates, key=lambda x: (dc_id is None or client_reaches_dc(x, dc_id), client_score(x)))
+    return get_streamer(cid)
+
+
+def mark_client_failure(cid: int, message_id: int, e: Exception) -> bool:
+    """Marca o bot como "cego" para o arquivo ou "banido" temporariamente. Retorna se foi No Media."""
+    is_no_media = "doesn't contain any downloadable media" in str(e)
+    if isinstance(e, ClientBusy):
+        # Fila cheia não é defeito do bot: só troca de cliente, sem banir.
+        logger.warning(f"🚦 Bot {cid} sem vaga para o ID {message_id}: {e}")
+    elif is_no_media:
+        blind_db = BLIND_CLIENTS_CACHE.get(message_id) or {}
+        blind_db[cid] = time.time() + BLIND_CLIENT_SECONDS
+        BLIND_CLIENTS_CACHE[message_id] = blind_db
+    else:
+        client = multi_clients.get(cid)
+        if client is not None:
+            balancer.record_error(client.name)
+        wait_time = getattr(e, 'value', 60)
+        logger.error(f"❌ Bot {cid} falhou: {e}. 'Esfriando' por {wait_time}s.")
+        BLACKLISTED_CLIENTS[cid] = time.time() + wait_time
+    return is_no_media
+
+
+def request_priority(request: web.Request) -> str:
+    """Classe de prioridade: o player do /watch (ou qualquer <video>/<audio>) passa na frente de downloads."""
+    if request.headers.get("Sec-Fetch-Dest", "") in ("video", "audio"):
+        return "stream"
+    if "/watch/" in request.headers.get("Referer", ""):
+        return "stream"
+    return "download"
+
+
+def parse_trusted_proxies(value: str) -> list:
+    networks = []
+    for item in value.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        try:
+            networks.append(ipaddress.ip_network(item, strict=False))
+        except ValueError:
+            logger.warning(f"TRUSTED_PROXIES: endereço inválido '{item}' ignorado.")
+    return networks
+
+
+TRUSTED_PROXIES = parse_trusted_proxies(Var.TRUSTED_PROXIES)
+
+
+def is_trusted_proxy(address: str) -> bool:
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in TRUSTED_PROXIES)
+
+
+def client_address(request: web.Request) -> str:
+    """Endereço do cliente. O X-Forwarded-For só vale vindo de um proxy em TRUSTED_PROXIES
+    (Heroku, Koyeb, Nginx); fora disso qualquer um forjaria o endereço de outro espectador.
+    """
+    address = request.remote or ""
+    if not is_trusted_proxy(address):
+        return address
+    # Da direita para a esquerda: o primeiro salto que não é proxy nosso é o cliente
+    for hop in reversed(request.headers.get("X-Forwarded-For", "").split(",")):
+        hop = hop.strip()
+        if not hop:
+            continue
+        address = hop
+        if not is_trusted_proxy(hop):
+            break
+    return address
+
 
-    match = RANGE_REGEX.match(range_header)
+def parse_http_date(value: str) -> Optional[float]:
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+def etag_matches(header: str, etag: str) -> bool:
+    """Comparação fraca do If-None-Match: W/"x" casa com "x"."""
+    if header.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in header.split(","))
+
+
+def is_not_modified(request: web.Request, etag: str, last_modified: Optional[int]) -> bool:
+    if_none_match = request.headers.get("If-None-Match")
+    if if_none_match is not None:
+        # Com If-None-Match presente, If-Modified-Since é ignorado (RFC 9110 13.2.2)
+        return etag_matches(if_none_match, etag)
+    if_modified_since = request.headers.get("If-Modified-Since")
+    if if_modified_since and last_modified is not None:
+        since = parse_http_date(if_modified_since)
+        return since is not None and last_modified <= since
+    return False
+
+
+def if_range_matches(request: web.Request, etag: str, last_modified: Optional[int]) -> bool:
+    """If-Range: o Range só vale se o validador ainda for o atual; senão entrega o arquivo inteiro."""
+    value = request.headers.get("If-Range")
+    if value is None:
+        return True
+    value = value.strip()
+    if value.startswith('"') or value.startswith("W/"):
+        # Comparação forte: ETag fraca nunca casa
+        return value == etag
+    if last_modified is None:
+        return False
+    since = parse_http_date(value)
+    return since is not None and int(since) == last_modified
+
+
+def parse_range_spec(spec: str, file_size: int) -> Optional[tuple[int, int]]:
+    """Um `a-b`, `a-` ou `-n`. None = fora do arquivo (não satisfazível)."""
+    match = RANGE_SPEC_REGEX.match(spec)
     if not match:
-        raise web.HTTPBadRequest(text=f"Invalid range header: {range_header}")
+        raise web.HTTPBadRequest(text=f"Invalid range: {spec}")
 
     start_str = match.group("start")
     end_str = match.group("end")
     if start_str:
         start = int(start_str)
-        end = int(end_str) if end_str else file_size - 1
+        end = min(int(end_str), file_size - 1) if end_str else file_size - 1
     else:
         if not end_str:
-            raise web.HTTPBadRequest(text=f"Invalid range header: {range_header}")
+            raise web.HTTPBadRequest(text=f"Invalid range: {spec}")
         suffix_len = int(end_str)
         if suffix_len <= 0:
-            raise web.HTTPRequestRangeNotSatisfiable(
-                headers={"Content-Range": f"bytes */{file_size}"})
+            return None
         start = max(file_size - suffix_len, 0)
         end = file_size - 1
 
-    if start < 0 or end >= file_size or start > end:
+    if start >= file_size or start > end:
+        return None
+    return start, end
+
+
+def coalesce_ranges(ranges: list[tuple[int, int]]) -> list[tuple[int, int]]:
+    """Ordena e junta ranges sobrepostos ou encostados (RFC 9110 14.6 permite)."""
+    merged: list[tuple[int, int]] = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def parse_ranges(range_header: str, file_size: int) -> list[tuple[int, int]]:
+    if not range_header:
+        return [(0, file_size - 1)]
+
+    unit, sep, specs = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or not sep:
+        raise web.HTTPBadRequest(text=f"Invalid range header: {range_header}")
+
+    ranges = [r for r in (parse_range_spec(spec, file_size) for spec in specs.split(",")) if r]
+    if not ranges:
         raise web.HTTPRequestRangeNotSatisfiable(
             headers={"Content-Range": f"bytes */{file_size}"}
         )
 
-    return start, end
+    ranges = coalesce_ranges(ranges)
+    if len(ranges) > MAX_RANGE_PARTS:
+        # Pedido fragmentado demais: a RFC permite ignorar o Range e mandar o arquivo inteiro.
+        return [(0, file_size - 1)]
+    return ranges
+
+
+def group_range_spans(ranges: list[tuple[int, int]]) -> list[list[tuple[int, int]]]:
+    """Agrupa partes no mesmo chunk ou em chunks vizinhos: cada grupo vira um único download."""
+    spans: list[list[tuple[int, int]]] = []
+    for start, end in ranges:
+        if spans and start // CHUNK_SIZE <= spans[-1][-1][1] // CHUNK_SIZE + 1:
+            spans[-1].append((start, end))
+        else:
+            spans.append([(start, end)])
+    return spans
+
+
+def multipart_part_header(boundary: str, mime_type: str, start: int, end: int, file_size: int) -> bytes:
+    return (
+        f"--{boundary}\r\n"
+        f"Content-Type: {mime_type}\r\n"
+        f"Content-Range: bytes {start}-{end}/{file_size}\r\n\r\n"
+    ).encode()
+
+
+async def multipart_body(ranges: list[tuple[int, int]], part_headers: list[bytes],
+                         closing: bytes, stream_range):
+    """Corpo multipart/byteranges: cada grupo de partes é baixado uma vez e recortado."""
+    index = 0
+    for span in group_range_spans(ranges):
+        last = index + len(span)
+        offset = span[0][0]
+        yield part_headers[index]
+        async with aclosing(stream_range(span[0][0], span[-1][1])) as span_data:
+            async for data in span_data:
+                data_end = offset + len(data)
+                while index < last:
+                    start, end = ranges[index]
+                    lo, hi = max(start, offset), min(end + 1, data_end)
+                    if lo < hi:
+                        yield data[lo - offset:hi - offset]
+                    if end + 1 > data_end:
+                        break
+                    yield b"\r\n"
+                    index += 1
+                    if index < last:
+                        yield part_headers[index]
+                offset = data_end
+    yield closing
+
+
+async def send_stream(request: web.Request, body, status: int, headers: dict) -> web.StreamResponse:
+    """Escreve o corpo direto no socket: cada write() espera o drain do transporte (backpressure)
+    e os memoryviews vão para o kernel sem cópia em Python."""
+    response = web.StreamResponse(status=status, headers=headers)
+    sent = pending = 0
+    try:
+        await response.prepare(request)
+        async for data in body:
+            pending = len(data)
+            await response.write(data)
+            sent += pending
+            pending = 0
+        await response.write_eof()
+        delivery_stats["completed"] += 1
+    except (ConnectionResetError, asyncio.CancelledError) as e:
+        # Cliente saiu: o cancelamento do handler (ou o write falho) derruba já o download do Telegram
+        delivery_stats["disconnects"] += 1
+        delivery_stats["bytes_wasted"] += pending
+        logger.debug(f"Cliente desconectou durante a entrega de {request.path} ({sent} bytes entregues)")
+        if isinstance(e, asyncio.CancelledError):
+            raise
+    except Exception as e:
+        # Cabeçalhos já enviados: não dá mais para responder 500, só encerrar a conexão
+        error_id = secrets.token_hex(6)
+        logger.error(f"Stream error {error_id}: {e}", exc_info=True)
+        if request.transport is not None:
+            request.transport.close()
+    finally:
+        await body.aclose()
+        delivery_stats["bytes_delivered"] += sent
+    return response
 
 
 @routes.get("/", allow_head=True)
@@ -172,6 +486,13 @@ async def status_endpoint(request):
     total_load = sum(work_loads.values())
 
     workload_distribution = {str(k): v for k, v in sorted(work_loads.items())}
+    client_health = {
+        str(cid): {
+            **balancer.client_stats(cid, client.name, work_loads.get(cid, 0)),
+            **client_slots.client_stats(client.name)
+        }
+        for cid, client in sorted(multi_clients.items())
+    }
 
     return web.json_response(
         {
@@ -186,7 +507,49 @@ async def status_endpoint(request):
             },
             "resources": {
                 "total_workload": total_load,
-                "workload_distribution": workload_distribution
+                "workload_distribution": workload_distribution,
+                "client_health": client_health
+            },
+            "cache": chunk_cache.stats(),
+            "chunk_fetches": {
+                "in_flight": len(CHUNK_FETCHERS),
+                **chunk_fetch_stats
+            },
+            "pinning": get_pin_stats(),
+            "seek_index": get_seek_index_stats(),
+            "hls": {
+                "segment_seconds": Var.HLS_SEGMENT_SECONDS,
+                **hls_stats
+            },
+            "read_ahead": get_read_ahead_stats(),
+            "read_cursors": read_cursors.stats(),
+            "delivery": {
+                **delivery_stats,
+                "wasted_mb": round(delivery_stats["bytes_wasted"] / (1024 * 1024), 1)
+            },
+            "buffer_budget": buffer_budget.stats(),
+            "exact_ranges": {
+                "max_kb": Var.EXACT_RANGE_MAX_KB,
+                **exact_range_stats
+            },
+            "hedging": {
+                "percentile": Var.HEDGE_PERCENTILE,
+                **hedge_stats
+            },
+            "media_sessions": media_session_stats,
+            "client_slots": client_slots.stats(),
+            "dc_routing": {
+                "slack": Var.DC_AFFINITY_SLACK,
+                **dc_routing_stats
+            },
+            "file_ids": {
+                **FILE_ID_CACHE.stats(),
+                **file_id_stats
+            },
+            "metadata": {
+                "file_info": FILE_INFO_CACHE.stats(),
+                "fetchers": METADATA_FETCHERS.stats(),
+                "blind_clients": BLIND_CLIENTS_CACHE.stats()
             }
         },
         headers={"Access-Control-Allow-Origin": "*"}
@@ -243,78 +606,178 @@ async def media_preview(request: web.Request):
         logger.error(f"Preview error {error_id}: {e}", exc_info=True)
         raise web.HTTPInternalServerError(
             text=f"Server error occurred: {error_id}") from e
-# Cache global de metadados para evitar FloodWait do Telegram no F5
-FILE_INFO_CACHE = {}
-# Futuros para evitar que múltiplas requests busquem o mesmo metadado ao mesmo tempo
-METADATA_FETCHERS = {}
-
-# ... (parse_media_request e select_optimal_client permanecem iguais)
-
-async def fetch_file_info(message_id: int, streamer: ByteStreamer):
+async def fetch_file_info(message_id: int, streamer: Optional[ByteStreamer] = None):
     """Busca informações do arquivo de forma segura e compartilhada."""
-    if message_id in FILE_INFO_CACHE:
-        return FILE_INFO_CACHE[message_id]
+    file_info = FILE_INFO_CACHE.get(message_id)
+    if file_info is not None:
+        return file_info
     
     # Se já tem alguém buscando, espera o resultado
-    if message_id in METADATA_FETCHERS:
-        fetcher = METADATA_FETCHERS[message_id]
-        if isinstance(fetcher, asyncio.Future):
-            return await fetcher
+    fetcher = METADATA_FETCHERS.get(message_id)
+    if fetcher is None:
+        # A busca roda num task próprio: se quem pediu primeiro desconectar, quem está
+        # esperando o mesmo ID não fica sem resposta
+        fetcher = asyncio.create_task(_load_file_info(message_id, streamer))
+        METADATA_FETCHERS[message_id] = fetcher
+        fetcher.add_done_callback(lambda task: _metadata_done(message_id, task))
+    elif not isinstance(fetcher, asyncio.Future):
         return fetcher # Já é o resultado se não for Future
+    return await asyncio.shield(fetcher)
+
+
+def _metadata_done(message_id: int, task: asyncio.Task) -> None:
+    if not task.cancelled():
+        task.exception()  # todos que esperavam podem ter desconectado
+    # Mantém o resultado por mais 5s para permitir re-tentativas se falhou
+    # (o sucesso já fica no FILE_INFO_CACHE). Expira sozinho, sem task de limpeza.
+    METADATA_FETCHERS.set(message_id, task, ttl=5)
+
+
+async def _load_file_info(message_id: int, streamer: Optional[ByteStreamer]):
+    # Índice persistente gravado na geração do link: dispensa o Telegram
+    file_info = await db.get_file_info(message_id)
+    if file_info and file_info.get('unique_id'):
+        FILE_INFO_CACHE[message_id] = file_info
+        return file_info
+
+    file_info = None
+    # Prioridade 1: Conta MASTER (99) - Vê tudo instantaneamente
+    # Prioridade 2: Bot Principal (0)
+    source_ids = [99, 0]
     
-    # Cria uma "promessa"
-    loop = asyncio.get_running_loop()
-    future = loop.create_future()
-    METADATA_FETCHERS[message_id] = future
+    for sid in source_ids:
+        if sid in multi_clients:
+            try:
+                s_name = "MASTER" if sid == 99 else "BOT 0"
+                logger.debug(f"🔍 Buscando metadados via {s_name} (ID {sid})...")
+                st = get_streamer(sid)
+                file_info = await asyncio.wait_for(st.get_file_info(message_id), timeout=10.0)
+                if file_info and file_info.get('unique_id'):
+                    break
+            except Exception:
+                continue
     
+    # Último recurso: tenta no bot que a request veio (se não for nenhum dos acima)
+    if not file_info:
+        try:
+            if streamer is None:
+                streamer = select_optimal_client(message_id)[1]
+            file_info = await asyncio.wait_for(streamer.get_file_info(message_id), timeout=8.0)
+        except Exception as fe:
+            logger.error(f"❌ Falha total metadados ID {message_id}: {fe}")
+    
+    if file_info and file_info.get('unique_id'):
+        FILE_INFO_CACHE[message_id] = file_info
+        # Links antigos (anteriores ao índice) entram nele no primeiro acesso
+        await db.save_file_info(file_info)
+        return file_info
+    else:
+        raise FileNotFound("Metadados não encontrados.")
+
+
+@routes.get(r"/seek/{path:.+}")
+async def seek_index_endpoint(request: web.Request):
+    """Índice de keyframes do MP4/MKV. Com `?t=<segundos>`, devolve o keyframe do seek e já o baixa."""
     try:
-        file_info = None
-        # Prioridade 1: Conta MASTER (99) - Vê tudo instantaneamente
-        # Prioridade 2: Bot Principal (0)
-        source_ids = [99, 0]
-        
-        for sid in source_ids:
-            if sid in multi_clients:
-                try:
-                    s_name = "MASTER" if sid == 99 else "BOT 0"
-                    logger.debug(f"🔍 Buscando metadados via {s_name} (ID {sid})...")
-                    st = get_streamer(sid)
-                    file_info = await asyncio.wait_for(st.get_file_info(message_id), timeout=10.0)
-                    if file_info and file_info.get('unique_id'):
-                        break
-                except Exception:
-                    continue
-        
-        # Último recurso: tenta no bot que a request veio (se não for nenhum dos acima)
-        if not file_info:
-            try:
-                file_info = await asyncio.wait_for(streamer.get_file_info(message_id), timeout=8.0)
-            except Exception as fe:
-                logger.error(f"❌ Falha total metadados ID {message_id}: {fe}")
-        
-        if file_info and file_info.get('unique_id'):
-            FILE_INFO_CACHE[message_id] = file_info
-            if not future.done():
-                future.set_result(file_info)
-            return file_info
+        path = request.match_info["path"]
+        message_id, _ = parse_media_request(path, request.query)
+        try:
+            file_info = await fetch_file_info(message_id)
+        except Exception as e:
+            raise FileNotFound(f"ID {message_id} indisponível no momento.") from e
+
+        client_id, streamer = select_optimal_client(message_id, file_info.get('dc_id'))
+        work_loads[client_id] += 1
+        try:
+            index = await get_seek_index(file_info, streamer)
+        finally:
+            work_loads[client_id] -= 1
+
+        body = {
+            "container": index.get("container"),
+            "duration": index.get("duration"),
+            "file_size": file_info.get("file_size"),
+        }
+        target = request.query.get("t")
+        if target is None:
+            body["keyframes"] = index.get("keyframes") or []
         else:
-            err = FileNotFound("Metadados não encontrados.")
-            if not future.done():
-                future.set_exception(err)
-            raise err
-            
+            try:
+                seconds = float(target)
+            except ValueError:
+                raise web.HTTPBadRequest(text="Invalid seek time")
+            found = keyframe_at(index, seconds)
+            if found is not None:
+                keyframe, following = found
+                offset = int(keyframe[1])
+                next_offset = int(following[1]) if following else index.get("media_end", file_info["file_size"])
+                body["target"] = {"time": keyframe[0], "offset": offset, "next_offset": next_offset}
+                # Só o começo do GOP (até SEEK_PREFETCH_MB): GOP longo ou Cues esparsas não viram download inteiro
+                schedule_seek_prefetch(
+                    streamer, message_id, file_info["unique_id"], offset,
+                    min(file_info["file_size"], next_offset), client_address(request))
+            else:
+                body["target"] = None
+
+        return web.json_response(body, headers={
+            "Cache-Control": "no-cache" if target is not None else Var.MEDIA_CACHE_CONTROL,
+            **CORS_HEADERS
+        })
+
+    except (InvalidHash, FileNotFound) as e:
+        logger.debug(f"Client error in seek index: {type(e).__name__} - {e}")
+        raise web.HTTPNotFound(text="Resource not found") from e
+    except web.HTTPException:
+        raise
     except Exception as e:
-        if not future.done():
-            future.set_exception(e)
+        error_id = secrets.token_hex(6)
+        logger.error(f"Seek index error {error_id}: {e}", exc_info=True)
+        raise web.HTTPInternalServerError(
+            text=f"Server error occurred: {error_id}") from e
+
+
+@routes.get(r"/hls/{path:.+}", allow_head=True)
+async def hls_playlist(request: web.Request):
+    """Playlist HLS com byte ranges do próprio arquivo. Só MP4 fragmentado: HLS exige segmentos fMP4/TS."""
+    try:
+        path = request.match_info["path"]
+        message_id, secure_hash = parse_media_request(path, request.query)
+        try:
+            file_info = await fetch_file_info(message_id)
+        except Exception as e:
+            raise FileNotFound(f"ID {message_id} indisponível no momento.") from e
+
+        client_id, streamer = select_optimal_client(message_id, file_info.get('dc_id'))
+        work_loads[client_id] += 1
+        try:
+            index = await get_seek_index(file_info, streamer)
+        finally:
+            work_loads[client_id] -= 1
+
+        if not (index.get("fragmented") and index.get("keyframes")):
+            hls_stats["unsupported"] += 1
+            raise web.HTTPUnsupportedMediaType(
+                text="HLS byte-range playlists need a fragmented MP4; use the progressive URL.",
+                headers=CORS_HEADERS)
+
+        file_name = file_info.get('file_name') or f"file_{message_id}"
+        media_url = urljoin(Var.URL, f"{secure_hash}{message_id}/{quote(file_name)}")
+        hls_stats["playlists"] += 1
+        return web.Response(
+            text=build_playlist(index, media_url, file_info["file_size"]),
+            content_type="application/vnd.apple.mpegurl",
+            headers={"Cache-Control": Var.MEDIA_CACHE_CONTROL, **CORS_HEADERS})
+
+    except (InvalidHash, FileNotFound) as e:
+        logger.debug(f"Client error in HLS playlist: {type(e).__name__} - {e}")
+        raise web.HTTPNotFound(text="Resource not found") from e
+    except web.HTTPException:
         raise
-    finally:
-        # Remove do dicionário de fetchers após um tempo para permitir re-tentativas se falhou
-        # mas mantém no cache se deu certo.
-        async def delayed_cleanup():
-            await asyncio.sleep(5)
-            METADATA_FETCHERS.pop(message_id, None)
-        
-        asyncio.create_task(delayed_cleanup())
+    except Exception as e:
+        error_id = secrets.token_hex(6)
+        logger.error(f"HLS playlist error {error_id}: {e}", exc_info=True)
+        raise web.HTTPInternalServerError(
+            text=f"Server error occurred: {error_id}") from e
 
 
 @routes.get(r"/{path:.+}", allow_head=True)
@@ -323,12 +786,9 @@ async def media_delivery(request: web.Request):
         path = request.match_info["path"]
         message_id, secure_hash = parse_media_request(path, request.query)
         
-        # Seleciona o melhor bot levando em conta a carga e se o bot enxerga o arquivo
-        client_id, streamer = select_optimal_client(message_id)
-
         # Busca metadados de forma inteligente (evita o "choque" de 30 users ao mesmo tempo)
         try:
-            file_info = await fetch_file_info(message_id, streamer)
+            file_info = await fetch_file_info(message_id)
         except Exception as e:
             logger.error(f"⚠️ Erro ao obter info do arquivo {message_id}: {e}")
             raise FileNotFound(f"ID {message_id} indisponível no momento.")
@@ -336,6 +796,28 @@ async def media_delivery(request: web.Request):
         if not file_info or not file_info.get('unique_id'):
             raise FileNotFound("ID único do arquivo não encontrado.")
 
+        # Validadores: o conteúdo de um file_unique_id nunca muda. A revalidação (304) só
+        # precisa dos metadados: responde antes de escolher bot, mesmo com todos saturados.
+        etag = f'"{file_info["unique_id"]}"'
+        last_modified = file_info.get('date')
+        cache_headers = {"Cache-Control": Var.MEDIA_CACHE_CONTROL, "ETag": etag}
+        if last_modified:
+            cache_headers["Last-Modified"] = formatdate(last_modified, usegmt=True)
+
+        if is_not_modified(request, etag, last_modified):
+            return web.Response(
+                status=304,
+                headers={**cache_headers, "Accept-Ranges": "bytes", **CORS_HEADERS})
+
+        # Seleciona o melhor bot levando em conta a carga, se o bot enxerga o arquivo e o DC dele
+        file_dc = file_info.get('dc_id')
+
+        client_id, streamer = select_optimal_client(message_id, file_dc)
+
+        # Leitura deste cliente ainda estacionada (player que abortou o range anterior): só passa
+        # para o bot dela se o cursor de fato servir a posição pedida (read_cursors.take)
+        cursor_key = (file_info['unique_id'], client_address(request)) if read_cursors.enabled else None
+
         work_loads[client_id] += 1
         logger.info(f"▶ [Bot {client_id}] Conexão iniciada. Carga: {work_loads[client_id]}")
 
@@ -346,10 +828,15 @@ async def media_delivery(request: web.Request):
                     "File size is reported as zero or unavailable.")
 
             range_header = request.headers.get("Range", "")
-            start, end = parse_range_header(range_header, file_size)
-            content_length = end - start + 1
+            if range_header and not if_range_matches(request, etag, last_modified):
+                range_header = ""
+            ranges = parse_ranges(range_header, file_size)
+            start, end = ranges[0][0], ranges[-1][1]
+            multipart = len(ranges) > 1
+            # `bytes=N-` de player: costuma ser abortado e retomado logo adiante (cursor de leitura)
+            open_ended = not multipart and range_header.strip().endswith("-")
 
-            if start == 0 and end == file_size - 1:
+            if not multipart and start == 0 and end == file_size - 1:
                 range_header = ""
 
             mime_type = (
@@ -362,19 +849,29 @@ async def media_delivery(request: web.Request):
                 ext = ext_map.get(ext, ext)
                 filename = f"file_{secrets.token_hex(4)}.{ext}"
 
+            if multipart:
+                boundary = secrets.token_hex(16)
+                part_headers = [
+                    multipart_part_header(boundary, mime_type, a, b, file_size) for a, b in ranges]
+                closing = f"--{boundary}--\r\n".encode()
+                content_length = sum(
+                    len(h) + (b - a + 1) + 2 for h, (a, b) in zip(part_headers, ranges)) + len(closing)
+                content_type = f"multipart/byteranges; boundary={boundary}"
+            else:
+                content_length = end - start + 1
+                content_type = mime_type
+
             headers = {
-                "Content-Type": mime_type,
+                "Content-Type": content_type,
                 "Content-Length": str(content_length),
                 "Accept-Ranges": "bytes",
                 "Content-Disposition": f'inline; filename="{quote(filename)}"',
-                "Cache-Control": "no-cache, no-store, must-revalidate",
-                "Pragma": "no-cache",
-                "Expires": "0",
+                **cache_headers,
                 "X-Content-Type-Options": "nosniff",
                 **CORS_HEADERS
             }
 
-            if range_header:
+            if range_header and not multipart:
                 headers["Content-Range"] = f"bytes {start}-{end}/{file_size}"
 
             if request.method == 'HEAD':
@@ -384,110 +881,197 @@ async def media_delivery(request: web.Request):
                     headers=headers
                 )
 
-            async def stream_generator():
-                nonlocal client_id, streamer
-                current_cid = client_id
-                current_streamer = streamer
-                
-                # Armazenamos o bot original para decrementar a carga no final
-                # Mas se trocarmos de bot, precisamos gerenciar isso com cuidado.
-                active_cids = [current_cid]
-                
-                try:
-                    bytes_sent = 0
-                    while bytes_sent < content_length:
+            # Primeira visualização (ou link anterior ao pinning): fixa início e fim do arquivo.
+            # Só em GET: HEAD de verificadores de link continua respondido sem tocar no Telegram.
+            schedule_pin(file_info, streamer)
+
+            # Orçamento global de buffer no teto: a stream nova espera a vez junto com os fetchers
+            if not await buffer_budget.admit(Var.CLIENT_QUEUE_TIMEOUT):
+                logger.warning(f"🧱 Orçamento de buffer esgotado. Recusando ID {message_id} com 503.")
+                raise web.HTTPServiceUnavailable(
+                    text="Server buffers are full. Please retry shortly.",
+                    headers={"Retry-After": str(client_slots.retry_after), **CORS_HEADERS})
+
+            current_cid = client_id
+            current_streamer = streamer
+            priority = request_priority(request)
+
+            # Carga dos bots usados nesta request (o original e os de fallback). Sai da conta
+            # enquanto o buffer está cheio esperando um cliente HTTP lento.
+            load = StreamLoad(current_cid)
+
+            async def stream_range(start: int, end: int):
+                nonlocal current_cid, current_streamer
+                content_length = end - start + 1
+
+                # Downloads grandes são divididos em faixas entre vários bots. O range aberto de
+                # player fica num bot só: o cursor que sobrevive ao abort só carrega o read-ahead.
+                striped = (STRIPE_MIN_BYTES > 0 and content_length >= STRIPE_MIN_BYTES
+                           and not (cursor_key and open_ended))
+
+                # Pedaços parciais de chunk (início/fim do range) são buscados no tamanho exato
+                exact = True
+
+                bytes_sent = 0
+                while bytes_sent < content_length:
+                    try:
+                        position = start + bytes_sent
+
+                        # Os chunks inteiros param antes de um fim parcial que vai pelo caminho exato
+                        stop = end + 1
+                        tail_start = stop - stop % CHUNK_SIZE
+                        if exact and tail_start > position and plan_exact_range(tail_start, stop, file_info['unique_id']):
+                            stop = tail_start
+
+                        # Continua o download de uma request anterior deste cliente, se ela parou aqui.
+                        # Compara com o mesmo fim recortado que o cursor recebeu ao ser criado.
+                        cursor = read_cursors.take(cursor_key, position, stop - 1) if cursor_key else None
+
+                        piece = plan_exact_range(position, end + 1, file_info['unique_id']) if exact and cursor is None else 0
+                        if piece:
+                            data = await current_streamer.fetch_range(message_id, position, piece)
+                            if data:
+                                yield data
+                                bytes_sent += len(data)
+                                continue
+                            exact = False
+                            stop = end + 1
+                        target = stop - start
+
+                        bytes_to_skip = position % CHUNK_SIZE
+
+                        stripe_clients = []
+                        if striped and cursor is None:
+                            stripe_clients = select_stripe_clients(message_id, current_cid, current_streamer, file_dc)
+
+                        if cursor is not None:
+                            if cursor.cid != current_cid:
+                                load.swap(current_cid, cursor.cid)
+                                current_cid, current_streamer = cursor.cid, cursor.streamer
+                            cursor.reader.load = load
+                            reader = cursor
+                        elif len(stripe_clients) > 1:
+                            reader = StripedReader(
+                                message_id, file_info['unique_id'],
+                                position // CHUNK_SIZE, (stop - 1) // CHUNK_SIZE,
+                                stripe_clients,
+                                on_error=lambda cid, err: mark_client_failure(cid, message_id, err),
+                                load=load)
+                        else:
+                            # Read-ahead: o Telegram continua baixando enquanto o cliente consome o socket
+                            reader = read_ahead(current_streamer.stream_file(
+                                message_id, offset=position, limit=stop - position,
+                                unique_id=file_info['unique_id'],
+                                hedge=lambda: select_hedge_client(message_id, current_cid, file_dc)), load)
+                            if cursor_key and isinstance(reader, ReadAhead):
+                                reader = ReadCursor(reader, position // CHUNK_SIZE, (stop - 1) // CHUNK_SIZE,
+                                                    current_cid, current_streamer)
                         try:
-                            bytes_to_skip = (start + bytes_sent) % CHUNK_SIZE
-                            
-                            async for chunk in current_streamer.stream_file(
-                                    message_id, offset=start + bytes_sent, limit=content_length - bytes_sent):
-                                
+                            if cursor is not None:
+                                await cursor.seek(position // CHUNK_SIZE)
+                            async for chunk in reader:
+
+                                # Recortes por memoryview: o chunk de 1 MiB nunca é copiado
+                                chunk = memoryview(chunk)
+
                                 # Ajuste de skip para o primeiro chunk de cada nova conexão/bot
                                 if bytes_to_skip > 0:
                                     if len(chunk) <= bytes_to_skip:
                                         bytes_to_skip -= len(chunk)
+                                        delivery_stats["bytes_wasted"] += len(chunk)
                                         continue
+                                    delivery_stats["bytes_wasted"] += bytes_to_skip
                                     chunk = chunk[bytes_to_skip:]
                                     bytes_to_skip = 0
 
-                                remaining = content_length - bytes_sent
+                                remaining = target - bytes_sent
                                 if len(chunk) > remaining:
+                                    delivery_stats["bytes_wasted"] += len(chunk) - remaining
                                     chunk = chunk[:remaining]
 
                                 if chunk:
                                     yield chunk
                                     bytes_sent += len(chunk)
 
-                                if bytes_sent >= content_length:
+                                if bytes_sent >= target:
                                     break
-                            
-                            # Se saiu do loop e terminou, encerramos o while
+                        finally:
+                            if isinstance(reader, ReadCursor) and reader.resumable:
+                                # O download segue por alguns segundos esperando a próxima request deste cliente
+                                read_cursors.park(cursor_key, reader)
+                            else:
+                                await reader.aclose()
+                                delivery_stats["bytes_wasted"] += getattr(reader, "unread", 0)
+
+                        # Arquivo acabou antes do esperado: encerramos o while
+                        if bytes_sent < target:
                             break
 
-                        except Exception as e:
-                            err_str = str(e)
-                            is_no_media = "doesn't contain any downloadable media" in err_str
+                    except StripeFailed as e:
+                        # Os bots envolvidos já foram marcados; segue só com o bot atual.
+                        logger.warning(f"🔄 Download em faixas do ID {message_id} falhou ({e}). Seguindo sem faixas...")
+                        striped = False
+
+                    except Exception as e:
+                        is_no_media = mark_client_failure(current_cid, message_id, e)
+
+                        if is_no_media:
+                            logger.warning(f"🔄 Bot {current_cid} não viu ID {message_id}. Aguardando propagação...")
+                            await asyncio.sleep(3.5) # Espera um pouco mais
+                        
+                        # Tenta buscar um novo bot
+                        try:
+                            next_id, next_streamer = select_optimal_client(message_id, file_dc)
+                            if next_id == current_cid:
+                                # Se o bot selecionado for o mesmo, significa que não há outros 
+                                # disponíveis ou o Bot 0 é a única opção restante.
+                                if is_no_media:
+                                    # Se o bot deu "No Media", tentamos a conta MASTER (99) ou o Bot 0
+                                    # que costumam enxergar o arquivo mais rápido.
+                                    last_hope_cid = 99 if 99 in multi_clients and current_cid != 99 else 0
+                                    if current_cid != last_hope_cid:
+                                        next_id = last_hope_cid
+                                        next_streamer = get_streamer(last_hope_cid)
+                                    else:
+                                        raise e
+                                else:
+                                    # Se já é o Bot 0 ou não tem mais nada, raise o erro original
+                                    raise e
                             
-                            if is_no_media:
-                                logger.warning(f"🔄 Bot {current_cid} não viu ID {message_id}. Aguardando propagação...")
-                                await asyncio.sleep(3.5) # Espera um pouco mais
+                            logger.warning(f"🔄 Fallback: Trocando do Bot {current_cid} para Bot {next_id}...")
                             
-                            # Marca o bot atual como "cego" ou "banido"
-                            if is_no_media:
-                                if message_id not in BLIND_CLIENTS_CACHE:
-                                    BLIND_CLIENTS_CACHE[message_id] = {}
-                                BLIND_CLIENTS_CACHE[message_id][current_cid] = time.time() + 45
-                            else:
-                                wait_time = getattr(e, 'value', 60)
-                                logger.error(f"❌ Bot {current_cid} falhou: {e}. 'Esfriando' por {wait_time}s.")
-                                BLACKLISTED_CLIENTS[current_cid] = time.time() + wait_time
+                            # A carga da request passa do bot que falhou para o novo
+                            load.swap(current_cid, next_id)
                             
-                            # Tenta buscar um novo bot
-                            try:
-                                next_id, next_streamer = select_optimal_client(message_id)
-                                if next_id == current_cid:
-                                    # Se o bot selecionado for o mesmo, significa que não há outros 
-                                    # disponíveis ou o Bot 0 é a única opção restante.
-                                    if is_no_media:
-                                        # Se o bot deu "No Media", tentamos a conta MASTER (99) ou o Bot 0
-                                        # que costumam enxergar o arquivo mais rápido.
-                                        last_hope_cid = 99 if 99 in multi_clients and current_cid != 99 else 0
-                                        if current_cid != last_hope_cid:
-                                            next_id = last_hope_cid
-                                            next_streamer = get_streamer(last_hope_cid)
-                                        else:
-                                            raise e
-                                    else:
-                                        # Se já é o Bot 0 ou não tem mais nada, raise o erro original
-                                        raise e
-                                
-                                logger.warning(f"🔄 Fallback: Trocando do Bot {current_cid} para Bot {next_id}...")
-                                
-                                # Gerencia carga: decrementa do antigo, incrementa no novo
-                                work_loads[next_id] += 1
-                                active_cids.append(next_id)
-                                
-                                current_cid = next_id
-                                current_streamer = next_streamer
-                                # O loop `while` recomeça a partir do `bytes_sent` atual com o novo bot
-                                
-                            except Exception as fe:
-                                logger.error(f"🚨 Sem bots disponíveis para fallback: {fe}")
-                                raise e # Levanta o erro original que causou a falha do bot anterior
+                            current_cid = next_id
+                            current_streamer = next_streamer
+                            # O loop `while` recomeça a partir do `bytes_sent` atual com o novo bot
+                            
+                        except Exception as fe:
+                            logger.error(f"🚨 Sem bots disponíveis para fallback: {fe}")
+                            raise e # Levanta o erro original que causou a falha do bot anterior
+
 
+            async def stream_generator():
+                # Identifica a stream para a fila justa das vagas de download (herdado pelas tasks filhas)
+                current_flow.set(Flow(priority))
+                try:
+                    # aclosing: cliente saiu, o send_stream fecha este gerador e o fechamento desce
+                    # na hora até o read-ahead (cursor estacionado, orçamento e carga devolvidos),
+                    # sem esperar o coletor de lixo finalizar os geradores internos
+                    if multipart:
+                        parts = multipart_body(ranges, part_headers, closing, stream_range)
+                    else:
+                        parts = stream_range(start, end)
+                    async with aclosing(parts):
+                        async for data in parts:
+                            yield data
                 finally:
-                    # Decrementa a carga de todos os bots que foram usados nesta request
-                    for cid in active_cids:
-                        if cid in work_loads:
-                            work_loads[cid] -= 1
+                    current_flow.set(None)
 
-            return web.Response(
-                status=206 if range_header else 200,
-                body=stream_generator(),
-                headers=headers
-            )
+            body = stream_generator()
 
-        except (FileNotFound, InvalidHash):
+        except (FileNotFound, InvalidHash, web.HTTPException, asyncio.CancelledError):
             work_loads[client_id] -= 1
             raise
         except Exception as e:
@@ -499,9 +1083,17 @@ async def media_delivery(request: web.Request):
             raise web.HTTPInternalServerError(
                 text=f"Server error during streaming: {error_id}") from e
 
+        try:
+            return await send_stream(request, body, 206 if range_header else 200, headers)
+        finally:
+            # Decrementa a carga do bot que ficou com a request
+            load.release()
+
     except (InvalidHash, FileNotFound) as e:
         logger.debug(f"Client error: {type(e).__name__} - {e}", exc_info=True)
         raise web.HTTPNotFound(text="Resource not found") from e
+    except web.HTTPException:
+        raise
     except Exception as e:
         error_id = secrets.token_hex(6)
         logger.error(f"Server error {error_id}: {e}", exc_info=True)
@@ -0,0 +1,145 @@
+# Thunder/utils/balancer.py
+
+import time
+from collections import deque
+from typing import Deque, Dict, Optional
+
+from Thunder.utils.logger import logger
+from Thunder.vars import Var
+
+CHUNK_SIZE = 1024 * 1024
+EWMA_ALPHA = 0.2
+# Abaixo disso a amostra mede latência, não vazão (probes de poucos KiB).
+THROUGHPUT_MIN_BYTES = CHUNK_SIZE // 4
+# Sem medições ainda: 1 MiB/s e 300 ms até os primeiros chunks chegarem.
+DEFAULT_THROUGHPUT = float(CHUNK_SIZE)
+DEFAULT_LATENCY = 0.3
+
+# Janela de tempos de chunk por cliente para o percentil do hedge.
+CHUNK_TIME_WINDOW = 200
+HEDGE_MIN_SAMPLES = 20
+HEDGE_MIN_DELAY = 0.2
+
+
+def parse_client_weights(value: str) -> Dict[int, float]:
+    """"99:4,1:0.5" -> {99: 4.0, 1: 0.5}. Clientes não listados pesam 1."""
+    weights = {}
+    for item in value.split(","):
+        if not item.strip():
+            continue
+        try:
+            cid, weight = item.split(":", 1)
+            weights[int(cid)] = max(0.0, float(weight))
+        except ValueError:
+            logger.warning(f"⚠️ CLIENT_WEIGHTS: entrada inválida ignorada: {item!r}")
+    return weights
+
+
+class ClientHealth:
+    __slots__ = ('throughput', 'latency', 'error_rate', 'fetches', 'errors', 'updated', 'chunk_times',
+                 'flood_until')
+
+    def __init__(self) -> None:
+        self.throughput: Optional[float] = None  # bytes/s vindos do Telegram
+        self.latency: Optional[float] = None     # segundos até o primeiro byte de um GetFile
+        self.error_rate = 0.0
+        self.fetches = 0
+        self.errors = 0
+        self.updated = 0.0
+        self.chunk_times: Deque[float] = deque(maxlen=CHUNK_TIME_WINDOW)
+        self.flood_until = 0.0                   # FloodWait do Telegram: parado até este instante
+
+
+def _ewma(current: Optional[float], sample: float) -> float:
+    return sample if current is None else current + EWMA_ALPHA * (sample - current)
+
+
+class Balancer:
+    """Estima a capacidade restante de cada cliente a partir de vazão, latência e erros (EWMA)."""
+
+    def __init__(self, weights: Dict[int, float]) -> None:
+        self.weights = weights
+        self.health: Dict[str, ClientHealth] = {}
+
+    def _health(self, name: str) -> ClientHealth:
+        health = self.health.get(name)
+        if health is None:
+            health = self.health[name] = ClientHealth()
+        return health
+
+    def record_fetch(self, name: str, nbytes: int, elapsed: float) -> None:
+        health = self._health(name)
+        elapsed = max(elapsed, 1e-6)
+        if nbytes >= THROUGHPUT_MIN_BYTES:
+            health.throughput = _ewma(health.throughput, nbytes / elapsed)
+            health.chunk_times.append(elapsed)
+        # Latência = tempo que sobra depois de descontar a transferência em si.
+        transfer = nbytes / health.throughput if health.throughput else 0.0
+        health.latency = _ewma(health.latency, max(0.0, elapsed - transfer))
+        health.error_rate = _ewma(health.error_rate, 0.0)
+        health.fetches += 1
+        health.updated = time.time()
+
+    def record_error(self, name: str) -> None:
+        health = self._health(name)
+        health.error_rate = _ewma(health.error_rate, 1.0)
+        health.errors += 1
+        health.updated = time.time()
+
+    def record_flood(self, name: str, seconds: float) -> None:
+        """FloodWait: conta como erro e tira o cliente da seleção até o Telegram liberar."""
+        self.record_error(name)
+        health = self._health(name)
+        health.flood_until = max(health.flood_until, time.time() + seconds)
+
+    def flooded(self, name: str) -> bool:
+        health = self.health.get(name)
+        return health is not None and time.time() < health.flood_until
+
+    def record_abandoned(self, name: str, elapsed: float) -> None:
+        """Fetch cancelado pelo hedge: só sabemos que levaria pelo menos `elapsed`."""
+        self._health(name).chunk_times.append(elapsed)
+
+    def chunk_time_percentile(self, name: str, percentile: float) -> Optional[float]:
+        health = self.health.get(name)
+        if health is None or len(health.chunk_times) < HEDGE_MIN_SAMPLES:
+            return None
+        times = sorted(health.chunk_times)
+        return times[min(len(times) - 1, int(len(times) * percentile / 100))]
+
+    def hedge_delay(self, name: str) -> Optional[float]:
+        """Quanto esperar por um chunk antes de pedir o mesmo a outro cliente. None = sem hedge."""
+        if Var.HEDGE_PERCENTILE <= 0:
+            return None
+        delay = self.chunk_time_percentile(name, Var.HEDGE_PERCENTILE)
+        return None if delay is None else max(HEDGE_MIN_DELAY, delay)
+
+    def weight(self, cid: int) -> float:
+        return self.weights.get(cid, 1.0)
+
+    def score(self, cid: int, name: str, load: int) -> float:
+        """Chunks/s que uma nova stream deve receber deste cliente, dividindo com as `load` atuais."""
+        health = self.health.get(name)
+        throughput = health.throughput if health and health.throughput else DEFAULT_THROUGHPUT
+        latency = health.latency if health and health.latency is not None else DEFAULT_LATENCY
+        error_rate = health.error_rate if health else 0.0
+        chunk_time = latency + CHUNK_SIZE / throughput
+        return self.weight(cid) * (1.0 - error_rate) / (chunk_time * (load + 1))
+
+    def client_stats(self, cid: int, name: str, load: int) -> dict:
+        health = self.health.get(name) or ClientHealth()
+        hedge_delay = self.hedge_delay(name)
+        return {
+            "weight": self.weight(cid),
+            "throughput_mbps": round(health.throughput * 8 / 1_000_000, 2) if health.throughput else None,
+            "latency_ms": round(health.latency * 1000) if health.latency is not None else None,
+            "error_rate": round(health.error_rate, 3),
+            "fetches": health.fetches,
+            "errors": health.errors,
+            "score": round(self.score(cid, name, load), 3),
+            "hedge_after_ms": round(hedge_delay * 1000) if hedge_delay is not None else None,
+            "flood_wait_s": max(0, round(health.flood_until - time.time())),
+        }
+
+
+balancer = Balancer(parse_client_weights(Var.CLIENT_WEIGHTS))
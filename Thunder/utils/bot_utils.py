@@ -11,11 +11,12 @@ from pyrogram.types import (InlineKeyboardButton, InlineKeyboardMarkup,
                             Message, User)
 
 from Thunder.utils.database import db
-from Thunder.utils.file_properties import get_fname, get_fsize, get_hash
+from Thunder.utils.file_properties import get_file_info, get_fname, get_fsize, get_hash
 from Thunder.utils.human_readable import humanbytes
 from Thunder.utils.logger import logger
 from Thunder.utils.messages import (MSG_BUTTON_GET_HELP, MSG_DC_UNKNOWN,
                                     MSG_DC_USER_INFO, MSG_NEW_USER)
+from Thunder.utils.pinning import schedule_pin
 from Thunder.vars import Var
 
 
@@ -87,6 +88,12 @@ async def gen_links(fwd_msg: Message, shortener: bool = True) -> Dict[str, str]:
     f_hash = get_hash(fwd_msg)
     slink = f"{base_url}/watch/{f_hash}{fid}/{enc_fname}"
     olink = f"{base_url}/{f_hash}{fid}/{enc_fname}"
+
+    # Indexa os metadados já agora: o primeiro clique não precisa consultar o Telegram
+    file_info = get_file_info(fwd_msg)
+    await db.save_file_info(file_info)
+    # Início e fim do arquivo já em memória antes do primeiro play
+    schedule_pin(file_info)
     
     # Shortening removed for performance
     pass
@@ -0,0 +1,111 @@
+# Thunder/utils/buffer_budget.py
+
+import asyncio
+import time
+from collections import deque
+from typing import Callable, Deque, List, Optional
+
+from Thunder.vars import Var
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class BufferBudget:
+    """Teto global de bytes baixados do Telegram e ainda não entregues ao cliente HTTP.
+
+    Cada chunk puxado à frente (read-ahead, faixas) reserva CHUNK_SIZE antes do download e
+    devolve quando o writer passa para o próximo. No teto, os fetchers esperam na fila (FIFO)
+    e streams novas aguardam vaga antes de começar, em vez de o processo crescer até o OOM.
+    """
+
+    def __init__(self, limit: int) -> None:
+        self.limit = limit
+        self.enabled = limit > 0
+        self.used = 0
+        self.peak = 0
+        self.waiters: Deque[List] = deque()
+        # Chamado quando alguém entra na fila: quem guarda buffer só por conveniência devolve
+        self.on_pressure: Optional[Callable[[], None]] = None
+
+        self.waits = 0
+        self.wait_time = 0.0
+        self.rejected = 0
+
+    def _room(self, nbytes: int) -> bool:
+        # Um chunk sempre passa com o buffer vazio, mesmo com teto menor que ele
+        return self.used + nbytes <= self.limit or self.used == 0
+
+    def _take(self, nbytes: int) -> None:
+        self.used += nbytes
+        if self.used > self.peak:
+            self.peak = self.used
+
+    async def acquire(self, nbytes: int = CHUNK_SIZE) -> None:
+        if not self.enabled:
+            return
+        if not self.waiters and self._room(nbytes):
+            self._take(nbytes)
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        entry = [nbytes, future]
+        self.waiters.append(entry)
+        if self.on_pressure is not None:
+            self.on_pressure()
+        started = time.monotonic()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Os bytes chegaram junto com o cancelamento: devolve
+                self.release(nbytes)
+            else:
+                try:
+                    self.waiters.remove(entry)
+                except ValueError:
+                    pass
+                self._wake()
+            raise
+        self.waits += 1
+        self.wait_time += time.monotonic() - started
+
+    def release(self, nbytes: int = CHUNK_SIZE) -> None:
+        if not self.enabled or nbytes <= 0:
+            return
+        self.used = max(0, self.used - nbytes)
+        self._wake()
+
+    def _wake(self) -> None:
+        while self.waiters and self._room(self.waiters[0][0]):
+            nbytes, future = self.waiters.popleft()
+            if future.done():
+                continue
+            self._take(nbytes)
+            future.set_result(None)
+
+    async def admit(self, timeout: float) -> bool:
+        """Stream nova: espera (na mesma fila dos fetchers) até caber um chunk. False = esgotou o tempo."""
+        if not self.enabled:
+            return True
+        try:
+            await asyncio.wait_for(self.acquire(CHUNK_SIZE), timeout=timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            return False
+        self.release(CHUNK_SIZE)
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "limit_mb": self.limit // CHUNK_SIZE,
+            "used_mb": round(self.used / CHUNK_SIZE, 1),
+            "peak_mb": round(self.peak / CHUNK_SIZE, 1),
+            "waiting": len(self.waiters),
+            "waits": self.waits,
+            "avg_wait_ms": round(self.wait_time / self.waits * 1000) if self.waits else 0,
+            "rejected": self.rejected,
+        }
+
+
+buffer_budget = BufferBudget(Var.BUFFER_BUDGET_MB * CHUNK_SIZE)
@@ -0,0 +1,465 @@
+# Thunder/utils/chunk_cache.py
+
+import asyncio
+import os
+import re
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
+
+from Thunder.utils.logger import logger
+from Thunder.vars import Var
+
+CHUNK_SIZE = 1024 * 1024
+CHUNK_SUFFIX = ".chunk"
+VALID_UNIQUE_ID = re.compile(r'^[a-zA-Z0-9_-]+$')
+CHUNK_FILE = re.compile(r'^(\d+)\.chunk(\.tmp)?$')
+
+ChunkKey = Tuple[str, int]
+
+
+class ForeignCacheContent(Exception):
+    """O diretório do cache em disco tem arquivos que o cache não escreveu."""
+
+
+class MemoryChunkCache:
+    """Chunks quentes em RAM sob um orçamento fixo de bytes, com despejo LRU."""
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self.enabled = max_bytes > 0
+        self.entries: "OrderedDict[ChunkKey, bytes]" = OrderedDict()
+        self.total_bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __contains__(self, key: ChunkKey) -> bool:
+        return key in self.entries
+
+    def get(self, unique_id: str, index: int) -> Optional[bytes]:
+        if not self.enabled:
+            return None
+        key = (unique_id, index)
+        data = self.entries.get(key)
+        if data is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return data
+
+    def put(self, unique_id: str, index: int, data: bytes) -> None:
+        if not self.enabled or not data or len(data) > self.max_bytes:
+            return
+        key = (unique_id, index)
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.total_bytes -= len(old)
+        self.entries[key] = data
+        self.total_bytes += len(data)
+        while self.total_bytes > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.total_bytes -= len(evicted)
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "chunks": len(self.entries),
+            "used_mb": round(self.total_bytes / CHUNK_SIZE, 1),
+            "budget_mb": self.max_bytes // CHUNK_SIZE,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+        }
+
+
+class PinnedChunkCache:
+    """Chunks do início e do fim de arquivos recém-linkados ou recém-vistos, fora do LRU comum.
+
+    Os players leem o cabeçalho do container e o `moov` no fim do MP4 antes do primeiro frame;
+    esses chunks ficam aqui até o arquivo inteiro sair por ordem de uso (LRU por arquivo).
+    """
+
+    def __init__(self, max_bytes: int, head_chunks: int, tail_chunks: int) -> None:
+        self.max_bytes = max_bytes
+        self.head_chunks = max(0, head_chunks)
+        self.tail_chunks = max(0, tail_chunks)
+        self.enabled = max_bytes > 0 and (self.head_chunks + self.tail_chunks) > 0
+        # unique_id -> {índice: bytes}; a ordem é a do último uso do arquivo
+        self.files: "OrderedDict[str, Dict[int, bytes]]" = OrderedDict()
+        self.wanted: Dict[str, Set[int]] = {}
+        self.total_bytes = 0
+
+        self.hits = 0
+        self.pinned_files = 0
+        self.evictions = 0
+
+    def indexes(self, file_size: int) -> List[int]:
+        """Chunks a fixar: os `head_chunks` primeiros e os `tail_chunks` últimos."""
+        total = -(-file_size // CHUNK_SIZE)
+        head = list(range(min(self.head_chunks, total)))
+        tail = list(range(max(len(head), total - self.tail_chunks), total))
+        return head + tail
+
+    def pin(self, unique_id: str, file_size: int) -> List[int]:
+        """Marca o arquivo como fixado (ou renova o uso). Retorna os índices ainda sem dados."""
+        if not self.enabled or file_size <= 0:
+            return []
+        if unique_id not in self.files:
+            self.files[unique_id] = {}
+            self.wanted[unique_id] = set(self.indexes(file_size))
+            self.pinned_files += 1
+        self.files.move_to_end(unique_id)
+        stored = self.files[unique_id]
+        return sorted(i for i in self.wanted[unique_id] if i not in stored)
+
+    def __contains__(self, key: ChunkKey) -> bool:
+        chunks = self.files.get(key[0])
+        return chunks is not None and key[1] in chunks
+
+    def get(self, unique_id: str, index: int) -> Optional[bytes]:
+        chunks = self.files.get(unique_id)
+        if not chunks:
+            return None
+        data = chunks.get(index)
+        if data is not None:
+            self.files.move_to_end(unique_id)
+            self.hits += 1
+        return data
+
+    def put(self, unique_id: str, index: int, data: bytes) -> bool:
+        """Guarda o chunk se ele pertence a um arquivo fixado. Retorna se guardou."""
+        chunks = self.files.get(unique_id)
+        if chunks is None or index not in self.wanted[unique_id] or not data:
+            return False
+        old = chunks.get(index)
+        if old is not None:
+            self.total_bytes -= len(old)
+        chunks[index] = data
+        self.total_bytes += len(data)
+        self._evict(unique_id)
+        return True
+
+    def _evict(self, keep: str) -> None:
+        while self.total_bytes > self.max_bytes and len(self.files) > 1:
+            unique_id = next(iter(self.files))
+            if unique_id == keep:
+                self.files.move_to_end(unique_id)
+                continue
+            chunks = self.files.pop(unique_id)
+            self.wanted.pop(unique_id, None)
+            self.total_bytes -= sum(len(data) for data in chunks.values())
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "head_chunks": self.head_chunks,
+            "tail_chunks": self.tail_chunks,
+            "files": len(self.files),
+            "chunks": sum(len(chunks) for chunks in self.files.values()),
+            "used_mb": round(self.total_bytes / CHUNK_SIZE, 1),
+            "budget_mb": self.max_bytes // CHUNK_SIZE,
+            "hits": self.hits,
+            "pinned_files": self.pinned_files,
+            "evictions": self.evictions,
+        }
+
+
+class DiskChunkCache:
+    """Cache persistente de chunks de 1 MiB em disco, indexado por (file_unique_id, índice)."""
+
+    def __init__(self, path: str, max_bytes: int, policy: str = "lru") -> None:
+        self.path = path
+        self.max_bytes = max_bytes
+        self.policy = policy if policy in ("lru", "lfu") else "lru"
+        self.enabled = bool(path) and max_bytes > 0
+
+        # Ordem de inserção = ordem de uso (LRU). Valor = tamanho em bytes.
+        self.entries: "OrderedDict[ChunkKey, int]" = OrderedDict()
+        self.frequency: Dict[ChunkKey, int] = {}
+        # LFU: chaves agrupadas por frequência, cada grupo na ordem do último uso. A vítima sai
+        # do grupo de menor frequência em O(1), sem varrer o índice inteiro a cada despejo.
+        self._buckets: Dict[int, "OrderedDict[ChunkKey, None]"] = {}
+        self._min_frequency = 0
+        self.total_bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.write_errors = 0
+
+        self._pending: Set[ChunkKey] = set()
+        self._tasks: Set[asyncio.Task] = set()
+
+    def _chunk_path(self, unique_id: str, index: int) -> str:
+        return os.path.join(self.path, unique_id[:2], unique_id, f"{index}{CHUNK_SUFFIX}")
+
+    def _scan(self) -> list:
+        """Lê o layout `<prefixo>/<unique_id>/<índice>.chunk` escrito por _chunk_path.
+
+        Qualquer outra coisa no diretório (código, outro app, DISK_CACHE_DIR=. por engano) aborta
+        a leitura antes de apagar qualquer arquivo: só restos `.chunk.tmp` do próprio cache são removidos.
+        """
+        found, leftovers = [], []
+        with os.scandir(self.path) as prefixes:
+            for prefix in prefixes:
+                if not (prefix.is_dir(follow_symlinks=False) and len(prefix.name) == 2
+                        and VALID_UNIQUE_ID.match(prefix.name)):
+                    raise ForeignCacheContent(prefix.path)
+                with os.scandir(prefix.path) as unique_dirs:
+                    for unique_dir in unique_dirs:
+                        unique_id = unique_dir.name
+                        if not (unique_dir.is_dir(follow_symlinks=False) and unique_id[:2] == prefix.name
+                                and VALID_UNIQUE_ID.match(unique_id)):
+                            raise ForeignCacheContent(unique_dir.path)
+                        with os.scandir(unique_dir.path) as chunks:
+                            for entry in chunks:
+                                match = CHUNK_FILE.match(entry.name)
+                                if not (match and entry.is_file(follow_symlinks=False)):
+                                    raise ForeignCacheContent(entry.path)
+                                if match.group(2):
+                                    # Resto de escrita interrompida
+                                    leftovers.append(entry.path)
+                                    continue
+                                stat = entry.stat(follow_symlinks=False)
+                                found.append((stat.st_mtime, (unique_id, int(match.group(1))), stat.st_size))
+
+        for path in leftovers:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        found.sort()
+        return found
+
+    async def load(self) -> None:
+        """Reconstrói o índice a partir do que já está em disco (mais antigos primeiro)."""
+        if not self.enabled:
+            return
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            found = await asyncio.to_thread(self._scan)
+        except ForeignCacheContent as e:
+            # Não inicia: um DISK_CACHE_DIR compartilhado seria apagado aos poucos pelos despejos
+            raise ForeignCacheContent(
+                f"DISK_CACHE_DIR={self.path} contém arquivos que não são do cache ({e}). "
+                f"Use um diretório dedicado a ele.") from None
+        except Exception as e:
+            logger.error(f"Erro ao carregar cache em disco de {self.path}: {e}", exc_info=True)
+            self.enabled = False
+            return
+
+        for _, key, size in found:
+            self.entries[key] = size
+            self.total_bytes += size
+            self._bucket_add(key, 0)
+        self._evict()
+        logger.info(
+            f"💾 Cache em disco: {len(self.entries)} chunks "
+            f"({self.total_bytes // CHUNK_SIZE} MiB de {self.max_bytes // CHUNK_SIZE} MiB, {self.policy.upper()})")
+
+    def __contains__(self, key: ChunkKey) -> bool:
+        return key in self.entries
+
+    def _bucket_add(self, key: ChunkKey, frequency: int) -> None:
+        if self.policy != "lfu":
+            return
+        self._buckets.setdefault(frequency, OrderedDict())[key] = None
+        if frequency < self._min_frequency or len(self._buckets) == 1:
+            self._min_frequency = frequency
+
+    def _bucket_remove(self, key: ChunkKey, frequency: int) -> None:
+        if self.policy != "lfu":
+            return
+        bucket = self._buckets.get(frequency)
+        if bucket is None or key not in bucket:
+            return
+        del bucket[key]
+        if not bucket:
+            del self._buckets[frequency]
+            if frequency == self._min_frequency and self._buckets:
+                # Raro (o grupo mínimo esvaziou num despejo): poucas frequências distintas
+                self._min_frequency = min(self._buckets)
+
+    def _touch(self, key: ChunkKey) -> None:
+        self.entries.move_to_end(key)
+        frequency = self.frequency.get(key, 0)
+        self.frequency[key] = frequency + 1
+        if self.policy != "lfu":
+            return
+        bucket = self._buckets.get(frequency)
+        if bucket is not None and key in bucket:
+            del bucket[key]
+            if not bucket:
+                del self._buckets[frequency]
+                if frequency == self._min_frequency:
+                    # A chave sobe um nível: o novo mínimo é o grupo para onde ela vai
+                    self._min_frequency = frequency + 1
+        self._bucket_add(key, frequency + 1)
+
+    async def get(self, unique_id: str, index: int) -> Optional[bytes]:
+        if not self.enabled:
+            return None
+        key = (unique_id, index)
+        if key not in self.entries:
+            self.misses += 1
+            return None
+
+        try:
+            data = await asyncio.to_thread(self._read, self._chunk_path(unique_id, index))
+        except OSError:
+            # Arquivo sumiu por fora (limpeza manual, disco cheio...). Esquece a entrada.
+            self._forget(key)
+            self.misses += 1
+            return None
+
+        self._touch(key)
+        self.hits += 1
+        return data
+
+    @staticmethod
+    def _read(path: str) -> bytes:
+        with open(path, "rb") as f:
+            return f.read()
+
+    def put(self, unique_id: str, index: int, data: bytes) -> None:
+        """Agenda a gravação do chunk em segundo plano (não bloqueia o streaming)."""
+        if not self.enabled or not data or not VALID_UNIQUE_ID.match(unique_id):
+            return
+        key = (unique_id, index)
+        if key in self.entries or key in self._pending:
+            return
+        self._pending.add(key)
+        task = asyncio.create_task(self._write(key, data))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _write(self, key: ChunkKey, data: bytes) -> None:
+        try:
+            await asyncio.to_thread(self._write_file, self._chunk_path(*key), data)
+        except OSError as e:
+            self.write_errors += 1
+            logger.debug(f"Falha ao gravar chunk {key} no cache em disco: {e}")
+            return
+        finally:
+            self._pending.discard(key)
+
+        self.entries[key] = len(data)
+        self.total_bytes += len(data)
+        self._touch(key)
+        self._evict()
+
+    @staticmethod
+    def _write_file(path: str, data: bytes) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def _victim(self) -> ChunkKey:
+        if self.policy == "lfu" and self._buckets:
+            # Empate na frequência: o menos recente (primeiro do grupo) sai.
+            return next(iter(self._buckets[self._min_frequency]))
+        return next(iter(self.entries))
+
+    def _forget(self, key: ChunkKey) -> Optional[str]:
+        size = self.entries.pop(key, None)
+        frequency = self.frequency.pop(key, 0)
+        if size is None:
+            return None
+        self._bucket_remove(key, frequency)
+        self.total_bytes -= size
+        return self._chunk_path(*key)
+
+    def _evict(self) -> None:
+        paths = []
+        while self.entries and self.total_bytes > self.max_bytes:
+            path = self._forget(self._victim())
+            if path:
+                paths.append(path)
+                self.evictions += 1
+        if paths:
+            task = asyncio.create_task(asyncio.to_thread(self._remove_files, paths))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    @staticmethod
+    def _remove_files(paths: list) -> None:
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            try:
+                # Remove a pasta do arquivo se ficou vazia
+                os.rmdir(os.path.dirname(path))
+            except OSError:
+                pass
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "policy": self.policy,
+            "chunks": len(self.entries),
+            "used_mb": round(self.total_bytes / CHUNK_SIZE, 1),
+            "budget_mb": self.max_bytes // CHUNK_SIZE,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "write_errors": self.write_errors,
+        }
+
+
+class ChunkCache:
+    """Fixados e RAM na frente do disco: hits do disco são promovidos para a memória."""
+
+    def __init__(self, memory: MemoryChunkCache, pinned: PinnedChunkCache, disk: DiskChunkCache) -> None:
+        self.memory = memory
+        self.pinned = pinned
+        self.disk = disk
+
+    async def load(self) -> None:
+        await self.disk.load()
+
+    def __contains__(self, key: ChunkKey) -> bool:
+        return key in self.pinned or key in self.memory or key in self.disk
+
+    async def get(self, unique_id: str, index: int) -> Optional[bytes]:
+        data = self.pinned.get(unique_id, index)
+        if data is not None:
+            return data
+        data = self.memory.get(unique_id, index)
+        if data is not None:
+            # Arquivo fixado depois que o chunk entrou no LRU: passa a valer o fixado
+            self.pinned.put(unique_id, index, data)
+            return data
+        data = await self.disk.get(unique_id, index)
+        if data is not None and not self.pinned.put(unique_id, index, data):
+            self.memory.put(unique_id, index, data)
+        return data
+
+    def put(self, unique_id: str, index: int, data: bytes) -> None:
+        # Chunk fixado não ocupa também o LRU de memória
+        if not self.pinned.put(unique_id, index, data):
+            self.memory.put(unique_id, index, data)
+        self.disk.put(unique_id, index, data)
+
+    def stats(self) -> dict:
+        return {
+            "memory": self.memory.stats(),
+            "pinned": self.pinned.stats(),
+            "disk": self.disk.stats(),
+        }
+
+
+memory_cache = MemoryChunkCache(Var.CHUNK_CACHE_MB * CHUNK_SIZE)
+disk_cache = DiskChunkCache(
+    Var.DISK_CACHE_DIR, Var.DISK_CACHE_MB * CHUNK_SIZE, Var.DISK_CACHE_POLICY)
+pinned_cache = PinnedChunkCache(Var.PIN_CACHE_MB * CHUNK_SIZE, Var.PIN_HEAD_MB, Var.PIN_TAIL_MB)
+chunk_cache = ChunkCache(memory_cache, pinned_cache, disk_cache)
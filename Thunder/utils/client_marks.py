@@ -0,0 +1,38 @@
+# Thunder/utils/client_marks.py
+
+import time
+from typing import Optional
+
+from Thunder.bot import multi_clients
+from Thunder.utils.balancer import balancer
+from Thunder.utils.ttl_cache import TTLCache
+
+BLIND_CLIENT_SECONDS = 45
+
+# Controle de bots que estão dando erro (ex: Message Not Found)
+BLACKLISTED_CLIENTS = {} # {client_id: expiration_timestamp}
+# Bots que estão "cegos" para IDs específicos (delay de propagação do Telegram)
+# Formato: {message_id: {client_id: expiration_timestamp}}
+BLIND_CLIENTS_CACHE = TTLCache(maxsize=10000, ttl=BLIND_CLIENT_SECONDS)
+
+
+def client_eligible(cid: int, message_id: Optional[int] = None,
+                    current_time: Optional[float] = None) -> bool:
+    """Bot que pode receber trabalho do arquivo: não banido, fora de FloodWait e não cego para ele.
+
+    Mesmo filtro para requests, faixas, hedge e o preenchimento dos chunks fixados.
+    """
+    client = multi_clients.get(cid)
+    if client is None:
+        return False
+    if current_time is None:
+        current_time = time.time()
+    if cid in BLACKLISTED_CLIENTS and current_time < BLACKLISTED_CLIENTS[cid]:
+        return False
+    if balancer.flooded(client.name):
+        return False
+    if message_id:
+        blind_db = BLIND_CLIENTS_CACHE.get(message_id) or {}
+        if cid in blind_db and current_time < blind_db[cid]:
+            return False
+    return True
@@ -0,0 +1,221 @@
+# Thunder/utils/client_slots.py
+
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from Thunder.utils.logger import logger
+from Thunder.vars import Var
+
+DEFAULT_CLASS = "download"
+
+
+def parse_priority_classes(value: str) -> Dict[str, float]:
+    """"stream:4,download:1" -> {"stream": 4.0, "download": 1.0}."""
+    weights = {}
+    for item in value.split(","):
+        if not item.strip():
+            continue
+        try:
+            name, weight = item.split(":", 1)
+            weights[name.strip().lower()] = max(0.01, float(weight))
+        except ValueError:
+            logger.warning(f"⚠️ PRIORITY_CLASSES: entrada inválida ignorada: {item!r}")
+    weights.setdefault(DEFAULT_CLASS, 1.0)
+    return weights
+
+
+PRIORITY_WEIGHTS = parse_priority_classes(Var.PRIORITY_CLASSES)
+
+
+class Flow:
+    """Uma stream HTTP disputando as vagas de download. Peso vem da classe de prioridade."""
+    __slots__ = ('priority', 'weight', 'finish')
+
+    def __init__(self, priority: str) -> None:
+        self.priority = priority if priority in PRIORITY_WEIGHTS else DEFAULT_CLASS
+        self.weight = PRIORITY_WEIGHTS[self.priority]
+        # Último tempo virtual de término por cliente (cada cliente tem seu relógio)
+        self.finish: Dict[str, float] = {}
+
+
+# Stream da request atual. Tasks filhas (read-ahead, faixas, hedge) herdam o contexto.
+current_flow: ContextVar[Optional[Flow]] = ContextVar("current_flow", default=None)
+
+
+class ClientBusy(Exception):
+    """Nenhuma vaga liberou dentro do tempo de fila. `value` segue o formato do FloodWait."""
+
+    def __init__(self, name: str, value: int) -> None:
+        super().__init__(f"Cliente {name} sem vaga livre: o tempo de fila esgotou")
+        self.value = value
+
+
+class ClientSlots:
+    """Limite de downloads do Telegram em voo por cliente, com fila justa ponderada.
+
+    Uma vaga = um upload.GetFile em andamento. A fila é um WFQ: cada pedido recebe um tempo
+    virtual de término = max(relógio, término anterior da stream) + bytes / peso da classe, e
+    a vaga liberada vai direto para o menor término. O relógio virtual anda bytes servidos /
+    soma dos pesos das streams ativas, como no GPS. Assim um player com um só chunk pendente
+    ainda passa à frente de vários downloads em massa, em vez de perder a vez a cada pedido.
+    """
+
+    def __init__(self, limit: int, queue_timeout: float) -> None:
+        self.limit = max(1, limit)
+        self.queue_timeout = queue_timeout
+        self.in_use: Dict[str, int] = {}
+        self.waiters: Dict[str, List[Tuple[float, int, asyncio.Future, int]]] = {}
+        self.virtual_time: Dict[str, float] = {}
+        # Streams com pedido na fila ou em voo, por cliente, e a soma dos seus pesos
+        self.active: Dict[str, Dict[Flow, int]] = {}
+        self.active_weight: Dict[str, float] = {}
+        self._sequence = itertools.count()
+        self.class_waits: Dict[str, List[float]] = {name: [0, 0.0] for name in PRIORITY_WEIGHTS}
+
+        self.waits = 0
+        self.wait_time = 0.0
+        self.max_wait = 0.0
+        self.timeouts = 0
+        self.spills = 0
+        self.rejected = 0
+
+    @property
+    def retry_after(self) -> int:
+        return max(1, math.ceil(self.queue_timeout))
+
+    def free(self, name: str) -> int:
+        return self.limit - self.in_use.get(name, 0)
+
+    def queued(self, name: str) -> int:
+        return len(self.waiters.get(name) or ())
+
+    def saturated(self, name: str) -> bool:
+        """Todas as vagas ocupadas e a fila já do tamanho do limite: não aceita trabalho novo."""
+        return self.free(name) <= 0 and self.queued(name) >= self.limit
+
+    def _join(self, name: str, flow: Flow) -> None:
+        flows = self.active.setdefault(name, {})
+        if flow not in flows:
+            flows[flow] = 0
+            self.active_weight[name] = self.active_weight.get(name, 0.0) + flow.weight
+        flows[flow] += 1
+
+    def _leave(self, name: str, flow: Flow) -> None:
+        flows = self.active.get(name) or {}
+        if flow not in flows:
+            return
+        flows[flow] -= 1
+        if flows[flow] <= 0:
+            del flows[flow]
+            self.active_weight[name] = max(0.0, self.active_weight.get(name, 0.0) - flow.weight)
+
+    def _tag(self, name: str, flow: Flow, cost: int) -> float:
+        start = max(self.virtual_time.get(name, 0.0), flow.finish.get(name, 0.0))
+        flow.finish[name] = start + cost / flow.weight
+        return flow.finish[name]
+
+    def _advance(self, name: str, cost: int) -> None:
+        weight = self.active_weight.get(name) or 1.0
+        self.virtual_time[name] = self.virtual_time.get(name, 0.0) + cost / weight
+
+    async def acquire(self, name: str, cost: int = 1) -> Flow:
+        flow = current_flow.get() or Flow(DEFAULT_CLASS)
+        self._join(name, flow)
+        tag = self._tag(name, flow, cost)
+        if self.in_use.get(name, 0) < self.limit and not self.waiters.get(name):
+            self.in_use[name] = self.in_use.get(name, 0) + 1
+            self._advance(name, cost)
+            return flow
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiters.setdefault(name, []), (tag, next(self._sequence), future, cost))
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(future, timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._discard(name, future)
+            self._leave(name, flow)
+            self.timeouts += 1
+            raise ClientBusy(name, self.retry_after)
+        except asyncio.CancelledError:
+            self._discard(name, future)
+            if future.done() and not future.cancelled():
+                # A vaga chegou junto com o cancelamento: devolve para o próximo.
+                self.release(name, flow)
+            else:
+                self._leave(name, flow)
+            raise
+
+        waited = time.monotonic() - started
+        self.waits += 1
+        self.wait_time += waited
+        if waited > self.max_wait:
+            self.max_wait = waited
+        class_wait = self.class_waits.setdefault(flow.priority, [0, 0.0])
+        class_wait[0] += 1
+        class_wait[1] += waited
+        return flow
+
+    def _discard(self, name: str, future: asyncio.Future) -> None:
+        queue = self.waiters.get(name)
+        if not queue:
+            return
+        for i, entry in enumerate(queue):
+            if entry[2] is future:
+                queue[i] = queue[-1]
+                queue.pop()
+                heapq.heapify(queue)
+                return
+
+    def release(self, name: str, flow: Optional[Flow] = None) -> None:
+        if flow is not None:
+            self._leave(name, flow)
+        queue = self.waiters.get(name)
+        while queue:
+            _, _, future, cost = heapq.heappop(queue)
+            if not future.done():
+                # Entrega a vaga ao menor término virtual: in_use não muda.
+                self._advance(name, cost)
+                future.set_result(None)
+                return
+        self.in_use[name] = max(0, self.in_use.get(name, 0) - 1)
+
+    @asynccontextmanager
+    async def slot(self, name: str, cost: int = 1) -> AsyncIterator[None]:
+        flow = await self.acquire(name, cost)
+        try:
+            yield
+        finally:
+            self.release(name, flow)
+
+    def client_stats(self, name: str) -> dict:
+        return {"in_flight": self.in_use.get(name, 0), "queued": self.queued(name)}
+
+    def stats(self) -> dict:
+        return {
+            "limit": self.limit,
+            "queue_timeout": self.queue_timeout,
+            "waits": self.waits,
+            "avg_wait_ms": round(self.wait_time / self.waits * 1000) if self.waits else 0,
+            "max_wait_ms": round(self.max_wait * 1000),
+            "timeouts": self.timeouts,
+            "spills": self.spills,
+            "rejected": self.rejected,
+            "classes": {
+                priority: {
+                    "weight": PRIORITY_WEIGHTS.get(priority, 1.0),
+                    "waits": waits,
+                    "avg_wait_ms": round(total / waits * 1000) if waits else 0,
+                }
+                for priority, (waits, total) in self.class_waits.items()
+            },
+        }
+
+
+client_slots = ClientSlots(Var.MAX_CONCURRENT_PER_CLIENT, Var.CLIENT_QUEUE_TIMEOUT)
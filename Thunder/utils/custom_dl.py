@@ -1,17 +1,99 @@
 # Thunder/utils/custom_dl.py
 
 import asyncio
-from typing import Any, AsyncGenerator, Dict
+import time
+from typing import Any, AsyncGenerator, Callable, Dict, Optional, Tuple
 
 from pyrogram import Client
-from pyrogram.errors import FloodWait
+from pyrogram.errors import BadRequest, FileReferenceExpired, FloodWait
+from pyrogram.file_id import FileId
 from pyrogram.types import Message
 
 from Thunder.server.exceptions import FileNotFound
-from Thunder.utils.file_properties import get_media
+from Thunder.utils.balancer import balancer
+from Thunder.utils.chunk_cache import CHUNK_SIZE, ChunkKey, chunk_cache
+from Thunder.utils.file_properties import get_file_info, get_media
 from Thunder.utils.logger import logger
+from Thunder.utils.media_session import get_file_part
+from Thunder.utils.ttl_cache import TTLCache
 from Thunder.vars import Var
 
+# Downloads de chunk em andamento: quem pede um chunk que já está sendo baixado
+# espera o mesmo resultado em vez de disparar outro upload.GetFile.
+CHUNK_FETCHERS: Dict[ChunkKey, asyncio.Future] = {}
+CHUNK_FETCH_WAIT_TIMEOUT = 30.0
+chunk_fetch_stats = {"shared": 0, "fallbacks": 0}
+
+# FileId decodificado por (sessão do cliente, message_id): range requests vão direto
+# para o download sem um messages.getMessages a cada requisição.
+FILE_ID_CACHE = TTLCache(maxsize=20000, ttl=6 * 3600)
+file_id_stats = {"hits": 0, "misses": 0, "refreshes": 0}
+
+# Ranges pequenos (probes dos players no início/fim do MP4) vão direto ao upload.GetFile
+# com o menor bloco permitido, em vez de custar um chunk de 1 MiB cada.
+BLOCK_ALIGN = 4096
+EXACT_RANGE_MAX = Var.EXACT_RANGE_MAX_KB * 1024
+exact_range_stats = {"fetches": 0, "bytes_fetched": 0, "bytes_served": 0, "fallbacks": 0}
+
+# Chunk que passa do p95 do cliente é pedido também a um segundo cliente; vale o que chegar primeiro.
+hedge_stats = {"hedged": 0, "backup_wins": 0, "primary_wins": 0, "no_backup": 0}
+
+
+def precise_block(offset: int, length: int) -> Tuple[int, int]:
+    """Bloco do modo `precise`: alinhado a 4 KiB, sem cruzar a fronteira de 1 MiB."""
+    block_offset = offset - offset % BLOCK_ALIGN
+    block_end = min(-(-(offset + length) // BLOCK_ALIGN) * BLOCK_ALIGN,
+                    (offset // CHUNK_SIZE + 1) * CHUNK_SIZE)
+    return block_offset, block_end - block_offset
+
+
+def aligned_block(offset: int, length: int) -> Tuple[int, int]:
+    """Menor bloco do modo normal: potência de 2 que divide 1 MiB, com offset múltiplo do limit."""
+    limit = BLOCK_ALIGN
+    while limit < CHUNK_SIZE and offset // limit != (offset + length - 1) // limit:
+        limit *= 2
+    return offset - offset % limit, limit
+
+
+def plan_exact_range(offset: int, end: int, unique_id: Optional[str]) -> int:
+    """Quantos bytes de [offset, end) devem ir pelo caminho exato. 0 = usar o chunk inteiro."""
+    if EXACT_RANGE_MAX <= 0:
+        return 0
+    index = offset // CHUNK_SIZE
+    length = min(end, (index + 1) * CHUNK_SIZE) - offset
+    if length >= CHUNK_SIZE or length > EXACT_RANGE_MAX:
+        return 0
+    key = (unique_id, index)
+    if unique_id and (key in chunk_cache or key in CHUNK_FETCHERS):
+        # O chunk já está (ou logo estará) disponível: recortar dele não custa transferência.
+        return 0
+    return length
+
+
+async def wait_chunk_fetcher(key: ChunkKey) -> Optional[bytes]:
+    """Aguarda um download em andamento do chunk. None = ninguém baixando ou o dono desistiu."""
+    fetcher = CHUNK_FETCHERS.get(key)
+    if fetcher is None:
+        return None
+    try:
+        # shield: se esta request for cancelada, o download do dono continua.
+        data = await asyncio.wait_for(asyncio.shield(fetcher), timeout=CHUNK_FETCH_WAIT_TIMEOUT)
+    except asyncio.TimeoutError:
+        data = None
+    if data is None:
+        chunk_fetch_stats["fallbacks"] += 1
+    else:
+        chunk_fetch_stats["shared"] += 1
+    return data
+
+
+def release_chunk_fetcher(key: ChunkKey, fetcher: asyncio.Future, result: Optional[bytes]) -> None:
+    if CHUNK_FETCHERS.get(key) is fetcher:
+        del CHUNK_FETCHERS[key]
+    if not fetcher.done():
+        # Em caso de erro/abandono devolvemos None: quem esperava baixa por conta própria.
+        fetcher.set_result(result)
+
 
 class ByteStreamer:
     __slots__ = ('client', 'chat_id')
@@ -20,6 +102,32 @@ class ByteStreamer:
         self.client = client
         self.chat_id = int(Var.BIN_CHANNEL)
 
+    def cache_file_id(self, message: Message) -> Optional[FileId]:
+        media = get_media(message)
+        if not media or not getattr(media, 'file_id', None):
+            return None
+        file_id = FileId.decode(media.file_id)
+        FILE_ID_CACHE[(self.client.name, message.id)] = file_id
+        return file_id
+
+    def invalidate_file_id(self, message_id: int) -> None:
+        FILE_ID_CACHE.pop((self.client.name, message_id), None)
+
+    async def get_file_id(self, message_id: int) -> Tuple[FileId, bool]:
+        """FileId da mídia para este cliente. Retorna (file_id, veio_do_cache)."""
+        file_id = FILE_ID_CACHE.get((self.client.name, message_id))
+        if file_id is not None:
+            file_id_stats["hits"] += 1
+            return file_id, True
+
+        file_id_stats["misses"] += 1
+        message = await self.get_message(message_id)
+        file_id = self.cache_file_id(message)
+        if file_id is None:
+            # Verifica se realmente tem mídia para evitar o ValueError do pyrogram
+            raise ValueError("This message doesn't contain any downloadable media")
+        return file_id, False
+
     async def get_message(self, message_id: int) -> Message:
         try:
             # Adicionado timeout de 15s para evitar que o bot fique "travado" infinitamente 
@@ -46,71 +154,189 @@ class ByteStreamer:
             raise FileNotFound(f"Message {message_id} not found")
 
     async def stream_file(
-        self, message_id: int, offset: int = 0, limit: int = 0
+        self, message_id: int, offset: int = 0, limit: int = 0,
+        unique_id: Optional[str] = None,
+        hedge: Optional[Callable[[], Optional["ByteStreamer"]]] = None
     ) -> AsyncGenerator[bytes, None]:
-        message = await self.get_message(message_id)
-        
-        # Verifica se realmente tem mídia para evitar o ValueError do pyrogram
-        media = get_media(message)
-        if not media:
-            raise ValueError("This message doesn't contain any downloadable media")
+        # Sempre entrega chunks inteiros de 1 MiB a partir de `offset // CHUNK_SIZE`;
+        # quem chama faz o skip/trim dos bytes.
+        first_chunk = offset // CHUNK_SIZE
+        last_chunk = (offset + limit - 1) // CHUNK_SIZE if limit > 0 else None
 
-        chunk_offset = offset // (1024 * 1024)
+        index = first_chunk
+        telegram = None
+        owned: Dict[ChunkKey, asyncio.Future] = {}
+        try:
+            while last_chunk is None or index <= last_chunk:
+                key = (unique_id, index)
 
-        chunk_limit = 0
-        if limit > 0:
-            chunk_limit = ((limit + (1024 * 1024) - 1) // (1024 * 1024)) + 1
+                # Sem download próprio aberto: tenta cache e depois carona em quem já está baixando.
+                if telegram is None and unique_id:
+                    data = await chunk_cache.get(unique_id, index)
+                    if data is None:
+                        data = await wait_chunk_fetcher(key)
+                    if data is not None:
+                        yield data
+                        if len(data) < CHUNK_SIZE:
+                            return
+                        index += 1
+                        continue
+
+                if telegram is None:
+                    # Uma vez aberto, seguimos no mesmo download mesmo que chunks seguintes
+                    # estejam em cache, para não pagar outra sessão de mídia no meio do caminho.
+                    count = (last_chunk - index + 1) if last_chunk is not None else 0
+                    telegram = self._telegram_chunks(message_id, index, count, hedge)
+
+                # Registra o chunk como "em andamento" só agora, quando a busca realmente começa.
+                if unique_id and key not in CHUNK_FETCHERS:
+                    owned[key] = CHUNK_FETCHERS[key] = asyncio.get_running_loop().create_future()
+
+                try:
+                    chunk = await telegram.__anext__()
+                except StopAsyncIteration:
+                    return
+
+                if unique_id:
+                    chunk_cache.put(unique_id, index, chunk)
+                fetcher = owned.pop(key, None)
+                if fetcher is not None:
+                    release_chunk_fetcher(key, fetcher, chunk)
 
-        try:
-            async for chunk in self.client.stream_media(
-                message, offset=chunk_offset, limit=chunk_limit
-            ):
                 yield chunk
-        except FloodWait as e:
-            raise e
+                if len(chunk) < CHUNK_SIZE:
+                    return
+                index += 1
+        finally:
+            for key, fetcher in owned.items():
+                release_chunk_fetcher(key, fetcher, None)
+            if telegram is not None:
+                await telegram.aclose()
+
+    async def _telegram_chunks(
+        self, message_id: int, first_chunk: int, count: int,
+        hedge: Optional[Callable[[], Optional["ByteStreamer"]]] = None
+    ) -> AsyncGenerator[bytes, None]:
+        index = first_chunk
+        last_chunk = first_chunk + count - 1 if count > 0 else None
+        refreshed = False
+        file_id, from_cache = await self.get_file_id(message_id)
+        while last_chunk is None or index <= last_chunk:
+            try:
+                chunk = await self._hedged_chunk(message_id, file_id, index, hedge)
+            except FileReferenceExpired:
+                if not from_cache or refreshed:
+                    raise
+                # FileId do cache com file_reference vencida: renova a partir da mensagem uma vez.
+                logger.debug(f"FileId em cache do ID {message_id} expirou no {self.client.name}. Renovando...")
+                file_id_stats["refreshes"] += 1
+                self.invalidate_file_id(message_id)
+                refreshed = True
+                file_id, from_cache = await self.get_file_id(message_id)
+                continue
+
+            if not chunk:
+                return
+            yield chunk
+            if len(chunk) < CHUNK_SIZE:
+                return
+            index += 1
+
+    async def fetch_chunk(self, message_id: int, index: int) -> bytes:
+        file_id, _ = await self.get_file_id(message_id)
+        return await get_file_part(self.client, file_id, index * CHUNK_SIZE, CHUNK_SIZE)
+
+    async def _hedged_chunk(
+        self, message_id: int, file_id: FileId, index: int,
+        hedge: Optional[Callable[[], Optional["ByteStreamer"]]]
+    ) -> bytes:
+        delay = balancer.hedge_delay(self.client.name) if hedge is not None else None
+        if delay is None:
+            return await get_file_part(self.client, file_id, index * CHUNK_SIZE, CHUNK_SIZE)
+
+        started = time.monotonic()
+        primary = asyncio.ensure_future(
+            get_file_part(self.client, file_id, index * CHUNK_SIZE, CHUNK_SIZE))
+        backup = None
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if done:
+                return primary.result()
+
+            backup_streamer = hedge()
+            if backup_streamer is None:
+                hedge_stats["no_backup"] += 1
+                return await primary
+
+            hedge_stats["hedged"] += 1
+            logger.debug(f"⏱️ Chunk {index} do ID {message_id} passou de {delay:.2f}s no {self.client.name}. "
+                         f"Pedindo também ao {backup_streamer.client.name}...")
+            backup = asyncio.ensure_future(backup_streamer.fetch_chunk(message_id, index))
+            pending = {primary, backup}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is backup:
+                            hedge_stats["backup_wins"] += 1
+                            balancer.record_abandoned(self.client.name, time.monotonic() - started)
+                        else:
+                            hedge_stats["primary_wins"] += 1
+                        return task.result()
+            # Os dois falharam: vale o erro do cliente principal (o fluxo de fallback trata).
+            return primary.result()
+        finally:
+            for task in (primary, backup):
+                if task is None:
+                    continue
+                if not task.done():
+                    task.cancel()
+                elif not task.cancelled():
+                    task.exception()  # marca o erro do perdedor como tratado
+
+    async def fetch_range(self, message_id: int, offset: int, length: int) -> Optional[memoryview]:
+        """Busca exatamente [offset, offset + length) dentro de um único chunk de 1 MiB.
+
+        Retorna None se o Telegram recusar os dois formatos de bloco; quem chama volta ao chunk inteiro.
+        """
+        file_id, from_cache = await self.get_file_id(message_id)
+        for precise in (True, False):
+            block_offset, block_limit = (
+                precise_block(offset, length) if precise else aligned_block(offset, length))
+            try:
+                try:
+                    data = await get_file_part(
+                        self.client, file_id, block_offset, block_limit, precise=precise)
+                except FileReferenceExpired:
+                    if not from_cache:
+                        raise
+                    file_id_stats["refreshes"] += 1
+                    self.invalidate_file_id(message_id)
+                    file_id, from_cache = await self.get_file_id(message_id)
+                    # A nova tentativa passa pelo mesmo fallback de formato de bloco abaixo
+                    data = await get_file_part(
+                        self.client, file_id, block_offset, block_limit, precise=precise)
+            except FileReferenceExpired:
+                raise
+            except BadRequest as e:
+                logger.debug(f"upload.GetFile recusou bloco {block_offset}+{block_limit} (precise={precise}): {e}")
+                exact_range_stats["fallbacks"] += 1
+                continue
+
+            skip = offset - block_offset
+            exact_range_stats["fetches"] += 1
+            exact_range_stats["bytes_fetched"] += len(data)
+            exact_range_stats["bytes_served"] += min(length, max(0, len(data) - skip))
+            return memoryview(data)[skip:skip + length]
+        return None
 
     def get_file_info_sync(self, message: Message) -> Dict[str, Any]:
-        media = get_media(message)
-        if not media:
-            return {"message_id": message.id, "error": "No media"}
-
-        media_type = type(media).__name__.lower()
-        file_name = getattr(media, 'file_name', None)
-        mime_type = getattr(media, 'mime_type', None)
-
-        if not file_name:
-            ext_map = {
-                "photo": "jpg",
-                "audio": "mp3",
-                "voice": "ogg",
-                "video": "mp4",
-                "animation": "mp4",
-                "videonote": "mp4",
-                "sticker": "webp",
-            }
-            ext = ext_map.get(media_type, "bin")
-            file_name = f"Thunder_{message.id}.{ext}"
-
-        if not mime_type:
-            mime_map = {
-                "photo": "image/jpeg",
-                "voice": "audio/ogg",
-                "videonote": "video/mp4",
-            }
-            mime_type = mime_map.get(media_type)
-
-        return {
-            "message_id": message.id,
-            "file_size": getattr(media, 'file_size', 0) or 0,
-            "file_name": file_name,
-            "mime_type": mime_type,
-            "unique_id": getattr(media, 'file_unique_id', None),
-            "media_type": media_type
-        }
+        return get_file_info(message)
 
     async def get_file_info(self, message_id: int) -> Dict[str, Any]:
         try:
             message = await self.get_message(message_id)
+            self.cache_file_id(message)
             return self.get_file_info_sync(message)
         except Exception as e:
             logger.debug(f"Error getting file info for {message_id}: {e}", exc_info=True)
@@ -1,7 +1,7 @@
 # Thunder/utils/database.py
 
 import datetime
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 from pymongo import AsyncMongoClient
 from pymongo.asynchronous.collection import AsyncCollection
 from Thunder.vars import Var
@@ -18,6 +18,8 @@ class Database:
         self.authorized_users_col: AsyncCollection = self.db.authorized_users
         self.restart_message_col: AsyncCollection = self.db.restart_message
         self.series_col: AsyncCollection = self.db.series_sessions
+        self.file_index_col: AsyncCollection = self.db.file_index
+        self.seek_index_col: AsyncCollection = self.db.seek_index
 
     async def ensure_indexes(self):
         try:
@@ -32,6 +34,8 @@ class Database:
             await self.restart_message_col.create_index("timestamp", expireAfterSeconds=3600)
             await self.series_col.create_index("user_id", unique=True)
             await self.series_col.create_index("timestamp", expireAfterSeconds=86400) # Sessão expira em 24h
+            await self.file_index_col.create_index("message_id", unique=True)
+            await self.seek_index_col.create_index("unique_id", unique=True)
 
             logger.debug("Database indexes ensured.")
         except Exception as e:
@@ -286,6 +290,53 @@ class Database:
         except Exception as e:
             logger.error(f"Error deleting series session for {user_id}: {e}", exc_info=True)
 
+    async def save_file_info(self, file_info: Dict[str, Any]) -> None:
+        message_id = file_info.get("message_id")
+        if not message_id or not file_info.get("unique_id"):
+            return
+        try:
+            await self.file_index_col.update_one(
+                {"message_id": message_id},
+                {"$set": {**file_info, "indexed_at": datetime.datetime.utcnow()}},
+                upsert=True
+            )
+        except Exception as e:
+            logger.error(f"Error saving file info for message {message_id}: {e}", exc_info=True)
+
+    async def get_file_info(self, message_id: int) -> Optional[Dict[str, Any]]:
+        try:
+            return await self.file_index_col.find_one(
+                {"message_id": message_id}, {"_id": 0, "indexed_at": 0})
+        except Exception as e:
+            logger.error(f"Error getting file info for message {message_id}: {e}", exc_info=True)
+            return None
+
+    async def get_indexed_dcs(self) -> List[int]:
+        try:
+            dc_ids = await self.file_index_col.distinct("dc_id")
+            return sorted(dc_id for dc_id in dc_ids if isinstance(dc_id, int))
+        except Exception as e:
+            logger.error(f"Error getting indexed DCs: {e}", exc_info=True)
+            return []
+
+    async def save_seek_index(self, unique_id: str, index: Dict[str, Any]) -> None:
+        try:
+            await self.seek_index_col.update_one(
+                {"unique_id": unique_id},
+                {"$set": {**index, "unique_id": unique_id, "indexed_at": datetime.datetime.utcnow()}},
+                upsert=True
+            )
+        except Exception as e:
+            logger.error(f"Error saving seek index for {unique_id}: {e}", exc_info=True)
+
+    async def get_seek_index(self, unique_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            return await self.seek_index_col.find_one(
+                {"unique_id": unique_id}, {"_id": 0, "unique_id": 0, "indexed_at": 0})
+        except Exception as e:
+            logger.error(f"Error getting seek index for {unique_id}: {e}", exc_info=True)
+            return None
+
     async def close(self):
         if self._client:
             await self._client.close()
@@ -2,7 +2,7 @@
 
 import asyncio
 from datetime import datetime as dt
-from typing import Any, Optional
+from typing import Any, Dict, Optional
 
 from pyrogram.client import Client
 from pyrogram.errors import FloodWait
@@ -46,6 +46,50 @@ def parse_fid(message: Message) -> Optional[FileId]:
     return None
 
 
+def get_file_info(message: Message) -> Dict[str, Any]:
+    media = get_media(message)
+    if not media:
+        return {"message_id": message.id, "error": "No media"}
+
+    media_type = type(media).__name__.lower()
+    file_name = getattr(media, 'file_name', None)
+    mime_type = getattr(media, 'mime_type', None)
+
+    if not file_name:
+        ext_map = {
+            "photo": "jpg",
+            "audio": "mp3",
+            "voice": "ogg",
+            "video": "mp4",
+            "animation": "mp4",
+            "videonote": "mp4",
+            "sticker": "webp",
+        }
+        ext = ext_map.get(media_type, "bin")
+        file_name = f"Thunder_{message.id}.{ext}"
+
+    if not mime_type:
+        mime_map = {
+            "photo": "image/jpeg",
+            "voice": "audio/ogg",
+            "videonote": "video/mp4",
+        }
+        mime_type = mime_map.get(media_type)
+
+    file_id = parse_fid(message)
+
+    return {
+        "message_id": message.id,
+        "file_size": getattr(media, 'file_size', 0) or 0,
+        "file_name": file_name,
+        "mime_type": mime_type,
+        "unique_id": getattr(media, 'file_unique_id', None),
+        "media_type": media_type,
+        "dc_id": file_id.dc_id if file_id else None,
+        "date": int(message.date.timestamp()) if message.date else None
+    }
+
+
 def get_fname(msg: Message) -> str:
     media = get_media(msg)
     fname = getattr(media, 'file_name', None) if media else None
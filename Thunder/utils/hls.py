@@ -0,0 +1,46 @@
+# Thunder/utils/hls.py
+
+import math
+from typing import Any, Dict, List, Tuple
+
+from Thunder.vars import Var
+
+
+def hls_segments(index: Dict[str, Any], file_size: int) -> List[Tuple[float, int, int]]:
+    """(duração, offset, tamanho) de cada segmento: fragmentos moof+mdat consecutivos agrupados
+    até HLS_SEGMENT_SECONDS, sempre começando num fragmento (keyframe)."""
+    fragments = index["keyframes"]
+    media_end = index.get("media_end") or file_size
+    duration = index.get("duration") or fragments[-1][0]
+    target = max(1.0, Var.HLS_SEGMENT_SECONDS)
+
+    segments: List[Tuple[float, int, int]] = []
+    start_time, start_offset = fragments[0]
+    for i in range(1, len(fragments) + 1):
+        end_time, end_offset = fragments[i] if i < len(fragments) else (duration, media_end)
+        if i < len(fragments) and end_time - start_time < target:
+            continue
+        if end_offset > start_offset:
+            segments.append((max(0.001, end_time - start_time), int(start_offset), int(end_offset - start_offset)))
+        start_time, start_offset = end_time, end_offset
+    return segments
+
+
+def build_playlist(index: Dict[str, Any], media_url: str, file_size: int) -> str:
+    """Playlist VOD com EXT-X-BYTERANGE apontando para a própria URL do arquivo (sem transcodificar)."""
+    segments = hls_segments(index, file_size)
+    target_duration = math.ceil(max(duration for duration, _, _ in segments))
+    lines = [
+        "#EXTM3U",
+        "#EXT-X-VERSION:7",
+        f"#EXT-X-TARGETDURATION:{target_duration}",
+        "#EXT-X-PLAYLIST-TYPE:VOD",
+        "#EXT-X-INDEPENDENT-SEGMENTS",
+        f'#EXT-X-MAP:URI="{media_url}",BYTERANGE="{index["init_size"]}@0"',
+    ]
+    for duration, offset, length in segments:
+        lines.append(f"#EXTINF:{duration:.3f},")
+        lines.append(f"#EXT-X-BYTERANGE:{length}@{offset}")
+        lines.append(media_url)
+    lines.append("#EXT-X-ENDLIST")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,172 @@
+# Thunder/utils/media_session.py
+
+import asyncio
+import time
+from typing import Any, List
+
+from pyrogram import Client, raw, utils
+from pyrogram.errors import AuthBytesInvalid, FloodWait, Unauthorized
+from pyrogram.file_id import FileId, FileType, ThumbnailSource
+from pyrogram.session import Session
+from pyrogram.session.auth import Auth
+
+from Thunder.utils.balancer import balancer
+from Thunder.utils.client_slots import client_slots
+from Thunder.utils.logger import logger
+
+media_session_stats = {"created": 0, "reused": 0, "dropped": 0, "warmed": 0}
+
+WARMUP_TIMEOUT = 20.0
+# FloodWait até este tempo é esperado (fora da vaga) e o GetFile repetido; acima disso sobe ao chamador
+FLOOD_SLEEP_THRESHOLD = 30
+
+
+async def get_media_session(client: Client, dc_id: int) -> Session:
+    """Sessão de mídia persistente por DC em `client.media_sessions`.
+
+    O `get_file` do pyrogram abre (e, fora do DC da conta, autentica) uma sessão nova a cada
+    chamada; aqui ela é criada uma vez e reaproveitada por todos os upload.GetFile seguintes.
+    """
+    session = client.media_sessions.get(dc_id)
+    if session is not None:
+        media_session_stats["reused"] += 1
+        return session
+
+    async with client.media_sessions_lock:
+        session = client.media_sessions.get(dc_id)
+        if session is not None:
+            media_session_stats["reused"] += 1
+            return session
+
+        test_mode = await client.storage.test_mode()
+        home_dc = dc_id == await client.storage.dc_id()
+        auth_key = (
+            await client.storage.auth_key() if home_dc
+            else await Auth(client, dc_id, test_mode).create()
+        )
+        session = Session(client, dc_id, auth_key, test_mode, is_media=True)
+        await session.start()
+
+        if not home_dc:
+            for _ in range(3):
+                exported_auth = await client.invoke(
+                    raw.functions.auth.ExportAuthorization(dc_id=dc_id))
+                try:
+                    await session.invoke(
+                        raw.functions.auth.ImportAuthorization(
+                            id=exported_auth.id, bytes=exported_auth.bytes))
+                    break
+                except AuthBytesInvalid:
+                    continue
+            else:
+                await session.stop()
+                raise AuthBytesInvalid
+
+        client.media_sessions[dc_id] = session
+        media_session_stats["created"] += 1
+        logger.debug(f"📡 Sessão de mídia criada no DC {dc_id} para {client.name}")
+        return session
+
+
+async def drop_media_session(client: Client, dc_id: int) -> None:
+    """Descarta uma sessão com problema; a próxima requisição cria outra."""
+    session = client.media_sessions.pop(dc_id, None)
+    if session is None:
+        return
+    media_session_stats["dropped"] += 1
+    try:
+        await session.stop()
+    except Exception as e:
+        logger.debug(f"Erro ao encerrar sessão de mídia do DC {dc_id}: {e}")
+
+
+async def warm_media_sessions(client: Client, dc_ids: List[int]) -> List[int]:
+    """Abre e autoriza as sessões de mídia antes do primeiro espectador. Retorna os DCs prontos."""
+    warmed = []
+    for dc_id in dc_ids:
+        if dc_id in client.media_sessions:
+            warmed.append(dc_id)
+            continue
+        try:
+            await asyncio.wait_for(get_media_session(client, dc_id), timeout=WARMUP_TIMEOUT)
+        except Exception as e:
+            logger.warning(f"⚠️ Falha ao pré-aquecer DC {dc_id} em {client.name}: {type(e).__name__}: {e}")
+            continue
+        media_session_stats["warmed"] += 1
+        warmed.append(dc_id)
+    return warmed
+
+
+def get_location(file_id: FileId) -> Any:
+    file_type = file_id.file_type
+
+    if file_type == FileType.CHAT_PHOTO:
+        if file_id.chat_id > 0:
+            peer = raw.types.InputPeerUser(
+                user_id=file_id.chat_id, access_hash=file_id.chat_access_hash)
+        elif file_id.chat_access_hash == 0:
+            peer = raw.types.InputPeerChat(chat_id=-file_id.chat_id)
+        else:
+            peer = raw.types.InputPeerChannel(
+                channel_id=utils.get_channel_id(file_id.chat_id),
+                access_hash=file_id.chat_access_hash)
+
+        return raw.types.InputPeerPhotoFileLocation(
+            peer=peer,
+            photo_id=file_id.media_id,
+            big=file_id.thumbnail_source == ThumbnailSource.CHAT_PHOTO_BIG)
+
+    if file_type == FileType.PHOTO:
+        return raw.types.InputPhotoFileLocation(
+            id=file_id.media_id,
+            access_hash=file_id.access_hash,
+            file_reference=file_id.file_reference,
+            thumb_size=file_id.thumbnail_size)
+
+    return raw.types.InputDocumentFileLocation(
+        id=file_id.media_id,
+        access_hash=file_id.access_hash,
+        file_reference=file_id.file_reference,
+        thumb_size=file_id.thumbnail_size)
+
+
+async def get_file_part(
+    client: Client, file_id: FileId, offset: int, limit: int, precise: bool = False
+) -> bytes:
+    """Um único upload.GetFile na sessão persistente do DC do arquivo."""
+    session = await get_media_session(client, file_id.dc_id)
+    for attempt in range(2):
+        async with client_slots.slot(client.name, limit):
+            started = time.monotonic()
+            try:
+                r = await session.invoke(
+                    raw.functions.upload.GetFile(
+                        location=get_location(file_id),
+                        offset=offset,
+                        limit=limit,
+                        precise=precise or None
+                    ),
+                    sleep_threshold=0
+                )
+            except FloodWait as e:
+                flood = e
+            except (Unauthorized, asyncio.TimeoutError, OSError):
+                await drop_media_session(client, file_id.dc_id)
+                raise
+            else:
+                elapsed = time.monotonic() - started
+                break
+
+        # Vaga já devolvida: o bot parado não ocupa a fila justa enquanto não transfere nada,
+        # e a seleção de clientes o evita até o Telegram liberar
+        balancer.record_flood(client.name, flood.value)
+        if attempt or flood.value > FLOOD_SLEEP_THRESHOLD:
+            raise flood
+        logger.warning(f"⏳ FloodWait de {flood.value}s em {client.name}; aguardando fora da vaga de download.")
+        await asyncio.sleep(flood.value)
+
+    if not isinstance(r, raw.types.upload.File):
+        # Sem cdn_supported o Telegram não redireciona; qualquer outra coisa é inesperada.
+        raise ValueError(f"Resposta inesperada de upload.GetFile: {type(r).__name__}")
+    balancer.record_fetch(client.name, len(r.bytes), elapsed)
+    return r.bytes
@@ -0,0 +1,105 @@
+# Thunder/utils/pinning.py
+
+import asyncio
+from typing import Any, Dict, List, Optional, Set
+
+from Thunder.bot import multi_clients, work_loads
+from Thunder.utils.balancer import balancer
+from Thunder.utils.chunk_cache import CHUNK_SIZE, pinned_cache
+from Thunder.utils.client_marks import client_eligible
+from Thunder.utils.client_slots import client_slots
+from Thunder.utils.custom_dl import ByteStreamer
+from Thunder.utils.logger import logger
+from Thunder.utils.seek_index import get_seek_index
+
+# Lotes de links (/serie, batch) não podem disparar dezenas de downloads de uma vez.
+PIN_CONCURRENCY = 2
+
+pin_stats = {"scheduled": 0, "filled": 0, "chunks": 0, "failed": 0}
+
+_pin_semaphore: Optional[asyncio.Semaphore] = None
+_filling: Set[str] = set()
+_tasks: Set[asyncio.Task] = set()
+
+
+def _pick_streamer(message_id: int) -> Optional[ByteStreamer]:
+    """Cliente elegível (como na seleção das requests) com vaga livre e maior capacidade estimada
+    para o preenchimento em segundo plano."""
+    candidates = [
+        cid for cid, client in multi_clients.items()
+        if client_eligible(cid, message_id) and client_slots.free(client.name) > 0
+    ]
+    if not candidates:
+        return None
+    cid = max(candidates, key=lambda x: balancer.score(
+        x, multi_clients[x].name, work_loads.get(x, 0)))
+    return ByteStreamer(multi_clients[cid])
+
+
+def _runs(indexes: List[int]) -> List[List[int]]:
+    """[0, 1, 7, 8] -> [[0, 1], [7, 8]]: cada sequência vira um único download."""
+    runs: List[List[int]] = []
+    for index in indexes:
+        if runs and index == runs[-1][-1] + 1:
+            runs[-1].append(index)
+        else:
+            runs.append([index])
+    return runs
+
+
+def schedule_pin(file_info: Dict[str, Any], streamer: Optional[ByteStreamer] = None) -> None:
+    """Fixa o início e o fim do arquivo; os chunks que faltam são baixados em segundo plano."""
+    unique_id = file_info.get('unique_id')
+    file_size = file_info.get('file_size') or 0
+    message_id = file_info.get('message_id')
+    if not unique_id or not message_id:
+        return
+    missing = pinned_cache.pin(unique_id, file_size)
+    if not missing or unique_id in _filling:
+        return
+
+    _filling.add(unique_id)
+    pin_stats["scheduled"] += 1
+    task = asyncio.create_task(_fill(file_info, missing, streamer))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+
+
+async def _fill(file_info: Dict[str, Any], indexes: List[int],
+                streamer: Optional[ByteStreamer]) -> None:
+    global _pin_semaphore
+    message_id, unique_id = file_info['message_id'], file_info['unique_id']
+    if _pin_semaphore is None:
+        _pin_semaphore = asyncio.Semaphore(PIN_CONCURRENCY)
+    try:
+        async with _pin_semaphore:
+            streamer = streamer or _pick_streamer(message_id)
+            if streamer is None:
+                logger.debug(f"📌 Nenhum cliente livre para fixar o ID {message_id}. Fica para a primeira visualização.")
+                pin_stats["failed"] += 1
+                return
+            for run in _runs(indexes):
+                # Já chegou por outra request (ou pelo disco) enquanto esperava a vez
+                run = [i for i in run if (unique_id, i) not in pinned_cache]
+                if not run:
+                    continue
+                async for chunk in streamer.stream_file(
+                        message_id, offset=run[0] * CHUNK_SIZE, limit=len(run) * CHUNK_SIZE,
+                        unique_id=unique_id):
+                    pin_stats["chunks"] += 1
+                    if len(chunk) < CHUNK_SIZE:
+                        break
+            pin_stats["filled"] += 1
+            logger.debug(f"📌 Início/fim do ID {message_id} fixados ({len(indexes)} chunks)")
+            if (file_info.get('mime_type') or '').startswith('video/'):
+                # moov/Cues costumam estar nos chunks recém-fixados: o índice sai quase de graça
+                await get_seek_index(file_info, streamer)
+    except Exception as e:
+        pin_stats["failed"] += 1
+        logger.debug(f"Falha ao fixar início/fim do ID {message_id}: {type(e).__name__}: {e}")
+    finally:
+        _filling.discard(unique_id)
+
+
+def get_pin_stats() -> dict:
+    return {"filling": len(_filling), **pin_stats}
@@ -0,0 +1,393 @@
+# Thunder/utils/read_ahead.py
+
+import asyncio
+import time
+from collections import deque
+from contextlib import aclosing
+from typing import AsyncGenerator, Callable, List, Optional, Tuple
+
+from Thunder.bot import work_loads
+from Thunder.utils.buffer_budget import buffer_budget
+from Thunder.vars import Var
+
+CHUNK_SIZE = 1024 * 1024
+STREAM_BUFFER_CHUNKS = Var.STREAM_BUFFER_MB * 1024 * 1024 // CHUNK_SIZE
+
+# Profundidade efetiva: nunca passa do buffer permitido por stream.
+READ_AHEAD_DEPTH = max(0, min(Var.READ_AHEAD_CHUNKS, STREAM_BUFFER_CHUNKS))
+
+STRIPE_MIN_BYTES = Var.STRIPE_MIN_MB * 1024 * 1024
+STRIPE_CHUNKS = max(1, Var.STRIPE_CHUNKS)
+
+read_ahead_stats = {
+    "streams": 0,
+    "finished": 0,
+    "peak_depth": 0,
+    "depth_sum": 0,
+    "underruns": 0,
+}
+
+# Streams com o buffer cheio esperando o cliente HTTP: saem da carga do bot até voltarem a baixar
+park_stats = {
+    "parks": 0,
+    "parked": 0,
+    "parked_seconds": 0.0,
+}
+
+stripe_stats = {
+    "streams": 0,
+    "stripes": 0,
+    "retries": 0,
+    "failures": 0,
+}
+
+_END = object()
+
+
+class StreamLoad:
+    """Carga de uma request em `work_loads` (no bot que está baixando), que sai da conta
+    enquanto a stream está estacionada.
+
+    Com o buffer cheio, quem segura a request é o cliente HTTP lento, não o Telegram: o bot não
+    está baixando nada para ela, então não deve parecer ocupado para o balanceamento.
+    Recebe o primeiro bot com a carga já contada.
+    """
+
+    def __init__(self, cid: int) -> None:
+        self.cids: List[int] = [cid]
+        self.parked_since: Optional[float] = None
+
+    def swap(self, old: int, new: int) -> None:
+        """A request passou para outro bot (fallback ou cursor retomado): só ele conta, o antigo sai."""
+        if old == new:
+            return
+        if old in self.cids:
+            self.cids.remove(old)
+            if self.parked_since is None and old in work_loads:
+                work_loads[old] -= 1
+        if new not in self.cids:
+            self.cids.append(new)
+            if self.parked_since is None and new in work_loads:
+                work_loads[new] += 1
+
+    def park(self) -> None:
+        if self.parked_since is not None:
+            return
+        self.parked_since = time.monotonic()
+        park_stats["parks"] += 1
+        park_stats["parked"] += 1
+        for cid in self.cids:
+            if cid in work_loads:
+                work_loads[cid] -= 1
+
+    def resume(self) -> None:
+        if self.parked_since is None:
+            return
+        park_stats["parked"] -= 1
+        park_stats["parked_seconds"] += time.monotonic() - self.parked_since
+        self.parked_since = None
+        for cid in self.cids:
+            if cid in work_loads:
+                work_loads[cid] += 1
+
+    def release(self) -> None:
+        """Fim da request: devolve o que ainda estiver contado."""
+        self.resume()
+        for cid in self.cids:
+            if cid in work_loads:
+                work_loads[cid] -= 1
+        self.cids = []
+
+
+class ReadAhead:
+    """Puxa chunks da origem num task próprio, até `depth` chunks à frente de quem escreve no socket."""
+
+    def __init__(self, source: AsyncGenerator[bytes, None], depth: int,
+                 load: Optional[StreamLoad] = None) -> None:
+        self.source = source
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=depth)
+        self.load = load
+        self.peak_depth = 0
+        self.underruns = 0
+        # Bytes reservados no orçamento global: chunks em voo, na fila e o último entregue ao writer
+        self.reserved = 0
+        self._held = False
+        # Bytes baixados que ficaram na fila quando a stream foi fechada (cliente saiu antes)
+        self.unread = 0
+        self._task: Optional[asyncio.Task] = asyncio.create_task(self._pump())
+        read_ahead_stats["streams"] += 1
+
+    async def _put(self, item: object) -> None:
+        if self.load is not None and self.queue.full():
+            # Buffer cheio: nada a baixar até o cliente HTTP consumir
+            self.load.park()
+        await self.queue.put(item)
+        if self.load is not None:
+            self.load.resume()
+
+    def _unreserve(self, nbytes: int) -> None:
+        nbytes = min(nbytes, self.reserved)
+        self.reserved -= nbytes
+        buffer_budget.release(nbytes)
+
+    async def _pump(self) -> None:
+        try:
+            while True:
+                # Teto global: só baixa o próximo chunk se houver espaço para guardá-lo
+                await buffer_budget.acquire(CHUNK_SIZE)
+                self.reserved += CHUNK_SIZE
+                try:
+                    chunk = await self.source.__anext__()
+                except StopAsyncIteration:
+                    self._unreserve(CHUNK_SIZE)
+                    break
+                except Exception:
+                    self._unreserve(CHUNK_SIZE)
+                    raise
+                await self._put(chunk)
+                depth = self.queue.qsize()
+                if depth > self.peak_depth:
+                    self.peak_depth = depth
+        except Exception as e:
+            await self._put(e)
+        else:
+            await self._put(_END)
+        finally:
+            await self.source.aclose()
+
+    def __aiter__(self) -> "ReadAhead":
+        return self
+
+    async def __anext__(self) -> bytes:
+        if self._held:
+            # O writer já mandou o chunk anterior para o socket
+            self._held = False
+            self._unreserve(CHUNK_SIZE)
+        if self.queue.empty() and self._task is not None and not self._task.done():
+            # O writer alcançou o Telegram: a fila não estava cobrindo a latência.
+            self.underruns += 1
+        item = await self.queue.get()
+        if item is _END:
+            raise StopAsyncIteration
+        if isinstance(item, Exception):
+            raise item
+        self._held = True
+        return item
+
+    async def aclose(self) -> None:
+        task, self._task = self._task, None
+        if task is None:
+            return
+        if not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        # Chunks na fila (ou em voo) que ninguém vai ler
+        while not self.queue.empty():
+            item = self.queue.get_nowait()
+            if isinstance(item, bytes):
+                self.unread += len(item)
+        self._held = False
+        self._unreserve(self.reserved)
+        if self.load is not None:
+            # Cancelado estacionado: a request continua (próxima parte, fallback) e volta a contar
+            self.load.resume()
+
+        read_ahead_stats["finished"] += 1
+        read_ahead_stats["depth_sum"] += self.peak_depth
+        read_ahead_stats["underruns"] += self.underruns
+        if self.peak_depth > read_ahead_stats["peak_depth"]:
+            read_ahead_stats["peak_depth"] = self.peak_depth
+
+
+class StripeFailed(Exception):
+    pass
+
+
+class _Stripe:
+    __slots__ = ('first', 'count', 'received', 'chunks', 'finished', 'error', 'event', 'task')
+
+    def __init__(self, first: int, count: int) -> None:
+        self.first = first
+        self.count = count
+        self.received = 0
+        self.chunks: deque = deque()
+        self.finished = False
+        self.error: Optional[Exception] = None
+        self.event = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+
+    def push(self, chunk: bytes) -> None:
+        self.chunks.append(chunk)
+        self.received += 1
+        self.event.set()
+
+    def finish(self, error: Optional[Exception] = None) -> None:
+        self.finished = True
+        self.error = error
+        self.event.set()
+
+    async def next(self) -> Optional[bytes]:
+        while True:
+            if self.chunks:
+                return self.chunks.popleft()
+            if self.finished:
+                if self.error is not None:
+                    raise self.error
+                return None
+            self.event.clear()
+            await self.event.wait()
+
+
+class StripedReader:
+    """Baixa faixas consecutivas de chunks em paralelo em vários clientes e entrega tudo em ordem."""
+
+    def __init__(
+        self, message_id: int, unique_id: Optional[str], first_chunk: int, last_chunk: int,
+        clients: List[Tuple[int, object]], on_error: Callable[[int, Exception], None],
+        load: Optional[StreamLoad] = None
+    ) -> None:
+        self.message_id = message_id
+        self.load = load
+        self.unique_id = unique_id
+        self.last_chunk = last_chunk
+        self.clients = clients
+        self.on_error = on_error
+        # Quantas faixas ficam em voo: uma por cliente, limitada pelo buffer do stream.
+        self.window = max(1, min(len(clients), STREAM_BUFFER_CHUNKS // STRIPE_CHUNKS))
+        self._stripes: deque = deque()
+        self._next_first = first_chunk
+        self._rotation = 0
+        self.reserved = 0
+        self._held = False
+        self.unread = 0
+        stripe_stats["streams"] += 1
+        self._fill()
+
+    def _fill(self) -> None:
+        if self.load is not None and self._next_first <= self.last_chunk:
+            self.load.resume()
+        while len(self._stripes) < self.window and self._next_first <= self.last_chunk:
+            count = min(STRIPE_CHUNKS, self.last_chunk - self._next_first + 1)
+            stripe = _Stripe(self._next_first, count)
+            stripe.task = asyncio.create_task(self._fetch(stripe, self._rotation))
+            self._stripes.append(stripe)
+            self._next_first += count
+            self._rotation += 1
+            stripe_stats["stripes"] += 1
+
+    def _unreserve(self, nbytes: int) -> None:
+        nbytes = min(nbytes, self.reserved)
+        self.reserved -= nbytes
+        buffer_budget.release(nbytes)
+
+    async def _fetch(self, stripe: _Stripe, rotation: int) -> None:
+        # A faixa inteira é reservada de uma vez e na ordem de criação: a faixa da frente
+        # (a que o writer espera) nunca fica sem orçamento por causa das de trás.
+        await buffer_budget.acquire(stripe.count * CHUNK_SIZE)
+        self.reserved += stripe.count * CHUNK_SIZE
+        try:
+            await self._fetch_stripe(stripe, rotation)
+        finally:
+            # Faixa curta (fim do arquivo) ou falha: devolve os chunks que não vieram
+            self._unreserve((stripe.count - stripe.received) * CHUNK_SIZE)
+
+    async def _fetch_stripe(self, stripe: _Stripe, rotation: int) -> None:
+        primary_cid = self.clients[0][0]
+        last_error: Optional[Exception] = None
+        for attempt in range(len(self.clients)):
+            cid, streamer = self.clients[(rotation + attempt) % len(self.clients)]
+            if attempt:
+                stripe_stats["retries"] += 1
+            # A carga do cliente principal já foi contada pela própria request.
+            counted = cid != primary_cid and cid in work_loads
+            if counted:
+                work_loads[cid] += 1
+            try:
+                # Em caso de retry, continua de onde o cliente anterior parou.
+                position = stripe.first + stripe.received
+                remaining = stripe.count - stripe.received
+                async with aclosing(streamer.stream_file(
+                        self.message_id, offset=position * CHUNK_SIZE, limit=remaining * CHUNK_SIZE,
+                        unique_id=self.unique_id)) as chunks:
+                    async for chunk in chunks:
+                        stripe.push(chunk)
+                        if len(chunk) < CHUNK_SIZE:
+                            break
+                stripe.finish()
+                if self.load is not None and all(s.finished for s in self._stripes):
+                    # Janela inteira baixada: só falta o cliente HTTP ler
+                    self.load.park()
+                return
+            except Exception as e:
+                last_error = e
+                self.on_error(cid, e)
+            finally:
+                if counted and cid in work_loads:
+                    work_loads[cid] -= 1
+
+        stripe_stats["failures"] += 1
+        stripe.finish(StripeFailed(f"Faixa {stripe.first}-{stripe.first + stripe.count - 1} falhou em todos os clientes: {last_error}"))
+
+    def __aiter__(self) -> "StripedReader":
+        return self
+
+    async def __anext__(self) -> bytes:
+        if self._held:
+            self._held = False
+            self._unreserve(CHUNK_SIZE)
+        while self._stripes:
+            chunk = await self._stripes[0].next()
+            if chunk is not None:
+                self._held = True
+                return chunk
+            self._stripes.popleft()
+            self._fill()
+        raise StopAsyncIteration
+
+    async def aclose(self) -> None:
+        stripes, self._stripes = self._stripes, deque()
+        self.unread += sum(len(chunk) for stripe in stripes for chunk in stripe.chunks)
+        for stripe in stripes:
+            if stripe.task is not None and not stripe.task.done():
+                stripe.task.cancel()
+        for stripe in stripes:
+            if stripe.task is not None:
+                try:
+                    await stripe.task
+                except asyncio.CancelledError:
+                    pass
+        self._held = False
+        self._unreserve(self.reserved)
+        if self.load is not None:
+            self.load.resume()
+
+
+def read_ahead(source: AsyncGenerator[bytes, None], load: Optional[StreamLoad] = None):
+    """Envolve a origem num ReadAhead se o pipeline estiver habilitado."""
+    if READ_AHEAD_DEPTH <= 0:
+        return source
+    return ReadAhead(source, READ_AHEAD_DEPTH, load)
+
+
+def get_read_ahead_stats() -> dict:
+    finished = read_ahead_stats["finished"]
+    return {
+        "depth": READ_AHEAD_DEPTH,
+        "streams": read_ahead_stats["streams"],
+        "peak_depth": read_ahead_stats["peak_depth"],
+        "avg_peak_depth": round(read_ahead_stats["depth_sum"] / finished, 2) if finished else 0.0,
+        "underruns": read_ahead_stats["underruns"],
+        "parking": {
+            "parks": park_stats["parks"],
+            "parked": park_stats["parked"],
+            "parked_seconds": round(park_stats["parked_seconds"], 1),
+        },
+        "striping": {
+            "enabled": STRIPE_MIN_BYTES > 0,
+            "stripe_chunks": STRIPE_CHUNKS,
+            **stripe_stats
+        }
+    }
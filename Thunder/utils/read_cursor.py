@@ -0,0 +1,176 @@
+# Thunder/utils/read_cursor.py
+
+import asyncio
+from typing import Dict, List, Optional, Set, Tuple
+
+from Thunder.utils.buffer_budget import buffer_budget
+from Thunder.utils.read_ahead import CHUNK_SIZE, READ_AHEAD_DEPTH, ReadAhead
+from Thunder.vars import Var
+
+CursorKey = Tuple[str, str]
+# Cursores estacionados por chave: o range principal, a sondagem do fim e um seek ou outro
+CURSORS_PER_KEY = 4
+
+read_cursor_stats = {
+    "parks": 0,
+    "resumed": 0,
+    "misses": 0,
+    "expired": 0,
+    "shed": 0,
+    "skipped_chunks": 0,
+}
+
+
+class ReadCursor:
+    """Leitura sequencial de um arquivo (read-ahead + posição) que sobrevive ao fim da request.
+
+    O player aborta o `bytes=0-` e pede `bytes=N-` logo depois: se N cai onde o download parou
+    (ou dentro do read-ahead), a request nova continua este mesmo download em vez de abrir outro.
+    """
+
+    def __init__(self, reader: ReadAhead, first_index: int, last_index: Optional[int],
+                 cid: int, streamer) -> None:
+        self.reader = reader
+        self.next_index = first_index
+        self.last_index = last_index
+        self.cid = cid
+        self.streamer = streamer
+        # Último chunk entregue: o cliente pode ter desconectado antes de receber tudo dele
+        self.held: Optional[bytes] = None
+        self.replay = False
+        self.exhausted = False
+        self.expiry: Optional[asyncio.TimerHandle] = None
+
+    def __aiter__(self) -> "ReadCursor":
+        return self
+
+    async def __anext__(self) -> bytes:
+        if self.replay:
+            self.replay = False
+            return self.held
+        try:
+            chunk = await self.reader.__anext__()
+        except Exception:
+            # Fim do arquivo ou erro: não há o que continuar depois (cancelamento não conta:
+            # o read-ahead segue intacto quando o cliente desconecta esperando um chunk)
+            self.exhausted = True
+            raise
+        self.held = chunk
+        self.next_index += 1
+        if len(chunk) < CHUNK_SIZE:
+            self.exhausted = True
+        return chunk
+
+    @property
+    def unread(self) -> int:
+        return self.reader.unread
+
+    @property
+    def resumable(self) -> bool:
+        return not self.exhausted and (self.last_index is None or self.next_index <= self.last_index)
+
+    def covers(self, index: int, last_index: int) -> bool:
+        if self.exhausted:
+            return False
+        if self.last_index is not None and self.last_index < last_index:
+            return False
+        first = self.next_index - 1 if self.held is not None else self.next_index
+        return first <= index <= self.next_index + READ_AHEAD_DEPTH
+
+    async def seek(self, index: int) -> None:
+        """Posiciona o cursor para que o próximo chunk entregue seja `index`."""
+        if index == self.next_index - 1:
+            self.replay = True
+            return
+        while self.next_index < index:
+            await self.__anext__()
+            read_cursor_stats["skipped_chunks"] += 1
+
+    async def aclose(self) -> None:
+        if self.expiry is not None:
+            self.expiry.cancel()
+            self.expiry = None
+        await self.reader.aclose()
+
+
+class ReadCursors:
+    """Cursores estacionados por (arquivo, endereço do cliente), por alguns segundos.
+
+    Cada chave guarda alguns cursores: a sondagem `bytes=-N` do moov/Cues não derruba o `bytes=0-`
+    que o player vai retomar logo depois, e espectadores atrás do mesmo proxy (TRUSTED_PROXIES
+    vazio) não derrubam os cursores uns dos outros. O que ninguém retoma sai pelo TTL.
+    """
+
+    def __init__(self, ttl: float, per_key: int = CURSORS_PER_KEY) -> None:
+        self.ttl = ttl
+        self.per_key = per_key
+        self.enabled = ttl > 0
+        self.cursors: Dict[CursorKey, List[ReadCursor]] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        buffer_budget.on_pressure = self.shed
+
+    def take(self, key: CursorKey, offset: int, end: int) -> Optional[ReadCursor]:
+        """Cursor que continua em `offset` e vai até `end`; os de outros trechos seguem estacionados."""
+        parked = self.cursors.get(key)
+        if not parked:
+            return None
+        index, last_index = offset // CHUNK_SIZE, end // CHUNK_SIZE
+        for cursor in reversed(parked):
+            if cursor.covers(index, last_index):
+                self._remove(key, cursor)
+                read_cursor_stats["resumed"] += 1
+                return cursor
+        read_cursor_stats["misses"] += 1
+        return None
+
+    def park(self, key: CursorKey, cursor: ReadCursor) -> None:
+        parked = self.cursors.setdefault(key, [])
+        if len(parked) >= self.per_key:
+            self._close(self._remove(key, parked[0]))
+            parked = self.cursors.setdefault(key, [])
+        # A carga da request que terminou não acompanha o cursor
+        cursor.reader.load = None
+        parked.append(cursor)
+        cursor.expiry = asyncio.get_running_loop().call_later(self.ttl, self._expire, key, cursor)
+        read_cursor_stats["parks"] += 1
+
+    def shed(self) -> None:
+        """Orçamento de buffer no teto: o cursor estacionado mais antigo libera o que segura."""
+        if not self.cursors:
+            return
+        key = next(iter(self.cursors))
+        read_cursor_stats["shed"] += 1
+        self._close(self._remove(key, self.cursors[key][0]))
+
+    def _remove(self, key: CursorKey, cursor: ReadCursor) -> ReadCursor:
+        parked = self.cursors[key]
+        parked.remove(cursor)
+        if not parked:
+            del self.cursors[key]
+        if cursor.expiry is not None:
+            cursor.expiry.cancel()
+            cursor.expiry = None
+        return cursor
+
+    def _expire(self, key: CursorKey, cursor: ReadCursor) -> None:
+        cursor.expiry = None
+        if cursor in self.cursors.get(key, ()):
+            self._remove(key, cursor)
+            read_cursor_stats["expired"] += 1
+            self._close(cursor)
+
+    def _close(self, cursor: ReadCursor) -> None:
+        task = asyncio.create_task(cursor.aclose())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "ttl_seconds": self.ttl,
+            "parked": sum(len(parked) for parked in self.cursors.values()),
+            **read_cursor_stats
+        }
+
+
+read_cursors = ReadCursors(Var.READ_CURSOR_SECONDS)
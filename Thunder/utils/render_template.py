@@ -11,6 +11,7 @@ from Thunder.bot import StreamBot
 from Thunder.server.exceptions import InvalidHash
 from Thunder.utils.file_properties import get_fname, get_uniqid
 from Thunder.utils.logger import logger
+from Thunder.utils.seek_index import known_seek_index
 from Thunder.vars import Var
 
 template_env = Environment(
@@ -40,17 +41,24 @@ async def render_page(id: int, secure_hash: str, requested_action: str | None =
         #     raise InvalidHash("File unique ID or secure hash mismatch during rendering.")
         
         quoted_filename = urllib.parse.quote(file_name.replace('/', '_'))
-        # Adiciona um cache-buster (timestamp) para forçar o navegador a ignorar erros antigos do cache
-        import time
-        t = int(time.time())
-        src = urllib.parse.urljoin(Var.URL, f'{secure_hash}{id}/{quoted_filename}?t={t}')
+        # URL estável: o arquivo é imutável e navegador/CDN podem reaproveitar o cache (ETag)
+        src = urllib.parse.urljoin(Var.URL, f'{secure_hash}{id}/{quoted_filename}')
+        seek_src = urllib.parse.urljoin(Var.URL, f'seek/{secure_hash}{id}/{quoted_filename}')
+        player_src = src
+        if requested_action == 'stream' and file_unique_id:
+            index = await known_seek_index(file_unique_id)
+            if index and index.get('fragmented'):
+                # MP4 fragmentado: o player pede só os segmentos que toca, em vez de ranges especulativos
+                player_src = urllib.parse.urljoin(Var.URL, f'hls/{secure_hash}{id}/{quoted_filename}.m3u8')
         safe_filename = html_module.escape(file_name)
         if requested_action == 'stream':
             template = template_env.get_template('req.html')
             context = {
                 'heading': f"View {safe_filename}",
                 'file_name': safe_filename,
-                'src': src
+                'src': src,
+                'player_src': player_src,
+                'seek_src': seek_src
             }
         else:
             template = template_env.get_template('dl.html')
@@ -0,0 +1,626 @@
+# Thunder/utils/seek_index.py
+
+import asyncio
+import bisect
+import struct
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+from Thunder.utils.chunk_cache import CHUNK_SIZE
+from Thunder.utils.client_slots import Flow, current_flow
+from Thunder.utils.database import db
+from Thunder.utils.logger import logger
+from Thunder.utils.ttl_cache import TTLCache
+from Thunder.vars import Var
+
+# read(offset, length) -> bytes exatos do arquivo
+Reader = Callable[[int, int], Awaitable[bytes]]
+
+# `moov`/Cues maiores que isso não são indexados (arquivo patológico, não vale o download)
+MAX_INDEX_BYTES = 16 * 1024 * 1024
+# Caixas de topo do MP4 visitadas antes de desistir (o índice de um fragmentado vem do sidx/mfra)
+MAX_TOP_LEVEL_BOXES = 64
+# Sem tabela de sync samples (todo frame é chave): um ponto por segundo basta
+MIN_KEYFRAME_GAP = 1.0
+
+SEEK_PREFETCH = Var.SEEK_PREFETCH_MB * CHUNK_SIZE
+
+SEEK_INDEX_CACHE = TTLCache(maxsize=2000, ttl=24 * 3600)
+seek_index_stats = {"built": 0, "unsupported": 0, "failed": 0, "lookups": 0, "prefetches": 0, "superseded": 0}
+
+_builders: Dict[str, asyncio.Task] = {}
+_tasks: Set[asyncio.Task] = set()
+# Um prefetch de seek por (arquivo, espectador): um seek novo cancela o anterior
+_prefetches: Dict[Tuple[str, str], asyncio.Task] = {}
+
+# --- MP4 ---
+
+
+def _boxes(data: bytes, start: int = 0, end: Optional[int] = None) -> Iterator[Tuple[bytes, int, int]]:
+    """(tipo, início do conteúdo, fim) de cada caixa em data[start:end]."""
+    end = len(data) if end is None else end
+    pos = start
+    while pos + 8 <= end:
+        size, kind = struct.unpack_from(">I4s", data, pos)
+        header = 8
+        if size == 1:
+            if pos + 16 > end:
+                return
+            size = struct.unpack_from(">Q", data, pos + 8)[0]
+            header = 16
+        elif size == 0:
+            size = end - pos
+        if size < header or pos + size > end:
+            return
+        yield kind, pos + header, pos + size
+        pos += size
+
+
+def _child(data: bytes, start: int, end: int, kind: bytes) -> Optional[Tuple[int, int]]:
+    for child, child_start, child_end in _boxes(data, start, end):
+        if child == kind:
+            return child_start, child_end
+    return None
+
+
+def _table(data: bytes, box: Tuple[int, int], fmt: str) -> List[Any]:
+    """Entradas de stts/stss/stsc/stco/co64: versão+flags, contagem e `count` registros de `fmt`."""
+    start = box[0] + 4
+    count = struct.unpack_from(">I", data, start)[0]
+    count = min(count, (box[1] - start - 4) // struct.calcsize(">" + fmt))
+    values = struct.unpack_from(">" + fmt * count, data, start + 4)
+    if len(fmt) == 1:
+        return list(values)
+    return [values[i:i + len(fmt)] for i in range(0, len(values), len(fmt))]
+
+
+def _parse_trak(data: bytes, start: int, end: int) -> Optional[Dict[str, Any]]:
+    mdia = _child(data, start, end, b"mdia")
+    if mdia is None:
+        return None
+    hdlr = _child(data, *mdia, b"hdlr")
+    mdhd = _child(data, *mdia, b"mdhd")
+    minf = _child(data, *mdia, b"minf")
+    if not (hdlr and mdhd and minf):
+        return None
+    stbl = _child(data, *minf, b"stbl")
+    if stbl is None:
+        return None
+
+    if data[mdhd[0]] == 1:
+        timescale, duration = struct.unpack_from(">IQ", data, mdhd[0] + 20)
+    else:
+        timescale, duration = struct.unpack_from(">II", data, mdhd[0] + 12)
+    tkhd = _child(data, start, end, b"tkhd")
+    track_id = None
+    if tkhd is not None:
+        track_id = struct.unpack_from(">I", data, tkhd[0] + (20 if data[tkhd[0]] == 1 else 12))[0]
+    boxes = {kind: (s, e) for kind, s, e in _boxes(data, *stbl)}
+    return {
+        "track_id": track_id,
+        "handler": data[hdlr[0] + 8:hdlr[0] + 12],
+        "timescale": timescale or 1,
+        "duration": duration,
+        "boxes": boxes,
+    }
+
+
+def _mp4_keyframes(data: bytes, track: Dict[str, Any]) -> List[List[float]]:
+    boxes = track["boxes"]
+    if not (b"stts" in boxes and b"stsc" in boxes and b"stsz" in boxes
+            and (b"stco" in boxes or b"co64" in boxes)):
+        return []
+
+    stsz = boxes[b"stsz"]
+    sample_size, sample_count = struct.unpack_from(">II", data, stsz[0] + 4)
+    if sample_count == 0:
+        # MP4 fragmentado: as amostras estão nos `moof`, não no `moov`
+        return []
+    sizes = (list(struct.unpack_from(f">{sample_count}I", data, stsz[0] + 12))
+             if sample_size == 0 else None)
+    chunk_offsets = (_table(data, boxes[b"stco"], "I") if b"stco" in boxes
+                     else _table(data, boxes[b"co64"], "Q"))
+    stsc = _table(data, boxes[b"stsc"], "III")
+    stts = _table(data, boxes[b"stts"], "II")
+    sync = set(_table(data, boxes[b"stss"], "I")) if b"stss" in boxes else None
+
+    # Tempo de decodificação de cada amostra (1-based) a partir das sequências do stts
+    run_starts, run_times, run_deltas = [], [], []
+    sample, time = 1, 0
+    for count, delta in stts:
+        run_starts.append(sample)
+        run_times.append(time)
+        run_deltas.append(delta)
+        sample += count
+        time += count * delta
+
+    def sample_time(n: int) -> float:
+        i = bisect.bisect_right(run_starts, n) - 1
+        return (run_times[i] + (n - run_starts[i]) * run_deltas[i]) / track["timescale"]
+
+    keyframes: List[List[float]] = []
+    sample = 1
+    for i, (first_chunk, per_chunk, _) in enumerate(stsc):
+        last_chunk = stsc[i + 1][0] - 1 if i + 1 < len(stsc) else len(chunk_offsets)
+        for chunk in range(first_chunk, min(last_chunk, len(chunk_offsets)) + 1):
+            offset = chunk_offsets[chunk - 1]
+            for _ in range(per_chunk):
+                if sample > sample_count:
+                    return keyframes
+                if sync is None or sample in sync:
+                    t = sample_time(sample)
+                    if sync is not None or not keyframes or t - keyframes[-1][0] >= MIN_KEYFRAME_GAP:
+                        keyframes.append([round(t, 3), offset])
+                offset += sizes[sample - 1] if sizes is not None else sample_size
+                sample += 1
+    return keyframes
+
+
+def _main_track(data: bytes) -> Optional[Dict[str, Any]]:
+    """Primeira trilha de vídeo (ou a primeira trilha, se não houver vídeo)."""
+    tracks = [t for t in (_parse_trak(data, s, e) for kind, s, e in _boxes(data) if kind == b"trak") if t]
+    if not tracks:
+        return None
+    return next((t for t in tracks if t["handler"] == b"vide"), tracks[0])
+
+
+def _movie_duration(data: bytes) -> Optional[float]:
+    """Duração do filme em segundos: mehd (MP4 fragmentado) ou mvhd."""
+    mvhd = _child(data, 0, len(data), b"mvhd")
+    if mvhd is None:
+        return None
+    long = data[mvhd[0]] == 1
+    timescale = struct.unpack_from(">I", data, mvhd[0] + (20 if long else 12))[0] or 1
+    duration = struct.unpack_from(">Q" if long else ">I", data, mvhd[0] + (24 if long else 16))[0]
+    mvex = _child(data, 0, len(data), b"mvex")
+    mehd = _child(data, *mvex, b"mehd") if mvex else None
+    if mehd is not None:
+        duration = struct.unpack_from(">Q" if data[mehd[0]] == 1 else ">I", data, mehd[0] + 4)[0]
+    return duration / timescale if duration else None
+
+
+def parse_moov(data: bytes) -> Optional[Dict[str, Any]]:
+    """Índice de keyframes de um MP4 progressivo, a partir das tabelas de amostras da trilha principal."""
+    track = _main_track(data)
+    if track is None:
+        return None
+    keyframes = _mp4_keyframes(data, track)
+    if not keyframes:
+        return None
+    return {
+        "container": "mp4",
+        "duration": round(track["duration"] / track["timescale"], 3),
+        "keyframes": keyframes,
+    }
+
+
+def _sidx_fragments(anchor: int, data: bytes) -> Tuple[List[List[float]], float]:
+    """Referências do sidx: ([segundos, offset do moof], fim em segundos). Offsets contam do fim do sidx."""
+    version = data[0]
+    timescale = struct.unpack_from(">I", data, 8)[0] or 1
+    if version == 0:
+        earliest, first_offset = struct.unpack_from(">II", data, 12)
+        pos = 20
+    else:
+        earliest, first_offset = struct.unpack_from(">QQ", data, 12)
+        pos = 28
+    count = struct.unpack_from(">H", data, pos + 2)[0]
+    pos += 4
+
+    fragments: List[List[float]] = []
+    offset, time = anchor + first_offset, earliest
+    for _ in range(count):
+        reference, duration, _ = struct.unpack_from(">III", data, pos)
+        pos += 12
+        if reference >> 31:
+            # sidx hierárquico (aponta para outro sidx): não suportado
+            return [], 0.0
+        fragments.append([round(time / timescale, 3), offset])
+        offset += reference & 0x7FFFFFFF
+        time += duration
+    return fragments, time / timescale
+
+
+async def _mfra_fragments(read: Reader, file_size: int, track: Dict[str, Any]) -> Tuple[List[List[float]], int]:
+    """Pontos de acesso aleatório do mfra (fim do arquivo): ([segundos, offset do moof], início do mfra)."""
+    if file_size < 16:
+        return [], file_size
+    tail = await read(file_size - 16, 16)
+    if tail[4:8] != b"mfro":
+        return [], file_size
+    mfra_size = struct.unpack_from(">I", tail, 12)[0]
+    if not 16 <= mfra_size <= min(file_size, MAX_INDEX_BYTES):
+        return [], file_size
+    mfra_start = file_size - mfra_size
+    data = await read(mfra_start, mfra_size)
+    if data[4:8] != b"mfra":
+        return [], file_size
+
+    fragments: List[List[float]] = []
+    for kind, start, _ in _boxes(data, 8):
+        if kind != b"tfra":
+            continue
+        version = data[start]
+        track_id, lengths, count = struct.unpack_from(">III", data, start + 4)
+        if track_id != track["track_id"]:
+            continue
+        extra = ((lengths >> 4) & 3) + ((lengths >> 2) & 3) + (lengths & 3) + 3
+        fmt, width = (">QQ", 16) if version == 1 else (">II", 8)
+        pos = start + 16
+        seen = set()
+        for _ in range(count):
+            time, moof_offset = struct.unpack_from(fmt, data, pos)
+            pos += width + extra
+            if moof_offset not in seen:
+                seen.add(moof_offset)
+                fragments.append([round(time / track["timescale"], 3), moof_offset])
+    fragments.sort()
+    return fragments, mfra_start
+
+
+async def _index_fragmented(read: Reader, file_size: int, moov: bytes,
+                            sidx: Optional[Tuple[int, bytes]], first_moof: int) -> Optional[Dict[str, Any]]:
+    """MP4 fragmentado: cada moof+mdat começa num keyframe; o índice vem do sidx ou do mfra."""
+    track = _main_track(moov)
+    if track is None:
+        return None
+    media_end = file_size
+    end_time = None
+    if sidx is not None:
+        fragments, end_time = _sidx_fragments(*sidx)
+    else:
+        fragments, media_end = await _mfra_fragments(read, file_size, track)
+    if not fragments:
+        return None
+
+    duration = _movie_duration(moov) or end_time
+    if not duration:
+        # Sem mehd: o último fragmento dura o mesmo que a média dos anteriores
+        gaps = fragments[-1][0] - fragments[0][0]
+        duration = fragments[-1][0] + (gaps / (len(fragments) - 1) if len(fragments) > 1 else 0)
+    return {
+        "container": "mp4",
+        "fragmented": True,
+        "duration": round(duration, 3),
+        "init_size": min(first_moof, fragments[0][1]),
+        "media_end": media_end,
+        "keyframes": fragments,
+    }
+
+
+async def index_mp4(read: Reader, file_size: int) -> Optional[Dict[str, Any]]:
+    offset = 0
+    moov: Optional[bytes] = None
+    sidx: Optional[Tuple[int, bytes]] = None
+    for _ in range(MAX_TOP_LEVEL_BOXES):
+        if offset + 8 > file_size:
+            return None
+        header = await read(offset, 16)
+        size, kind = struct.unpack_from(">I4s", header)
+        header_size = 8
+        if size == 1:
+            size = struct.unpack_from(">Q", header, 8)[0]
+            header_size = 16
+        elif size == 0:
+            size = file_size - offset
+        if size < header_size:
+            return None
+
+        if kind in (b"moov", b"sidx"):
+            if size > MAX_INDEX_BYTES:
+                logger.debug(f"{kind.decode()} de {size} bytes excede o limite do índice")
+                return None
+            body = await read(offset + header_size, size - header_size)
+            if kind == b"moov":
+                if _child(body, 0, len(body), b"mvex") is None:
+                    return parse_moov(body)
+                moov = body
+            elif moov is not None and sidx is None:
+                # O primeiro sidx indexa o arquivo inteiro; offsets contam a partir do fim dele
+                sidx = (offset + size, body)
+        elif kind == b"moof":
+            if moov is None:
+                return None
+            return await _index_fragmented(read, file_size, moov, sidx, offset)
+        offset += size
+    return None
+
+# --- Matroska / WebM ---
+
+
+EBML_HEADER = 0x1A45DFA3
+MKV_SEGMENT = 0x18538067
+MKV_SEEK_HEAD = 0x114D9B74
+MKV_SEEK = 0x4DBB
+MKV_SEEK_ID = 0x53AB
+MKV_SEEK_POSITION = 0x53AC
+MKV_INFO = 0x1549A966
+MKV_TIMECODE_SCALE = 0x2AD7B1
+MKV_DURATION = 0x4489
+MKV_TRACKS = 0x1654AE6B
+MKV_TRACK_ENTRY = 0xAE
+MKV_TRACK_NUMBER = 0xD7
+MKV_TRACK_TYPE = 0x83
+MKV_CUES = 0x1C53BB6B
+MKV_CUE_POINT = 0xBB
+MKV_CUE_TIME = 0xB3
+MKV_CUE_TRACK_POSITIONS = 0xB7
+MKV_CUE_TRACK = 0xF7
+MKV_CUE_CLUSTER_POSITION = 0xF1
+MKV_CLUSTER = 0x1F43B675
+
+
+def _vint(data: bytes, pos: int, keep_marker: bool) -> Tuple[int, int, int]:
+    """Inteiro de tamanho variável do EBML: (valor, próxima posição, largura em bytes)."""
+    first = data[pos]
+    width, mask = 1, 0x80
+    while width <= 8 and not first & mask:
+        width += 1
+        mask >>= 1
+    if width > 8:
+        raise ValueError("vint EBML inválido")
+    value = first if keep_marker else first & (mask - 1)
+    for byte in data[pos + 1:pos + width]:
+        value = (value << 8) | byte
+    return value, pos + width, width
+
+
+def _ebml_element(data: bytes, pos: int) -> Tuple[int, Optional[int], int]:
+    """(id, tamanho do conteúdo ou None se desconhecido, início do conteúdo)."""
+    element_id, pos, _ = _vint(data, pos, keep_marker=True)
+    size, pos, width = _vint(data, pos, keep_marker=False)
+    if size == (1 << (7 * width)) - 1:
+        size = None
+    return element_id, size, pos
+
+
+def _ebml_children(data: bytes, start: int, end: int) -> Iterator[Tuple[int, int, int]]:
+    pos = start
+    while pos < end:
+        element_id, size, data_start = _ebml_element(data, pos)
+        if size is None:
+            return
+        yield element_id, data_start, data_start + size
+        pos = data_start + size
+
+
+def _uint(data: bytes, start: int, end: int) -> int:
+    return int.from_bytes(data[start:end], "big")
+
+
+def _parse_cues(data: bytes, segment_start: int, scale: int, video_track: Optional[int]) -> List[List[float]]:
+    keyframes: List[List[float]] = []
+    for element_id, start, end in _ebml_children(data, 0, len(data)):
+        if element_id != MKV_CUE_POINT:
+            continue
+        cue_time, position = None, None
+        for child_id, child_start, child_end in _ebml_children(data, start, end):
+            if child_id == MKV_CUE_TIME:
+                cue_time = _uint(data, child_start, child_end)
+            elif child_id == MKV_CUE_TRACK_POSITIONS and position is None:
+                track, cluster = None, None
+                for pos_id, pos_start, pos_end in _ebml_children(data, child_start, child_end):
+                    if pos_id == MKV_CUE_TRACK:
+                        track = _uint(data, pos_start, pos_end)
+                    elif pos_id == MKV_CUE_CLUSTER_POSITION:
+                        cluster = _uint(data, pos_start, pos_end)
+                if cluster is not None and (video_track is None or track == video_track):
+                    position = cluster
+        if cue_time is not None and position is not None:
+            keyframes.append([round(cue_time * scale / 1e9, 3), segment_start + position])
+    keyframes.sort()
+    return keyframes
+
+
+async def index_matroska(read: Reader, file_size: int) -> Optional[Dict[str, Any]]:
+    head = await read(0, min(file_size, CHUNK_SIZE))
+    element_id, size, pos = _ebml_element(head, 0)
+    if element_id != EBML_HEADER or size is None:
+        return None
+    element_id, _, segment_start = _ebml_element(head, pos + size)
+    if element_id != MKV_SEGMENT:
+        return None
+
+    scale, duration, video_track = 1_000_000, None, None
+    cues_position: Optional[int] = None
+    cues: Optional[bytes] = None
+    pos = segment_start
+    while pos < len(head) - 12:
+        element_id, size, data_start = _ebml_element(head, pos)
+        if size is None or element_id == MKV_CLUSTER:
+            break
+        data_end = data_start + size
+        if element_id in (MKV_SEEK_HEAD, MKV_INFO, MKV_TRACKS, MKV_CUES) and data_end > len(head):
+            if size > MAX_INDEX_BYTES:
+                break
+            body = await read(data_start, size)
+            element_data, element_start, element_end = body, 0, len(body)
+        else:
+            element_data, element_start, element_end = head, data_start, data_end
+
+        if element_id == MKV_SEEK_HEAD:
+            for seek_id, seek_start, seek_end in _ebml_children(element_data, element_start, element_end):
+                if seek_id != MKV_SEEK:
+                    continue
+                target, position = None, None
+                for child_id, child_start, child_end in _ebml_children(element_data, seek_start, seek_end):
+                    if child_id == MKV_SEEK_ID:
+                        target = _uint(element_data, child_start, child_end)
+                    elif child_id == MKV_SEEK_POSITION:
+                        position = _uint(element_data, child_start, child_end)
+                if target == MKV_CUES and position is not None:
+                    cues_position = position
+        elif element_id == MKV_INFO:
+            for child_id, child_start, child_end in _ebml_children(element_data, element_start, element_end):
+                if child_id == MKV_TIMECODE_SCALE:
+                    scale = _uint(element_data, child_start, child_end) or scale
+                elif child_id == MKV_DURATION:
+                    fmt = ">f" if child_end - child_start == 4 else ">d"
+                    duration = struct.unpack_from(fmt, element_data, child_start)[0]
+        elif element_id == MKV_TRACKS:
+            for entry_id, entry_start, entry_end in _ebml_children(element_data, element_start, element_end):
+                if entry_id != MKV_TRACK_ENTRY:
+                    continue
+                number, kind = None, None
+                for child_id, child_start, child_end in _ebml_children(element_data, entry_start, entry_end):
+                    if child_id == MKV_TRACK_NUMBER:
+                        number = _uint(element_data, child_start, child_end)
+                    elif child_id == MKV_TRACK_TYPE:
+                        kind = _uint(element_data, child_start, child_end)
+                if kind == 1 and video_track is None:
+                    video_track = number
+        elif element_id == MKV_CUES:
+            cues = element_data[element_start:element_end]
+        pos = data_end
+
+    if cues is None and cues_position is not None:
+        # Cues no fim do arquivo (o normal): o SeekHead diz onde
+        header = await read(segment_start + cues_position, 12)
+        element_id, size, data_start = _ebml_element(header, 0)
+        if element_id != MKV_CUES or size is None or size > MAX_INDEX_BYTES:
+            return None
+        cues = await read(segment_start + cues_position + data_start, size)
+    if cues is None:
+        return None
+
+    keyframes = _parse_cues(cues, segment_start, scale, video_track)
+    if not keyframes:
+        return None
+    return {
+        "container": "matroska",
+        "duration": round(duration * scale / 1e9, 3) if duration else None,
+        "keyframes": keyframes,
+    }
+
+# --- Cache e consulta ---
+
+
+def stream_reader(streamer: Any, message_id: int, unique_id: str) -> Reader:
+    """Leitura por offset em cima do stream_file: passa pelo cache de chunks e pelos fixados."""
+    async def read(offset: int, length: int) -> bytes:
+        parts = []
+        async for chunk in streamer.stream_file(
+                message_id, offset=offset, limit=length, unique_id=unique_id):
+            parts.append(chunk)
+        skip = offset % CHUNK_SIZE
+        return b"".join(parts)[skip:skip + length]
+    return read
+
+
+async def build_seek_index(read: Reader, file_size: int) -> Dict[str, Any]:
+    head = await read(0, min(file_size, 16))
+    try:
+        if head[:4] == EBML_HEADER.to_bytes(4, "big"):
+            index = await index_matroska(read, file_size)
+        elif head[4:8] in (b"ftyp", b"moov", b"free", b"mdat", b"wide", b"skip"):
+            index = await index_mp4(read, file_size)
+        else:
+            index = None
+    except (struct.error, ValueError, IndexError) as e:
+        # Container corrompido ou fora do padrão: fica registrado como sem índice
+        logger.debug(f"Container ilegível para o índice de seek: {type(e).__name__}: {e}")
+        index = None
+    return index or {"container": None, "duration": None, "keyframes": []}
+
+
+async def known_seek_index(unique_id: str) -> Optional[Dict[str, Any]]:
+    """Índice já construído (memória ou Mongo), sem ler o arquivo."""
+    index = SEEK_INDEX_CACHE.get(unique_id)
+    if index is None:
+        index = await db.get_seek_index(unique_id)
+        if index is not None:
+            SEEK_INDEX_CACHE[unique_id] = index
+    return index
+
+
+async def get_seek_index(file_info: Dict[str, Any], streamer: Any) -> Dict[str, Any]:
+    """Índice do arquivo: memória, depois Mongo, depois lido do próprio arquivo (uma vez por unique_id)."""
+    unique_id = file_info["unique_id"]
+    index = SEEK_INDEX_CACHE.get(unique_id)
+    if index is not None:
+        return index
+
+    builder = _builders.get(unique_id)
+    if builder is None:
+        # Task próprio: quem pediu primeiro pode desconectar sem deixar os outros esperando
+        builder = asyncio.create_task(_build_seek_index(file_info, streamer))
+        _builders[unique_id] = builder
+        builder.add_done_callback(lambda task: _builder_done(unique_id, task))
+    return await asyncio.shield(builder)
+
+
+def _builder_done(unique_id: str, task: asyncio.Task) -> None:
+    _builders.pop(unique_id, None)
+    if not task.cancelled():
+        task.exception()  # quem não estava esperando não gera aviso de erro não tratado
+
+
+async def _build_seek_index(file_info: Dict[str, Any], streamer: Any) -> Dict[str, Any]:
+    unique_id = file_info["unique_id"]
+    try:
+        index = await db.get_seek_index(unique_id)
+        if index is None:
+            read = stream_reader(streamer, file_info["message_id"], unique_id)
+            index = await build_seek_index(read, file_info.get("file_size") or 0)
+            if index["container"]:
+                seek_index_stats["built"] += 1
+                logger.debug(f"🧭 Índice de seek do {unique_id}: {index['container']}, "
+                             f"{len(index['keyframes'])} keyframes")
+            else:
+                seek_index_stats["unsupported"] += 1
+            await db.save_seek_index(unique_id, index)
+        SEEK_INDEX_CACHE[unique_id] = index
+        return index
+    except Exception:
+        seek_index_stats["failed"] += 1
+        raise
+
+
+def keyframe_at(index: Dict[str, Any], seconds: float) -> Optional[Tuple[List[float], Optional[List[float]]]]:
+    """Último keyframe em ou antes de `seconds`, e o seguinte (fim natural do range do seek)."""
+    seek_index_stats["lookups"] += 1
+    keyframes = index.get("keyframes") or []
+    if not keyframes:
+        return None
+    i = max(0, bisect.bisect_right(keyframes, [seconds, float("inf")]) - 1)
+    following = keyframes[i + 1] if i + 1 < len(keyframes) else None
+    return keyframes[i], following
+
+
+def schedule_seek_prefetch(streamer: Any, message_id: int, unique_id: str,
+                           offset: int, end: int, viewer: str) -> None:
+    """Baixa em segundo plano até SEEK_PREFETCH_MB a partir do keyframe, com prioridade de player."""
+    end = min(end, offset + SEEK_PREFETCH)
+    if SEEK_PREFETCH <= 0 or end <= offset:
+        return
+
+    key = (unique_id, viewer)
+    previous = _prefetches.pop(key, None)
+    if previous is not None and not previous.done():
+        # O espectador já foi para outro ponto: o keyframe anterior não interessa mais
+        previous.cancel()
+        seek_index_stats["superseded"] += 1
+
+    async def prefetch() -> None:
+        current_flow.set(Flow("stream"))
+        try:
+            async for _ in streamer.stream_file(
+                    message_id, offset=offset, limit=end - offset, unique_id=unique_id):
+                pass
+        except Exception as e:
+            logger.debug(f"Falha no prefetch de seek do ID {message_id}: {type(e).__name__}: {e}")
+
+    seek_index_stats["prefetches"] += 1
+    task = asyncio.create_task(prefetch())
+    _tasks.add(task)
+    _prefetches[key] = task
+    task.add_done_callback(lambda done: _prefetch_done(key, done))
+
+
+def _prefetch_done(key: Tuple[str, str], task: asyncio.Task) -> None:
+    _tasks.discard(task)
+    if _prefetches.get(key) is task:
+        del _prefetches[key]
+
+
+def get_seek_index_stats() -> dict:
+    return {"prefetch_mb": Var.SEEK_PREFETCH_MB, "cached": len(SEEK_INDEX_CACHE), **seek_index_stats}
@@ -0,0 +1,84 @@
+# Thunder/utils/ttl_cache.py
+
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional, Tuple
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Dicionário com limite de tamanho e expiração por TTL.
+
+    A expiração é amortizada: cada escrita varre algumas das entradas mais antigas,
+    e leituras descartam a entrada vencida na hora. Nenhum task por chave.
+    """
+
+    PURGE_BATCH = 16
+
+    def __init__(self, maxsize: int, ttl: float) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __getitem__(self, key: Hashable) -> Any:
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: Hashable, value: Any) -> None:
+        self.set(key, value)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        item = self._data.get(key)
+        if item is None:
+            return default
+        expires_at, value = item
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            self.expirations += 1
+            return default
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        now = time.monotonic()
+        # Reinsere no fim para a ordem seguir a idade da entrada.
+        self._data.pop(key, None)
+        self._data[key] = (now + (self.ttl if ttl is None else ttl), value)
+        self._purge(now)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        item = self._data.pop(key, None)
+        if item is None:
+            return default
+        return item[1]
+
+    def _purge(self, now: float) -> None:
+        for _ in range(self.PURGE_BATCH):
+            if not self._data:
+                return
+            key, (expires_at, _) = next(iter(self._data.items()))
+            if expires_at > now:
+                return
+            del self._data[key]
+            self.expirations += 1
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
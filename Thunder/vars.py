@@ -45,6 +45,7 @@ class Var:
 
     PORT: int = int(os.getenv("PORT", "8080"))
     BIND_ADDRESS: str = os.getenv("BIND_ADDRESS", "0.0.0.0")
+    TRUSTED_PROXIES: str = os.getenv("TRUSTED_PROXIES", "").strip()
     PING_INTERVAL: int = int(os.getenv("PING_INTERVAL", "840"))
     NO_PORT: bool = str_to_bool(os.getenv("NO_PORT", "True"))
 
@@ -109,3 +110,32 @@ class Var:
 
     # --- SESSION SETTINGS ---
     STRING_SESSION: str = os.getenv("STRING_SESSION", "").strip()
+
+    # --- STREAMING PIPELINE ---
+    READ_AHEAD_CHUNKS: int = int(os.getenv("READ_AHEAD_CHUNKS", "4"))
+    STREAM_BUFFER_MB: int = int(os.getenv("STREAM_BUFFER_MB", "8"))
+    BUFFER_BUDGET_MB: int = int(os.getenv("BUFFER_BUDGET_MB", "128"))
+    READ_CURSOR_SECONDS: float = float(os.getenv("READ_CURSOR_SECONDS", "10"))
+    STRIPE_MIN_MB: int = int(os.getenv("STRIPE_MIN_MB", "32"))
+    STRIPE_CHUNKS: int = int(os.getenv("STRIPE_CHUNKS", "2"))
+    STRIPE_MAX_CLIENTS: int = int(os.getenv("STRIPE_MAX_CLIENTS", "4"))
+    EXACT_RANGE_MAX_KB: int = int(os.getenv("EXACT_RANGE_MAX_KB", "512"))
+    DC_AFFINITY_SLACK: int = int(os.getenv("DC_AFFINITY_SLACK", "2"))
+    CLIENT_WEIGHTS: str = os.getenv("CLIENT_WEIGHTS", "99:4").strip()
+    MAX_CONCURRENT_PER_CLIENT: int = int(os.getenv("MAX_CONCURRENT_PER_CLIENT", "100"))
+    CLIENT_QUEUE_TIMEOUT: float = float(os.getenv("CLIENT_QUEUE_TIMEOUT", "5"))
+    PRIORITY_CLASSES: str = os.getenv("PRIORITY_CLASSES", "stream:4,download:1").strip()
+    HEDGE_PERCENTILE: float = float(os.getenv("HEDGE_PERCENTILE", "95"))
+    SEEK_PREFETCH_MB: int = int(os.getenv("SEEK_PREFETCH_MB", "2"))
+    HLS_SEGMENT_SECONDS: float = float(os.getenv("HLS_SEGMENT_SECONDS", "6"))
+    MEDIA_CACHE_CONTROL: str = os.getenv("MEDIA_CACHE_CONTROL", "public, max-age=2592000, immutable").strip()
+    WARMUP_DCS: str = os.getenv("WARMUP_DCS", "auto").strip().lower()
+
+    # --- STREAMING CACHE ---
+    CHUNK_CACHE_MB: int = int(os.getenv("CHUNK_CACHE_MB", "64"))
+    DISK_CACHE_DIR: str = os.getenv("DISK_CACHE_DIR", "cache/chunks").strip()
+    DISK_CACHE_MB: int = int(os.getenv("DISK_CACHE_MB", "0"))
+    DISK_CACHE_POLICY: str = os.getenv("DISK_CACHE_POLICY", "lru").strip().lower()
+    PIN_CACHE_MB: int = int(os.getenv("PIN_CACHE_MB", "32"))
+    PIN_HEAD_MB: int = int(os.getenv("PIN_HEAD_MB", "2"))
+    PIN_TAIL_MB: int = int(os.getenv("PIN_TAIL_MB", "2"))
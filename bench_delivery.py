@@ -0,0 +1,124 @@
+"""Benchmark do caminho de entrega: bytes/s por núcleo do servidor HTTP servindo chunks já em cache.
+
+O Telegram é simulado (get_file_part devolve fatias de um arquivo em memória) e o cache é aquecido
+antes da medição, então o que se mede é só stream_routes -> aiohttp -> socket. Os clientes rodam
+em processos separados; o número reportado é a CPU do processo do servidor.
+
+    python bench_delivery.py [--size-mb 64] [--range-mb 0] [--clients 4] [--rounds 8]
+
+Com --range-mb cada request pede um range desse tamanho num offset desalinhado (como um player),
+o que exercita o recorte do início e do fim de cada resposta.
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import socket
+import time
+from types import SimpleNamespace
+
+for key, value in {"API_ID": "1", "API_HASH": "bench", "BOT_TOKEN": "1:bench",
+                   "BIN_CHANNEL": "-100", "DATABASE_URL": "mongodb://localhost"}.items():
+    os.environ.setdefault(key, value)
+
+from aiohttp import web
+from pyrogram.file_id import FileId, FileType
+
+CHUNK_SIZE = 1024 * 1024
+MESSAGE_ID = 1
+UNIQUE_ID = "bench0"
+
+
+class FakeClient:
+    name = "bench"
+
+    def __init__(self, size: int) -> None:
+        self.file_id = FileId(file_type=FileType.DOCUMENT, dc_id=4, media_id=1,
+                              access_hash=1, file_reference=b"bench").encode()
+        self.size = size
+
+    async def get_messages(self, chat_id, message_id):
+        return SimpleNamespace(id=message_id, empty=False, document=SimpleNamespace(
+            file_id=self.file_id, file_unique_id=UNIQUE_ID, file_size=self.size,
+            file_name="bench.bin", mime_type="application/octet-stream"))
+
+
+def fetch(port: int, size: int, range_size: int, rounds: int, seed: int) -> int:
+    """Cliente HTTP mínimo (processo próprio): lê a resposta num buffer reaproveitado."""
+    buffer = bytearray(CHUNK_SIZE)
+    view = memoryview(buffer)
+    total = 0
+    for i in range(rounds):
+        # Início fora do alinhamento: o primeiro chunk de cada resposta passa pelo recorte (skip)
+        start = (seed * 7919 + i * 3 * CHUNK_SIZE + 12345) % max(1, size - range_size)
+        end = start + range_size - 1 if range_size else ""
+        with socket.create_connection(("127.0.0.1", port)) as sock:
+            sock.sendall((f"GET /{UNIQUE_ID}{MESSAGE_ID}/bench.bin HTTP/1.1\r\nHost: bench\r\n"
+                          f"Range: bytes={start}-{end}\r\nConnection: close\r\n\r\n").encode())
+            while True:
+                n = sock.recv_into(view)
+                if not n:
+                    break
+                total += n
+    return total
+
+
+async def run(size_mb: int, range_mb: float, clients: int, rounds: int) -> None:
+    import Thunder.server.stream_routes as stream_routes
+    import Thunder.utils.custom_dl as custom_dl
+    from Thunder.bot import multi_clients, work_loads
+
+    data = os.urandom(size_mb * CHUNK_SIZE)
+
+    async def get_file_part(client, file_id, offset, limit, precise=False):
+        return data[offset:offset + limit]
+
+    custom_dl.get_file_part = get_file_part
+    multi_clients[0] = FakeClient(len(data))
+    work_loads[0] = 0
+    stream_routes.FILE_INFO_CACHE[MESSAGE_ID] = {
+        "message_id": MESSAGE_ID, "file_size": len(data), "file_name": "bench.bin",
+        "mime_type": "application/octet-stream", "unique_id": UNIQUE_ID, "media_type": "document"}
+
+    app = web.Application()
+    app.add_routes(stream_routes.routes)
+    runner = web.AppRunner(app, access_log=None, handler_cancellation=True)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+
+    loop = asyncio.get_running_loop()
+    range_size = int(range_mb * CHUNK_SIZE)
+    with multiprocessing.Pool(clients) as pool:
+        # Aquece o cache com o arquivo inteiro
+        await loop.run_in_executor(None, pool.apply, fetch, (port, len(data), 0, 1, 0))
+
+        cpu, wall = time.process_time(), time.perf_counter()
+        result = pool.starmap_async(
+            fetch, [(port, len(data), range_size, rounds, seed) for seed in range(clients)])
+        while not result.ready():
+            await asyncio.sleep(0.01)
+        cpu, wall = time.process_time() - cpu, time.perf_counter() - wall
+        total = sum(result.get())
+
+    await runner.cleanup()
+    mib = total / CHUNK_SIZE
+    print(f"{mib:.0f} MiB em {wall:.2f}s | {mib / wall:.0f} MiB/s | CPU do servidor {cpu:.2f}s | "
+          f"{mib / cpu:.0f} MiB/s por núcleo")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size-mb", type=int, default=64)
+    parser.add_argument("--range-mb", type=float, default=0, help="tamanho de cada range (0 = arquivo inteiro)")
+    parser.add_argument("--clients", type=int, default=4)
+    parser.add_argument("--rounds", type=int, default=8)
+    args = parser.parse_args()
+    os.environ.setdefault("CHUNK_CACHE_MB", str(args.size_mb * 2))
+    os.environ.setdefault("BUFFER_BUDGET_MB", "0")
+    asyncio.run(run(args.size_mb, args.range_mb, args.clients, args.rounds))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,14 @@
+# tests/conftest.py
+
+import os
+import sys
+
+# Thunder.vars lê a configuração no import: valores mínimos para carregar os módulos sem .env
+for key, value in {"API_ID": "1", "API_HASH": "test", "BOT_TOKEN": "1:test",
+                   "BIN_CHANNEL": "-100", "DATABASE_URL": "mongodb://localhost"}.items():
+    os.environ.setdefault(key, value)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# stream_routes primeiro: carrega Thunder.bot antes dos utilitários que dependem dele
+import Thunder.server.stream_routes  # noqa: E402,F401
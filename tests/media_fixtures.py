@@ -0,0 +1,115 @@
+# tests/media_fixtures.py
+"""Arquivos de mídia mínimos (só a estrutura que o índice de seek lê), montados em memória."""
+
+import struct
+
+
+# --- MP4 ---
+
+def box(kind: bytes, *children: bytes) -> bytes:
+    payload = b"".join(children)
+    return struct.pack(">I4s", 8 + len(payload), kind) + payload
+
+
+def full_box(kind: bytes, payload: bytes, version: int = 0) -> bytes:
+    return box(kind, bytes([version, 0, 0, 0]), payload)
+
+
+def table(kind: bytes, fmt: str, rows) -> bytes:
+    rows = list(rows)
+    flat = [value for row in rows for value in (row if isinstance(row, tuple) else (row,))]
+    return full_box(kind, struct.pack(f">I{len(flat)}{fmt}", len(rows), *flat))
+
+
+def trak(timescale: int, duration: int, stbl_children, handler: bytes = b"vide", track_id: int = 1) -> bytes:
+    return box(
+        b"trak",
+        full_box(b"tkhd", struct.pack(">III", 0, 0, track_id) + bytes(68)),
+        box(b"mdia",
+            full_box(b"mdhd", struct.pack(">IIII", 0, 0, timescale, duration) + bytes(4)),
+            full_box(b"hdlr", struct.pack(">I4s", 0, handler) + bytes(12)),
+            box(b"minf", box(b"stbl", *stbl_children))))
+
+
+def mvhd(timescale: int, duration: int) -> bytes:
+    return full_box(b"mvhd", struct.pack(">IIII", 0, 0, timescale, duration) + bytes(80))
+
+
+def progressive_mp4() -> bytes:
+    """10 amostras de 1 s em 2 chunks de 5 (100 bytes cada); keyframes nas amostras 1, 4 e 7."""
+    stbl = [
+        table(b"stts", "I", [(10, 1000)]),
+        table(b"stss", "I", [1, 4, 7]),
+        table(b"stsc", "I", [(1, 5, 1)]),
+        full_box(b"stsz", struct.pack(">II", 0, 10) + struct.pack(">10I", *[100] * 10)),
+        table(b"stco", "I", [1000, 6000]),
+    ]
+    audio = trak(48000, 480000, stbl, handler=b"soun", track_id=2)
+    moov = box(b"moov", mvhd(1000, 10000), audio, trak(1000, 10000, stbl))
+    head = box(b"ftyp", b"isom", bytes(4)) + moov
+    return head + box(b"mdat", bytes(7000 - len(head) - 8))
+
+
+def fragmented_mp4(fragment_sizes=(500, 600, 700, 800), fragment_seconds: int = 2) -> bytes:
+    """MP4 fragmentado com sidx: um moof+mdat por fragmento, cada um começando num keyframe."""
+    stbl = [table(b"stts", "I", []), table(b"stsc", "I", []),
+            full_box(b"stsz", struct.pack(">II", 0, 0)), table(b"stco", "I", [])]
+    total = fragment_seconds * len(fragment_sizes)
+    moov = box(b"moov", mvhd(1000, 0), box(b"mvex", full_box(b"mehd", struct.pack(">I", total * 1000))),
+               trak(1000, 0, stbl))
+    refs = b"".join(struct.pack(">III", size, fragment_seconds * 1000, 0x90000000) for size in fragment_sizes)
+    sidx = full_box(b"sidx", struct.pack(">IIIIHH", 1, 1000, 0, 0, 0, len(fragment_sizes)) + refs)
+    fragments = b"".join(box(b"moof", bytes(size - 8)) for size in fragment_sizes)
+    return box(b"ftyp", b"iso5", bytes(4)) + moov + sidx + fragments
+
+
+# --- Matroska ---
+
+def ebml_id(element_id: int) -> bytes:
+    return element_id.to_bytes((element_id.bit_length() + 7) // 8, "big")
+
+
+def element(element_id: int, *children: bytes) -> bytes:
+    payload = b"".join(children)
+    # Tamanho sempre em 8 bytes: as posições do SeekHead não mudam com o conteúdo
+    return ebml_id(element_id) + b"\x01" + len(payload).to_bytes(7, "big") + payload
+
+
+def uint(element_id: int, value: int) -> bytes:
+    return element(element_id, value.to_bytes(max(1, (value.bit_length() + 7) // 8), "big"))
+
+
+def matroska(cues_at_end: bool = True):
+    """Segmento com SeekHead, Info, Tracks (vídeo = trilha 1), um Cluster e Cues.
+
+    Retorna (bytes, início do conteúdo do Segment, posições dos clusters citados nas Cues).
+    """
+    cue_points = [(0, 1, 300), (2000, 1, 9000), (4000, 1, 20000), (1000, 2, 5000)]
+    cues = element(0x1C53BB6B, *(
+        element(0xBB, uint(0xB3, time), element(0xB7, uint(0xF7, track), uint(0xF1, position)))
+        for time, track, position in cue_points))
+    info = element(0x1549A966, uint(0x2AD7B1, 1_000_000), element(0x4489, struct.pack(">d", 6000.0)))
+    tracks = element(0x1654AE6B,
+                     element(0xAE, uint(0xD7, 2), uint(0x83, 2)),
+                     element(0xAE, uint(0xD7, 1), uint(0x83, 1)))
+    cluster = element(0x1F43B675, bytes(2000))
+
+    def seek_head(cues_position: int) -> bytes:
+        return element(0x114D9B74, element(0x4DBB, element(0x53AB, ebml_id(0x1C53BB6B)),
+                                           element(0x53AC, cues_position.to_bytes(4, "big"))))
+
+    if cues_at_end:
+        size = len(seek_head(0))
+        body = seek_head(size + len(info) + len(tracks) + len(cluster)) + info + tracks + cluster + cues
+    else:
+        body = info + tracks + cues + cluster
+    header = element(0x1A45DFA3, uint(0x4286, 1))
+    segment = element(0x18538067, body)
+    segment_start = len(header) + len(segment) - len(body)
+    return header + segment, segment_start
+
+
+def reader(data: bytes):
+    async def read(offset: int, length: int) -> bytes:
+        return data[offset:offset + length]
+    return read
@@ -0,0 +1,214 @@
+# tests/test_buffers.py
+
+import asyncio
+
+import pytest
+
+from Thunder.utils import read_cursor
+from Thunder.utils.buffer_budget import BufferBudget, buffer_budget
+from Thunder.utils.read_cursor import CHUNK_SIZE, ReadCursor, ReadCursors
+
+
+def test_budget_admits_until_limit_then_queues_fifo():
+    async def run():
+        budget = BufferBudget(2 * CHUNK_SIZE)
+        await budget.acquire()
+        await budget.acquire()
+        order = []
+
+        async def waiter(name):
+            await budget.acquire()
+            order.append(name)
+
+        tasks = [asyncio.create_task(waiter(n)) for n in ("first", "second")]
+        await asyncio.sleep(0)
+        assert budget.used == 2 * CHUNK_SIZE and len(budget.waiters) == 2
+        budget.release()
+        await asyncio.sleep(0)
+        assert order == ["first"]
+        budget.release()
+        await asyncio.gather(*tasks)
+        return budget, order
+
+    budget, order = asyncio.run(run())
+    assert order == ["first", "second"]
+    assert budget.used == 2 * CHUNK_SIZE and budget.peak == 2 * CHUNK_SIZE
+    assert budget.waits == 2
+
+
+def test_budget_lets_one_chunk_through_when_empty():
+    async def run():
+        budget = BufferBudget(CHUNK_SIZE // 2)
+        await budget.acquire(CHUNK_SIZE)
+        return budget
+
+    assert asyncio.run(run()).used == CHUNK_SIZE
+
+
+def test_budget_cancelled_waiter_leaves_queue():
+    async def run():
+        budget = BufferBudget(CHUNK_SIZE)
+        await budget.acquire()
+        task = asyncio.create_task(budget.acquire())
+        await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        budget.release()
+        return budget
+
+    budget = asyncio.run(run())
+    assert budget.used == 0 and not budget.waiters
+
+
+def test_budget_admit_times_out():
+    async def run():
+        budget = BufferBudget(CHUNK_SIZE)
+        await budget.acquire()
+        rejected = await budget.admit(0.01)
+        budget.release()
+        admitted = await budget.admit(0.01)
+        return budget, rejected, admitted
+
+    budget, rejected, admitted = asyncio.run(run())
+    assert rejected is False and admitted is True
+    assert budget.rejected == 1 and budget.used == 0
+
+
+def test_disabled_budget_never_waits():
+    async def run():
+        budget = BufferBudget(0)
+        for _ in range(10):
+            await budget.acquire()
+        return budget
+
+    assert asyncio.run(run()).used == 0
+
+
+class FakeReader:
+    """Read-ahead de mentira: entrega chunks cheios a partir de `first`."""
+
+    def __init__(self, first=0, chunks=100):
+        self.next = first
+        self.end = first + chunks
+        self.closed = False
+        self.load = None
+        self.unread = 0
+
+    async def __anext__(self):
+        if self.next >= self.end:
+            raise StopAsyncIteration
+        self.next += 1
+        return b"\0" * CHUNK_SIZE
+
+    async def aclose(self):
+        self.closed = True
+
+
+@pytest.fixture
+def cursors(monkeypatch):
+    previous = buffer_budget.on_pressure
+    monkeypatch.setattr(read_cursor, "read_cursor_stats", dict.fromkeys(read_cursor.read_cursor_stats, 0))
+    yield lambda ttl=10, per_key=4: ReadCursors(ttl, per_key)
+    buffer_budget.on_pressure = previous
+
+
+def cursor_at(index, last_index=None):
+    return ReadCursor(FakeReader(index), index, last_index, 0, None)
+
+
+def test_cursor_resumes_where_it_stopped(cursors):
+    async def run():
+        parked = cursors()
+        cursor = cursor_at(0)
+        await cursor.__anext__()
+        await cursor.__anext__()
+        parked.park(("f", "viewer"), cursor)
+        taken = parked.take(("f", "viewer"), 2 * CHUNK_SIZE + 10, 50 * CHUNK_SIZE)
+        return parked, cursor, taken
+
+    parked, cursor, taken = asyncio.run(run())
+    assert taken is cursor and not parked.cursors
+    assert read_cursor.read_cursor_stats["resumed"] == 1
+
+
+def test_cursor_miss_leaves_cursor_parked(cursors):
+    async def run():
+        parked = cursors()
+        cursor = cursor_at(0)
+        await cursor.__anext__()
+        parked.park(("f", "viewer"), cursor)
+        # Sondagem do fim do arquivo (moov/Cues): não continua o cursor, mas também não o derruba
+        probe = parked.take(("f", "viewer"), 90 * CHUNK_SIZE, 99 * CHUNK_SIZE)
+        resumed = parked.take(("f", "viewer"), CHUNK_SIZE, 50 * CHUNK_SIZE)
+        return probe, resumed, cursor
+
+    probe, resumed, cursor = asyncio.run(run())
+    assert probe is None and resumed is cursor and not cursor.reader.closed
+
+
+def test_cursor_ending_before_request_end_is_not_taken(cursors):
+    async def run():
+        parked = cursors()
+        cursor = cursor_at(0, last_index=9)
+        await cursor.__anext__()
+        parked.park(("f", "viewer"), cursor)
+        return parked.take(("f", "viewer"), CHUNK_SIZE, 20 * CHUNK_SIZE)
+
+    assert asyncio.run(run()) is None
+
+
+def test_cursors_per_key_are_bounded(cursors):
+    async def run():
+        parked = cursors(per_key=2)
+        readers = [cursor_at(i * 10) for i in range(3)]
+        for cursor in readers:
+            parked.park(("f", "proxy"), cursor)
+        await asyncio.sleep(0)
+        return parked, readers
+
+    parked, readers = asyncio.run(run())
+    assert parked.cursors[("f", "proxy")] == readers[1:]
+    assert readers[0].reader.closed
+
+
+def test_cursor_expires_after_ttl(cursors):
+    async def run():
+        parked = cursors(ttl=0.01)
+        cursor = cursor_at(0)
+        parked.park(("f", "viewer"), cursor)
+        await asyncio.sleep(0.05)
+        return parked, cursor
+
+    parked, cursor = asyncio.run(run())
+    assert not parked.cursors and cursor.reader.closed
+    assert read_cursor.read_cursor_stats["expired"] == 1
+
+
+def test_budget_pressure_sheds_oldest_cursor(cursors):
+    async def run():
+        parked = cursors()
+        old, new = cursor_at(0), cursor_at(50)
+        parked.park(("a", "viewer"), old)
+        parked.park(("b", "viewer"), new)
+        buffer_budget.on_pressure()
+        await asyncio.sleep(0)
+        return parked, old, new
+
+    parked, old, new = asyncio.run(run())
+    assert old.reader.closed and not new.reader.closed
+    assert list(parked.cursors) == [("b", "viewer")]
+
+
+def test_cursor_seek_replays_last_chunk(cursors):
+    async def run():
+        cursor = cursor_at(0)
+        first = await cursor.__anext__()
+        await cursor.seek(0)
+        replayed = await cursor.__anext__()
+        await cursor.seek(3)
+        return first, replayed, cursor
+
+    first, replayed, cursor = asyncio.run(run())
+    assert replayed is first
+    assert cursor.next_index == 3
@@ -0,0 +1,172 @@
+# tests/test_caches.py
+
+import asyncio
+import os
+
+import pytest
+
+from Thunder.utils import ttl_cache
+from Thunder.utils.chunk_cache import (DiskChunkCache, ForeignCacheContent, MemoryChunkCache,
+                                       PinnedChunkCache)
+from Thunder.utils.ttl_cache import TTLCache
+
+CHUNK = b"x" * 100
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(ttl_cache, "time", clock)
+    return clock
+
+
+def test_ttl_cache_expires_entries(clock):
+    cache = TTLCache(maxsize=10, ttl=5)
+    cache["a"] = 1
+    cache.set("b", 2, ttl=60)
+    clock.now += 5
+    assert "a" not in cache
+    assert cache["b"] == 2
+    assert cache.expirations == 1
+    with pytest.raises(KeyError):
+        cache["a"]
+
+
+def test_ttl_cache_evicts_oldest_when_full(clock):
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache["a"], cache["b"] = 1, 2
+    cache["a"] = 3  # reinserir renova a idade
+    cache["c"] = 4
+    assert "b" not in cache
+    assert cache["a"] == 3 and cache["c"] == 4
+    assert cache.evictions == 1
+
+
+def test_ttl_cache_purges_expired_on_write(clock):
+    cache = TTLCache(maxsize=100, ttl=1)
+    for i in range(5):
+        cache[i] = i
+    clock.now += 2
+    cache["new"] = 1
+    assert len(cache) == 1
+    assert cache.pop("new") == 1 and cache.pop("new", "gone") == "gone"
+
+
+def test_memory_cache_is_lru():
+    cache = MemoryChunkCache(max_bytes=3 * len(CHUNK))
+    for index in range(3):
+        cache.put("file", index, CHUNK)
+    assert cache.get("file", 0) == CHUNK  # 0 passa a ser o mais recente
+    cache.put("file", 3, CHUNK)
+    assert ("file", 1) not in cache
+    assert all(("file", i) in cache for i in (0, 2, 3))
+    assert cache.total_bytes == 3 * len(CHUNK)
+
+
+def test_memory_cache_ignores_oversized_chunks():
+    cache = MemoryChunkCache(max_bytes=10)
+    cache.put("file", 0, CHUNK)
+    assert ("file", 0) not in cache
+
+
+def test_pinned_cache_keeps_head_and_tail_only():
+    cache = PinnedChunkCache(max_bytes=10 * len(CHUNK), head_chunks=2, tail_chunks=1)
+    assert cache.indexes(10 * 1024 * 1024) == [0, 1, 9]
+    cache.pin("file", 10 * 1024 * 1024)
+    assert cache.put("file", 9, CHUNK)
+    assert not cache.put("file", 5, CHUNK)
+    assert cache.get("file", 9) == CHUNK
+
+
+def disk_cache(path, policy, chunks=3):
+    return DiskChunkCache(str(path), chunks * len(CHUNK), policy)
+
+
+async def fill(cache, keys):
+    for key in keys:
+        await cache._write(key, CHUNK)
+    await asyncio.gather(*cache._tasks)
+
+
+def test_disk_cache_lru_evicts_least_recent(tmp_path):
+    async def run():
+        cache = disk_cache(tmp_path, "lru")
+        await fill(cache, [("AAAA", 0), ("AAAA", 1), ("AAAA", 2)])
+        for _ in range(3):
+            await cache.get("AAAA", 0)
+        await cache.get("AAAA", 1)
+        await fill(cache, [("AAAA", 3)])
+        return cache
+
+    cache = asyncio.run(run())
+    assert ("AAAA", 2) not in cache
+    assert not os.path.exists(cache._chunk_path("AAAA", 2))
+    assert cache.evictions == 1
+
+
+def test_disk_cache_lfu_evicts_least_frequent_then_least_recent(tmp_path):
+    async def run():
+        cache = disk_cache(tmp_path, "lfu")
+        await fill(cache, [("AAAA", 0), ("AAAA", 1), ("AAAA", 2)])
+        for _ in range(3):
+            await cache.get("AAAA", 0)
+        await cache.get("AAAA", 2)
+        await fill(cache, [("AAAA", 3)])  # 1 tem a menor frequência
+        evicted_first = set(cache.entries)
+        await fill(cache, [("AAAA", 4)])  # empate entre 3 e 4 (frequência 1): sai o menos recente
+        return cache, evicted_first
+
+    cache, after_first = asyncio.run(run())
+    assert ("AAAA", 1) not in after_first
+    assert set(cache.entries) == {("AAAA", 0), ("AAAA", 2), ("AAAA", 4)}
+
+
+def test_disk_cache_lfu_victim_matches_full_scan(tmp_path):
+    async def run():
+        cache = disk_cache(tmp_path, "lfu", chunks=1000)
+        await fill(cache, [("BBBB", i) for i in range(50)])
+        for i in range(50):
+            for _ in range(i % 7):
+                await cache.get("BBBB", i)
+        return cache
+
+    cache = asyncio.run(run())
+    for _ in range(20):
+        order = list(cache.entries)
+        expected = min(cache.entries, key=lambda k: (cache.frequency.get(k, 0), order.index(k)))
+        victim = cache._victim()
+        assert victim == expected
+        cache._forget(victim)
+
+
+def test_disk_cache_reload_keeps_chunks_and_clears_leftovers(tmp_path):
+    async def run():
+        cache = disk_cache(tmp_path, "lru")
+        await fill(cache, [("AbCd", 7)])
+        leftover = cache._chunk_path("AbCd", 8) + ".tmp"
+        open(leftover, "wb").close()
+        reloaded = disk_cache(tmp_path, "lru")
+        await reloaded.load()
+        return reloaded, leftover
+
+    cache, leftover = asyncio.run(run())
+    assert list(cache.entries) == [("AbCd", 7)]
+    assert not os.path.exists(leftover)
+
+
+def test_disk_cache_refuses_foreign_directory(tmp_path):
+    (tmp_path / "Thunder" / "utils").mkdir(parents=True)
+    source = tmp_path / "Thunder" / "utils" / "module.py"
+    source.write_text("x = 1\n")
+    cache = disk_cache(tmp_path, "lru")
+    with pytest.raises(ForeignCacheContent):
+        asyncio.run(cache.load())
+    assert source.exists()
@@ -0,0 +1,93 @@
+# tests/test_conditional.py
+
+from email.utils import formatdate
+
+import pytest
+from aiohttp.test_utils import make_mocked_request
+
+from Thunder.server.stream_routes import (client_address, etag_matches, if_range_matches,
+                                          is_not_modified, parse_trusted_proxies)
+import Thunder.server.stream_routes as stream_routes
+
+ETAG = '"abc123"'
+LAST_MODIFIED = 1_700_000_000
+
+
+def request(**headers):
+    return make_mocked_request("GET", "/", headers=headers)
+
+
+def http_date(timestamp):
+    return formatdate(timestamp, usegmt=True)
+
+
+class FakeTransport:
+    def __init__(self, peer):
+        self.peer = peer
+
+    def get_extra_info(self, name, default=None):
+        return (self.peer, 12345) if name == "peername" else default
+
+
+@pytest.mark.parametrize("header, expected", [
+    ('"abc123"', True),
+    ('W/"abc123"', True),
+    ('"other", "abc123"', True),
+    ("*", True),
+    ('"other"', False),
+])
+def test_etag_matches(header, expected):
+    assert etag_matches(header, ETAG) is expected
+
+
+def test_not_modified_by_etag():
+    assert is_not_modified(request(**{"If-None-Match": ETAG}), ETAG, LAST_MODIFIED)
+    assert not is_not_modified(request(**{"If-None-Match": '"old"'}), ETAG, LAST_MODIFIED)
+
+
+def test_if_none_match_takes_precedence_over_if_modified_since():
+    req = request(**{"If-None-Match": '"old"', "If-Modified-Since": http_date(LAST_MODIFIED + 60)})
+    assert not is_not_modified(req, ETAG, LAST_MODIFIED)
+
+
+def test_not_modified_by_date():
+    assert is_not_modified(request(**{"If-Modified-Since": http_date(LAST_MODIFIED)}), ETAG, LAST_MODIFIED)
+    assert not is_not_modified(request(**{"If-Modified-Since": http_date(LAST_MODIFIED - 1)}), ETAG, LAST_MODIFIED)
+    assert not is_not_modified(request(**{"If-Modified-Since": "garbage"}), ETAG, LAST_MODIFIED)
+    assert not is_not_modified(request(**{"If-Modified-Since": http_date(LAST_MODIFIED)}), ETAG, None)
+
+
+def test_no_validators_is_modified():
+    assert not is_not_modified(request(), ETAG, LAST_MODIFIED)
+
+
+@pytest.mark.parametrize("value, expected", [
+    (None, True),
+    (ETAG, True),
+    ('"old"', False),
+    ('W/"abc123"', False),  # If-Range usa comparação forte
+    (http_date(LAST_MODIFIED), True),
+    (http_date(LAST_MODIFIED - 60), False),
+    ("garbage", False),
+])
+def test_if_range_matches(value, expected):
+    req = request() if value is None else request(**{"If-Range": value})
+    assert if_range_matches(req, ETAG, LAST_MODIFIED) is expected
+
+
+def test_if_range_date_without_last_modified():
+    assert not if_range_matches(request(**{"If-Range": http_date(LAST_MODIFIED)}), ETAG, None)
+
+
+def test_client_address_ignores_forwarded_for_from_untrusted_peer(monkeypatch):
+    monkeypatch.setattr(stream_routes, "TRUSTED_PROXIES", [])
+    req = make_mocked_request("GET", "/", headers={"X-Forwarded-For": "9.9.9.9"},
+                              transport=FakeTransport("1.2.3.4"))
+    assert client_address(req) == "1.2.3.4"
+
+
+def test_client_address_behind_trusted_proxies(monkeypatch):
+    monkeypatch.setattr(stream_routes, "TRUSTED_PROXIES", parse_trusted_proxies("10.0.0.0/8, bogus"))
+    req = make_mocked_request("GET", "/", headers={"X-Forwarded-For": "9.9.9.9, 8.8.8.8, 10.2.2.2"},
+                              transport=FakeTransport("10.1.1.1"))
+    assert client_address(req) == "8.8.8.8"
@@ -0,0 +1,39 @@
+# tests/test_hls.py
+
+import asyncio
+
+from Thunder.utils import hls
+from Thunder.utils.seek_index import build_seek_index
+from media_fixtures import fragmented_mp4, reader
+
+
+def fragmented_index():
+    data = fragmented_mp4(fragment_sizes=(500, 600, 700, 800), fragment_seconds=2)
+    return asyncio.run(build_seek_index(reader(data), len(data))), len(data)
+
+
+def test_segments_group_fragments_up_to_target(monkeypatch):
+    monkeypatch.setattr(hls.Var, "HLS_SEGMENT_SECONDS", 4)
+    index, size = fragmented_index()
+    first = index["keyframes"][0][1]
+    assert hls.hls_segments(index, size) == [(4.0, first, 1100), (4.0, first + 1100, 1500)]
+
+
+def test_playlist_byte_ranges(monkeypatch):
+    monkeypatch.setattr(hls.Var, "HLS_SEGMENT_SECONDS", 6)
+    index, size = fragmented_index()
+    first = index["keyframes"][0][1]
+    playlist = hls.build_playlist(index, "/abc123/video.mp4", size).splitlines()
+    assert playlist[:6] == [
+        "#EXTM3U",
+        "#EXT-X-VERSION:7",
+        "#EXT-X-TARGETDURATION:6",
+        "#EXT-X-PLAYLIST-TYPE:VOD",
+        "#EXT-X-INDEPENDENT-SEGMENTS",
+        f'#EXT-X-MAP:URI="/abc123/video.mp4",BYTERANGE="{first}@0"',
+    ]
+    assert playlist[6:] == [
+        "#EXTINF:6.000,", f"#EXT-X-BYTERANGE:1800@{first}", "/abc123/video.mp4",
+        "#EXTINF:2.000,", f"#EXT-X-BYTERANGE:800@{first + 1800}", "/abc123/video.mp4",
+        "#EXT-X-ENDLIST",
+    ]
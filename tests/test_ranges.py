@@ -0,0 +1,105 @@
+# tests/test_ranges.py
+
+import asyncio
+
+import pytest
+from aiohttp import web
+
+from Thunder.server.stream_routes import (CHUNK_SIZE, MAX_RANGE_PARTS, coalesce_ranges,
+                                          group_range_spans, multipart_body,
+                                          multipart_part_header, parse_ranges)
+
+SIZE = 10_000
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("", [(0, SIZE - 1)]),
+    ("bytes=0-99", [(0, 99)]),
+    ("bytes=9000-", [(9000, SIZE - 1)]),
+    ("bytes=-500", [(SIZE - 500, SIZE - 1)]),
+    ("bytes=-20000", [(0, SIZE - 1)]),
+    ("bytes=9990-20000", [(9990, SIZE - 1)]),
+    ("BYTES = 5-9", [(5, 9)]),
+    ("bytes=0-1,  4-5", [(0, 1), (4, 5)]),
+])
+def test_parse_ranges(header, expected):
+    assert parse_ranges(header, SIZE) == expected
+
+
+def test_parse_ranges_coalesces_overlapping_and_adjacent_parts():
+    assert parse_ranges("bytes=50-60,0-9,10-19,55-70", SIZE) == [(0, 19), (50, 70)]
+
+
+def test_parse_ranges_skips_unsatisfiable_parts():
+    assert parse_ranges("bytes=20000-30000,0-9", SIZE) == [(0, 9)]
+
+
+@pytest.mark.parametrize("header", ["bytes=20000-", "bytes=-0", "bytes=500-100"])
+def test_parse_ranges_not_satisfiable(header):
+    with pytest.raises(web.HTTPRequestRangeNotSatisfiable) as info:
+        parse_ranges(header, SIZE)
+    assert info.value.headers["Content-Range"] == f"bytes */{SIZE}"
+
+
+@pytest.mark.parametrize("header", ["items=0-9", "bytes", "bytes=a-b", "bytes=-"])
+def test_parse_ranges_malformed(header):
+    with pytest.raises(web.HTTPBadRequest):
+        parse_ranges(header, SIZE)
+
+
+def test_parse_ranges_too_many_parts_serves_whole_file():
+    specs = ",".join(f"{i * 10}-{i * 10 + 1}" for i in range(MAX_RANGE_PARTS + 1))
+    assert parse_ranges(f"bytes={specs}", SIZE) == [(0, SIZE - 1)]
+
+
+def test_coalesce_ranges():
+    assert coalesce_ranges([(10, 20), (0, 5), (6, 8), (15, 30), (40, 41)]) == [(0, 8), (10, 30), (40, 41)]
+    assert coalesce_ranges([]) == []
+
+
+def test_group_range_spans_joins_parts_in_neighbouring_chunks():
+    ranges = [(0, 10), (CHUNK_SIZE + 5, CHUNK_SIZE + 9), (5 * CHUNK_SIZE, 5 * CHUNK_SIZE + 1)]
+    assert group_range_spans(ranges) == [ranges[:2], ranges[2:]]
+
+
+def collect(gen):
+    async def run():
+        return [bytes(part) async for part in gen]
+    return b"".join(asyncio.run(run()))
+
+
+def test_multipart_body_slices_each_span_once():
+    data = bytes(range(256)) * (3 * CHUNK_SIZE // 256)
+    ranges = [(10, 19), (100, 104), (2 * CHUNK_SIZE + 7, 2 * CHUNK_SIZE + 7)]
+    headers = [multipart_part_header("b", "video/mp4", a, b, len(data)) for a, b in ranges]
+    fetched = []
+
+    async def stream_range(start, end):
+        fetched.append((start, end))
+        # Pedaços que não coincidem com as partes, como chegariam do read-ahead
+        for pos in range(start, end + 1, 7):
+            yield memoryview(data)[pos:min(pos + 7, end + 1)]
+
+    body = collect(multipart_body(ranges, headers, b"--b--\r\n", stream_range))
+    expected = b"".join(h + data[a:b + 1] + b"\r\n" for h, (a, b) in zip(headers, ranges)) + b"--b--\r\n"
+    assert body == expected
+    assert fetched == [(10, 104), (2 * CHUNK_SIZE + 7, 2 * CHUNK_SIZE + 7)]
+
+
+def test_multipart_body_closes_span_generator_on_early_close():
+    closed = []
+
+    async def stream_range(start, end):
+        try:
+            yield b"x" * (end - start + 1)
+        finally:
+            closed.append((start, end))
+
+    async def run():
+        body = multipart_body([(0, 9), (20, 29)], [b"h0", b"h1"], b"end", stream_range)
+        await body.__anext__()
+        await body.__anext__()
+        await body.aclose()
+
+    asyncio.run(run())
+    assert closed == [(0, 29)]
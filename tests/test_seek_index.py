@@ -0,0 +1,62 @@
+# tests/test_seek_index.py
+
+import asyncio
+
+import pytest
+
+from Thunder.utils.seek_index import build_seek_index, keyframe_at, parse_moov
+from media_fixtures import fragmented_mp4, matroska, progressive_mp4, reader
+
+
+def index_of(data: bytes) -> dict:
+    return asyncio.run(build_seek_index(reader(data), len(data)))
+
+
+def test_progressive_mp4_keyframes_from_video_track():
+    index = index_of(progressive_mp4())
+    assert index["container"] == "mp4"
+    assert index["duration"] == 10.0
+    # Amostra 4 = quarta do primeiro chunk (1000 + 3 * 100); amostra 7 = segunda do segundo chunk
+    assert index["keyframes"] == [[0.0, 1000], [3.0, 1300], [6.0, 6100]]
+
+
+def test_parse_moov_without_video_samples():
+    assert parse_moov(b"") is None
+
+
+def test_fragmented_mp4_uses_sidx():
+    data = fragmented_mp4()
+    index = index_of(data)
+    first_moof = len(data) - (500 + 600 + 700 + 800)
+    assert index["fragmented"] is True
+    assert index["duration"] == 8.0
+    assert index["init_size"] == first_moof
+    assert index["media_end"] == len(data)
+    assert index["keyframes"] == [[0.0, first_moof], [2.0, first_moof + 500],
+                                  [4.0, first_moof + 1100], [6.0, first_moof + 1800]]
+
+
+@pytest.mark.parametrize("cues_at_end", [True, False])
+def test_matroska_cues_of_video_track(cues_at_end):
+    data, segment_start = matroska(cues_at_end)
+    index = index_of(data)
+    assert index["container"] == "matroska"
+    assert index["duration"] == 6.0
+    # A cue da trilha de áudio (2) fica de fora; posições contam do início do Segment
+    assert index["keyframes"] == [[0.0, segment_start + 300], [2.0, segment_start + 9000],
+                                  [4.0, segment_start + 20000]]
+
+
+def test_unknown_and_truncated_containers_have_no_index():
+    empty = {"container": None, "duration": None, "keyframes": []}
+    assert index_of(b"not a video file") == empty
+    assert index_of(progressive_mp4()[:200]) == empty
+
+
+def test_keyframe_at():
+    index = {"keyframes": [[0.0, 100], [3.0, 400], [6.0, 900]]}
+    assert keyframe_at(index, 4.5) == ([3.0, 400], [6.0, 900])
+    assert keyframe_at(index, 3.0) == ([3.0, 400], [6.0, 900])
+    assert keyframe_at(index, 99) == ([6.0, 900], None)
+    assert keyframe_at(index, -1) == ([0.0, 100], [3.0, 400])
+    assert keyframe_at({"keyframes": []}, 1) is None